@@ -0,0 +1,142 @@
+"""
+Append-only archive of past reservations (database.json.archive, see queries.archive_reservations).
+The file is a sequence of fixed-size records (device number, user number, start, end; times as
+epoch minutes) and is read through mmap. Every archive run appends one segment sorted by
+(device, start), so the reservations of a device in a time range are found by binary search in
+each segment. Which segments exist and which ids the numbers stand for is kept in database.json.
+"""
+import heapq
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# device number, user number, start, end
+RECORD = struct.Struct("<IIqq")
+
+_MIN = -(2 ** 63)
+
+# a segment as stored in database.json: first record, record count, smallest start, largest end,
+# longest reservation (minutes)
+FIRST, COUNT, MIN_START, MAX_END, MAX_LEN = range(5)
+
+
+def pack_segment(records: Iterable[Tuple[int, int, int, int]]) -> Tuple[bytes, List[int]]:
+    """Encode records (device, user, start, end) as a new segment: (bytes, [first=0, count, ...])."""
+    records = sorted(records, key=itemgetter(0, 2, 3))
+    data = b"".join(RECORD.pack(*rec) for rec in records)
+    if not records:
+        return data, [0, 0, 0, 0, 0]
+    return data, [
+        0,
+        len(records),
+        min(rec[2] for rec in records),
+        max(rec[3] for rec in records),
+        max(rec[3] - rec[2] for rec in records),
+    ]
+
+
+def append_segment(path: Path, first: int, data: bytes) -> None:
+    """
+    Write a segment behind the first `first` records of the file and force it onto the disk.
+    Whatever follows them is cut off: records of a run that crashed before it was recorded.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        os.ftruncate(fd, first * RECORD.size)
+        os.lseek(fd, 0, os.SEEK_END)
+        os.write(fd, data)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class _SegmentKeys(Sequence):
+    """(device, start) of the records of one segment, for bisect."""
+
+    def __init__(self, buf, first: int, count: int) -> None:
+        self._buf = buf
+        self._first = first
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> Tuple[int, int]:
+        device, _, start, _ = RECORD.unpack_from(self._buf, (self._first + i) * RECORD.size)
+        return device, start
+
+
+class ArchiveReader:
+    """Read-only view of the records an archive file holds according to `segments`."""
+
+    def __init__(self, path: Path, segments: List[List[int]]) -> None:
+        self.segments = segments
+        self.size = sum(seg[COUNT] for seg in segments) * RECORD.size
+        # (segment number, device) -> positions of the device's records in the segment
+        self._bounds: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        self._buf = b""
+        if self.size:
+            with open(path, "rb") as f:
+                # raises ValueError if the file is shorter than recorded: records are missing
+                self._buf = mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self.size // RECORD.size
+
+    def span(self) -> Optional[Tuple[int, int]]:
+        """Earliest start and latest end of all records, None if there are none."""
+        segments = [seg for seg in self.segments if seg[COUNT]]
+        if not segments:
+            return None
+        return min(seg[MIN_START] for seg in segments), max(seg[MAX_END] for seg in segments)
+
+    def _range(self, seg_no: int, device: int, lo: Optional[int], hi: Optional[int]) -> Tuple[int, int]:
+        """Positions (within the segment) of the records of the device that may overlap [lo, hi)."""
+        seg = self.segments[seg_no]
+        keys = _SegmentKeys(self._buf, seg[FIRST], seg[COUNT])
+        bounds = self._bounds.get((seg_no, device))
+        if bounds is None:
+            a = bisect_left(keys, (device, _MIN))
+            bounds = self._bounds[seg_no, device] = (a, bisect_left(keys, (device + 1, _MIN), a))
+        a, b = bounds
+        if a < b and lo is not None:
+            # nothing that starts before lo - the longest reservation can still be running at lo
+            a = bisect_left(keys, (device, lo - seg[MAX_LEN]), a, b)
+        if a < b and hi is not None:
+            b = bisect_left(keys, (device, hi), a, b)
+        return a, b
+
+    def _records(self, seg: List[int], a: int, b: int, descending: bool = False) -> Iterator[Tuple[int, int, int, int]]:
+        """Records a .. b-1 of the segment, decoded lazily (a memoryview slice doesn't copy)."""
+        first, size = seg[FIRST], RECORD.size
+        if descending:
+            return (RECORD.unpack_from(self._buf, (first + i) * size) for i in range(b - 1, a - 1, -1))
+        return RECORD.iter_unpack(memoryview(self._buf)[(first + a) * size:(first + b) * size])
+
+    def device_records(
+        self, device: int, lo: Optional[int] = None, hi: Optional[int] = None, descending: bool = False
+    ) -> Iterator[Tuple[int, int, int, int]]:
+        """Records of the device number overlapping [lo, hi) (None: open end), ordered by start."""
+        parts = []
+        for seg_no, seg in enumerate(self.segments):
+            if not seg[COUNT] or (lo is not None and seg[MAX_END] <= lo) or (hi is not None and seg[MIN_START] >= hi):
+                continue
+            a, b = self._range(seg_no, device, lo, hi)
+            if a < b:
+                records = self._records(seg, a, b, descending)
+                if lo is not None:
+                    records = (rec for rec in records if rec[3] > lo)
+                parts.append(records)
+        return heapq.merge(*parts, key=itemgetter(2), reverse=descending)
+
+    def overlaps_any(self, device: int, lo: int, hi: int) -> bool:
+        return next(iter(self.device_records(device, lo, hi)), None) is not None
+
+    def all_records(self) -> Iterator[Tuple[int, int, int, int]]:
+        """Every record, segment by segment (no particular order)."""
+        for seg in self.segments:
+            yield from self._records(seg, 0, seg[COUNT])
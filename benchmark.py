@@ -0,0 +1,333 @@
+"""
+Benchmarks for the hot paths of the data layer on synthetic databases (see generate_data.py).
+
+    python benchmark.py --reservations 100000 --save-baseline bench_baseline.json
+    python benchmark.py --reservations 100000 --baseline bench_baseline.json
+
+Every operation is timed --repeat times; the report lists latency percentiles and the peak
+memory allocated by one run of the operation (tracemalloc). With --baseline the results are
+compared to a stored run and the exit code is 1 if an operation got slower than --tolerance allows.
+Cold loads from database.json and from the binary snapshot are compared in fresh interpreters
+(load time, load plus first index build, growth of the resident memory in KiB).
+Importing the modules of the app is measured as well (fresh interpreter per import); the exit code
+is also 1 if one of them exceeds its IMPORT_BUDGET_MS or opens the database while being imported.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import generate_data
+
+# Import time (ms, p50) allowed per module, on top of streamlit which the runtime has loaded already.
+# Importing must stay cheap: pages are imported on first use while the user waits.
+IMPORT_BUDGET_MS = {
+    "queries": 50,
+    "ui_device": 50,
+    "ui_reservations": 150,
+    "ui_users": 50,
+    "ui_wartungen": 100,
+    "ui_diagnostics": 50,
+}
+
+_IMPORT_PROBE = """
+import json, sys, time
+import streamlit
+t0 = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - t0) * 1000
+queries = sys.modules.get("queries")
+connector = sys.modules.get("database_inheritance")
+opened = (queries is not None and queries._cache["db"] is not None) or (
+    connector is not None and connector.DatabaseConnector.is_connected()
+)
+print(json.dumps({{"ms": elapsed, "opened_db": opened}}))
+"""
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _summary(timings: List[float], peak_kib: float) -> dict:
+    return {
+        "p50_ms": _percentile(timings, 50),
+        "p90_ms": _percentile(timings, 90),
+        "p99_ms": _percentile(timings, 99),
+        "max_ms": max(timings),
+        "peak_kib": peak_kib,
+    }
+
+
+def measure(func: Callable[[], object], repeat: int, setup: Callable[[], object] = None) -> dict:
+    """Latency percentiles (ms) over `repeat` runs and the peak memory (KiB) of one extra run."""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - t0) * 1000)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return _summary(timings, peak / 1024)
+
+
+def bench_queries(workdir: Path, data: dict, repeat: int) -> Dict[str, dict]:
+    import queries
+    import reservations
+
+    queries.DB_PATH = workdir / "database.json"
+    generate_data.write(queries.DB_PATH, generate_data.to_queries_db(data))
+
+    def cold():
+        # forget the in-process snapshot, as in a fresh process
+        queries._cache["key"] = None
+
+    devices = [d["id"] for d in data["devices"]] or ["1"]
+    middle = datetime.fromisoformat(data["reservations"][len(data["reservations"]) // 2]["start"]) if data["reservations"] else datetime(2020, 1, 1)
+    counter = iter(range(10**9))
+
+    def insert():
+        i = next(counter)
+        start = datetime(2100, 1, 1) + timedelta(hours=i)
+        queries.insert_reservation(
+            {"device_id": devices[i % len(devices)], "user_id": "bench@mci.edu",
+             "start": start.isoformat(timespec="minutes"), "end": (start + timedelta(minutes=30)).isoformat(timespec="minutes")}
+        )
+
+    results = {
+        "queries.load (cold)": measure(queries._load_db, repeat, setup=cold),
+        "queries.get_users (cold)": measure(queries.get_users, repeat, setup=cold),
+        "queries.get_devices (cold)": measure(queries.get_devices, repeat, setup=cold),
+        "queries.list_reservations (cold)": measure(queries.list_reservations, repeat, setup=cold),
+        "queries.get_users (warm)": measure(queries.get_users, repeat),
+        "queries.list_reservations (warm)": measure(queries.list_reservations, repeat),
+        "queries.iter_reservations page (warm)": measure(lambda: list(queries.iter_reservations(descending=True, limit=25)), repeat),
+        "reservations.is_device_available (cold)": measure(
+            lambda: reservations.is_device_available(devices[0], middle, middle + timedelta(hours=1)), repeat, setup=cold
+        ),
+        "reservations.is_device_available (warm)": measure(
+            lambda: reservations.is_device_available(devices[0], middle, middle + timedelta(hours=1)), repeat
+        ),
+        "queries.insert_reservation": measure(insert, repeat),
+    }
+    # the timer doesn't fire during the measurement, flush() writes it all afterwards
+    queries.WRITE_BEHIND_INTERVAL = 60.0
+    results["queries.insert_reservation (write-behind)"] = measure(insert, repeat)
+    queries.WRITE_BEHIND_INTERVAL = 0.0
+    queries.flush()
+    queries.compact()
+    return results
+
+
+def bench_models(workdir: Path, data: dict, repeat: int) -> Dict[str, dict]:
+    import queries
+
+    """Serializable / MaintenanceManager on the TinyDB tables; skipped if tinydb is missing."""
+    tiny_path = workdir / "tinydb.json"
+    generate_data.write(tiny_path, generate_data.to_tinydb_db(data))
+    # the TinyDB tables are read through the queries.py snapshot of this path
+    queries.DB_PATH = tiny_path
+    queries._cache["key"] = None
+    try:
+        from wartungen import MaintenanceManager
+        from devices_inheritance import Device
+    except ImportError as e:
+        print(f"Skipping model benchmarks: {e}", file=sys.stderr)
+        return {}
+
+    device_id = data["devices"][-1]["id"] if data["devices"] else "1"
+    return {
+        "Device.find_by_attribute id": measure(lambda: Device.find_by_attribute("id", device_id), repeat),
+        "Device.find_all": measure(Device.find_all, repeat),
+        "MaintenanceManager.find_by_attribute device_id": measure(
+            lambda: MaintenanceManager.find_by_attribute("device_id", device_id), repeat
+        ),
+        "MaintenanceManager.calculate_cost_for_quarter": measure(MaintenanceManager.calculate_cost_for_quarter, repeat),
+    }
+
+
+# peak RSS of this process (KiB); ru_maxrss would include the parent's peak, it survives fork + exec
+_LOAD_PROBE = """
+import json, time
+import queries
+
+def peak_rss():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+
+rss = peak_rss()
+t0 = time.perf_counter()
+queries._load_db()
+t1 = time.perf_counter()
+queries._reservation_index()
+t2 = time.perf_counter()
+print(json.dumps({"load_ms": (t1 - t0) * 1000, "index_ms": (t2 - t1) * 1000, "rss_kib": peak_rss() - rss}))
+"""
+
+
+# moves all but the newest tenth of the reservations into the archive (queries.archive_reservations)
+_ARCHIVE_PREP = """
+import sys
+from datetime import datetime
+import queries
+
+queries.archive_reservations(datetime.fromisoformat(sys.argv[1]))
+queries.compact()
+"""
+
+
+def bench_load_formats(workdir: Path, data: dict, repeat: int) -> Dict[str, dict]:
+    """
+    Cold load from database.json vs. from the binary snapshot (queries.BINARY_SNAPSHOT) vs. with
+    the older reservations archived (queries.archive_reservations), each in a fresh interpreter.
+    """
+    db = generate_data.to_queries_db(data)
+    here = Path(__file__).parent
+    paths = {label: workdir / f"formats-{label}.json" for label in ("json", "snapshot", "archive")}
+    for path in paths.values():
+        generate_data.write(path, db)
+    ends = sorted(r["end"] for r in db["reservations"])
+    if ends:
+        env = {**os.environ, "CASE_STUDY_DB_PATH": str(paths["archive"]), "CASE_STUDY_WRITE_BEHIND": ""}
+        cutoff = ends[len(ends) * 9 // 10]
+        subprocess.run([sys.executable, "-c", _ARCHIVE_PREP, cutoff], cwd=here, env=env, check=True)
+
+    def probe(label: str) -> dict:
+        env = {
+            **os.environ,
+            "CASE_STUDY_DB_PATH": str(paths[label]),
+            "CASE_STUDY_BINARY_SNAPSHOT": "1" if label == "snapshot" else "",
+            "CASE_STUDY_WRITE_BEHIND": "",
+        }
+        out = subprocess.run([sys.executable, "-c", _LOAD_PROBE], cwd=here, env=env, capture_output=True, text=True, check=True)
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+    results = {}
+    for label in paths:
+        if label == "snapshot":
+            # the first load finds no snapshot and writes it
+            probe(label)
+        runs = [probe(label) for _ in range(repeat)]
+        rss = max(r["rss_kib"] for r in runs)
+        results[f"cold load ({label})"] = _summary([r["load_ms"] for r in runs], rss)
+        results[f"cold load + index ({label})"] = _summary([r["load_ms"] + r["index_ms"] for r in runs], rss)
+    return results
+
+
+def bench_imports(workdir: Path, data: dict, repeat: int) -> Dict[str, dict]:
+    """Cold import time of the app modules, each in a fresh interpreter against a synthetic database."""
+    db_path = workdir / "imports.json"
+    generate_data.write(db_path, generate_data.to_queries_db(data))
+    env = {**os.environ, "CASE_STUDY_DB_PATH": str(db_path)}
+    here = Path(__file__).parent
+
+    results = {}
+    for module in IMPORT_BUDGET_MS:
+        timings, opened = [], False
+        for _ in range(repeat):
+            out = subprocess.run(
+                [sys.executable, "-c", _IMPORT_PROBE.format(module=module)],
+                cwd=here, env=env, capture_output=True, text=True, check=True,
+            )
+            probe = json.loads(out.stdout.strip().splitlines()[-1])
+            timings.append(probe["ms"])
+            opened = opened or probe["opened_db"]
+        results[f"import {module}"] = {**_summary(timings, 0.0), "opened_db": opened}
+    return results
+
+
+def over_budget(results: Dict[str, dict]) -> List[str]:
+    """Imports slower than IMPORT_BUDGET_MS or opening the database."""
+    failed = []
+    for module, budget in IMPORT_BUDGET_MS.items():
+        res = results.get(f"import {module}")
+        if res is not None and (res["p50_ms"] > budget or res["opened_db"]):
+            failed.append(f"import {module}")
+    return failed
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float, min_delta_ms: float) -> List[str]:
+    """
+    Names of operations whose p50 latency exceeds the baseline by more than `tolerance`
+    (and by at least min_delta_ms, so timer noise on microsecond operations doesn't count).
+    """
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = res["p50_ms"] / base["p50_ms"] if base["p50_ms"] else float("inf")
+        res["baseline_ratio"] = ratio
+        if ratio > tolerance and res["p50_ms"] - base["p50_ms"] >= min_delta_ms:
+            regressions.append(name)
+    return regressions
+
+
+def print_report(results: Dict[str, dict]) -> None:
+    print(f"{'operation':50} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'peak KiB':>10} {'vs base':>8}")
+    for name, res in results.items():
+        ratio = f"{res['baseline_ratio']:.2f}x" if "baseline_ratio" in res else ""
+        print(f"{name:50} {res['p50_ms']:10.3f} {res['p90_ms']:10.3f} {res['p99_ms']:10.3f} {res['peak_kib']:10.1f} {ratio:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--reservations", type=int, default=100_000)
+    parser.add_argument("--maintenances", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--baseline", type=Path, help="compare against this stored run")
+    parser.add_argument("--save-baseline", type=Path, help="store this run as baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed p50 slowdown factor against the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=0.1, help="ignore slowdowns smaller than this")
+    parser.add_argument("--load-repeat", type=int, default=3, help="fresh interpreters per measured cold load (0 = skip)")
+    parser.add_argument("--import-repeat", type=int, default=3, help="fresh interpreters per measured import (0 = skip)")
+    args = parser.parse_args()
+
+    data = generate_data.generate(args.users, args.devices, args.reservations, args.maintenances, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        results = bench_queries(workdir, data, args.repeat)
+        results.update(bench_models(workdir, data, args.repeat))
+        if args.load_repeat:
+            results.update(bench_load_formats(workdir, data, args.load_repeat))
+        if args.import_repeat:
+            results.update(bench_imports(workdir, data, args.import_repeat))
+
+    regressions = []
+    if args.baseline:
+        regressions = compare(
+            results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance, args.min_delta_ms
+        )
+    print_report(results)
+
+    import resource
+    print(f"max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    failed_imports = over_budget(results)
+    if failed_imports:
+        print("Over import budget: " + ", ".join(failed_imports))
+    if regressions:
+        print("Regressions: " + ", ".join(regressions))
+    if regressions or failed_imports:
+        sys.exit(1)
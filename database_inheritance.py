@@ -1,28 +1,117 @@
-import os
+import threading
 from tinydb import TinyDB
 from tinydb.table import Table
-from tinydb.storages import JSONStorage
+from tinydb.storages import Storage
 from datetime import datetime, date, time
-from tinydb_serialization import Serializer, SerializationMiddleware
+from tinydb_serialization import Serializer
 from tinydb_serialization.serializers import DateTimeSerializer
 
+import queries
+
 class DatabaseConnector:
     """
     Usage: DatabaseConnector().get_table(<table_name>)
     The information about the actual database file path and the serializer objects has been abstracted away into this class
+    All tables share one TinyDB instance whose storage is the snapshot queries.py keeps of database.json,
+    so the models and queries.py parse the file once and write it through the same journal.
+    Writes are collected by the write-behind of queries.py (flushed at exit as well):
+    WRITE_CACHE_SIZE and FLUSH_INTERVAL, if set before the first connection, become its
+    WRITE_BEHIND_MAX_PENDING and WRITE_BEHIND_INTERVAL. None keeps the settings of queries.py.
     """
-    # Turns the class into a naive singleton
-    # --> not thread safe and doesn't handle inheritance particularly well
+    WRITE_CACHE_SIZE = None
+    FLUSH_INTERVAL = None
+
+    # Thread safe singleton (double checked locking)
     __instance = None
+    __lock = threading.Lock()
     def __new__(cls):
         if cls.__instance is None:
-            cls.__instance = super().__new__(cls)
-            cls.__instance.path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database.json')
+            with cls.__lock:
+                if cls.__instance is None:
+                    if cls.WRITE_CACHE_SIZE is not None:
+                        queries.WRITE_BEHIND_MAX_PENDING = cls.WRITE_CACHE_SIZE
+                    if cls.FLUSH_INTERVAL is not None:
+                        queries.WRITE_BEHIND_INTERVAL = cls.FLUSH_INTERVAL
+                    instance = super().__new__(cls)
+                    instance.db = TinyDB(storage=SharedStorage)
+                    instance.storage = instance.db.storage
+                    instance.tables = {}
+                    cls.__instance = instance
 
         return cls.__instance
     
     def get_table(self, table_name: str) -> Table:
-        return TinyDB(self.__instance.path, storage=serializer).table(table_name)
+        with self.__lock:
+            if table_name not in self.tables:
+                # no query cache: queries.py changes the tables as well (e.g. deleting a device
+                # deletes its maintenances), TinyDB would not notice and serve stale results
+                self.tables[table_name] = self.db.table(table_name, cache_size=0)
+            return self.tables[table_name]
+
+    def flush(self) -> None:
+        """Force written changes onto the disk right away"""
+        queries.sync()
+
+    @classmethod
+    def is_connected(cls) -> bool:
+        """Whether the database has been opened in this process"""
+        return cls.__instance is not None
+
+
+class LazyTable:
+    """
+    Descriptor for the `db_connector` class attribute of the models: the table (and with it the
+    database) is opened on first access instead of when the class is defined, so importing a
+    model or a page that uses one doesn't touch the database file.
+    """
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+        self._table = None
+
+    def __get__(self, obj, owner=None) -> Table:
+        if self._table is None:
+            self._table = DatabaseConnector().get_table(self.table_name)
+        return self._table
+
+
+class SharedStorage(Storage):
+    """
+    TinyDB storage on top of queries.read_tables / write_tables.
+    Reads hand out the decoded tables, cached until the snapshot changes. TinyDB writes back all
+    tables but replaces only the dict of the table it changed, so only those are encoded and
+    passed on; queries.py journals the documents that actually differ.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._tables = None
+        # table name -> the dict handed out by read(), to recognize the tables TinyDB replaced
+        self._handed_out = {}
+
+    def read(self):
+        with self._lock:
+            version, stored = queries.read_tables()
+            if self._tables is None or version != self._version:
+                self._tables = {name: _decode(table) for name, table in stored.items()}
+                self._handed_out = dict(self._tables)
+                self._version = version
+            return self._tables
+
+    def write(self, data):
+        with self._lock:
+            changed = {name: table for name, table in data.items() if table is not self._handed_out.get(name)}
+            try:
+                queries.write_tables({name: _encode(table) for name, table in changed.items()})
+            except BaseException:
+                # TinyDB may have changed documents of the cached tables in place already
+                self._tables = None
+                raise
+            self._tables = data
+            self._handed_out.update(changed)
+            self._version = queries.read_tables()[0]
+
+    def close(self):
+        pass
 
 #%%
 
@@ -46,10 +135,38 @@ class TimeSerializer(Serializer):
     def decode(self, s):
         return time.fromisoformat(s)
 
-serializer = SerializationMiddleware(JSONStorage)
-serializer.register_serializer(DateTimeSerializer(), 'TinyDateTime')
-serializer.register_serializer(DateSerializer(), 'TinyDate')
-serializer.register_serializer(TimeSerializer(), 'TinyTime')
+# tag -> serializer; datetime before date, datetimes are dates as well
+SERIALIZERS = {
+    'TinyDateTime': DateTimeSerializer(),
+    'TinyDate': DateSerializer(),
+    'TinyTime': TimeSerializer(),
+}
+
+
+def _encode(value):
+    """Copy of value with dates and times replaced by their tagged strings (like SerializationMiddleware)"""
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    for name, serializer in SERIALIZERS.items():
+        if isinstance(value, serializer.OBJ_CLASS):
+            return '{%s}:%s' % (name, serializer.encode(value))
+    return value
+
+
+def _decode(value):
+    """Inverse of _encode, again as a copy: the stored documents stay untouched"""
+    if isinstance(value, dict):
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if isinstance(value, str) and value.startswith('{'):
+        for name, serializer in SERIALIZERS.items():
+            tag = '{%s}:' % name
+            if value.startswith(tag):
+                return serializer.decode(value[len(tag):])
+    return value
 
 
 #%%
@@ -2,11 +2,13 @@ from typing import Self
 from datetime import datetime
 
 from serializable import Serializable
-from database_inheritance import DatabaseConnector
+from database_inheritance import LazyTable
 
 class Device(Serializable):
+    __slots__ = ("managed_by_user_id", "is_active", "end_of_life")
 
-    db_connector =  DatabaseConnector().get_table("devices")
+    db_connector = LazyTable("devices")
+    indexed_attributes = ("id", "managed_by_user_id")
 
     def __init__(self, id: str, managed_by_user_id: str, end_of_life: datetime = None, creation_date: datetime = None, last_update: datetime = None):
         super().__init__(id, creation_date, last_update)
@@ -0,0 +1,152 @@
+"""
+Opt-in timing and counters for the hot paths (data layer, persistence, page rendering).
+Enable with CASE_STUDY_DIAGNOSTICS=1 or on the "Diagnostics" page; while disabled the
+instrumented functions only pay for one flag check.
+
+Measurements are grouped per Streamlit rerun: main.py calls start_rerun() before rendering a page,
+everything measured in that script thread until the next start_rerun() belongs to that rerun.
+"""
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+ENABLED = os.environ.get("CASE_STUDY_DIAGNOSTICS") == "1"
+
+# finished reruns, newest last
+HISTORY_SIZE = 200
+_history: deque = deque(maxlen=HISTORY_SIZE)
+_history_lock = threading.Lock()
+_counter = 0
+
+# the rerun measured by the current thread (every rerun runs in its own script thread)
+_local = threading.local()
+# measurements made outside of any rerun (background flush threads, scripts)
+_background: dict = {"rerun": 0, "page": "(background)", "started": time.time(), "thread": "", "ops": {}}
+
+
+def _new_op() -> dict:
+    return {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "bytes_read": 0, "bytes_written": 0}
+
+
+def _current() -> dict:
+    return getattr(_local, "rerun", None) or _background
+
+
+def start_rerun(page: str) -> None:
+    """Close the rerun measured so far by this thread and start a new one for `page`."""
+    global _counter
+    finish_rerun()
+    if not ENABLED:
+        return
+    with _history_lock:
+        _counter += 1
+        number = _counter
+    _local.rerun = {"rerun": number, "page": page, "started": time.time(), "thread": threading.current_thread().name, "ops": {}}
+
+
+def finish_rerun() -> None:
+    rerun = getattr(_local, "rerun", None)
+    if rerun is not None:
+        _local.rerun = None
+        with _history_lock:
+            _history.append(rerun)
+
+
+def record(name: str, elapsed_ms: float = 0.0, bytes_read: int = 0, bytes_written: int = 0, calls: int = 1) -> None:
+    if not ENABLED:
+        return
+    ops = _current()["ops"]
+    op = ops.get(name)
+    if op is None:
+        op = ops[name] = _new_op()
+    op["calls"] += calls
+    op["total_ms"] += elapsed_ms
+    op["max_ms"] = max(op["max_ms"], elapsed_ms)
+    op["bytes_read"] += bytes_read
+    op["bytes_written"] += bytes_written
+
+
+def count_bytes(name: str, read: int = 0, written: int = 0) -> None:
+    """Attribute I/O volume to `name` without counting a call."""
+    record(name, bytes_read=read, bytes_written=written, calls=0)
+
+
+def timed(name: str) -> Callable:
+    """Decorator: count calls and measure the wall time of the function under `name`.
+
+    For generator functions the time spent producing the items is measured, not just the call.
+    """
+    def decorator(func: Callable) -> Callable:
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator(*args, **kwargs):
+                if not ENABLED:
+                    return (yield from func(*args, **kwargs))
+                elapsed = 0.0
+                it = func(*args, **kwargs)
+                try:
+                    while True:
+                        t0 = time.perf_counter()
+                        try:
+                            item = next(it)
+                        except StopIteration as stop:
+                            return stop.value
+                        finally:
+                            elapsed += time.perf_counter() - t0
+                        yield item
+                finally:
+                    it.close()
+                    record(name, elapsed * 1000)
+
+            return generator
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, (time.perf_counter() - t0) * 1000)
+
+        return wrapper
+
+    return decorator
+
+
+def history() -> List[dict]:
+    """Finished reruns (oldest first) followed by the background measurements."""
+    with _history_lock:
+        reruns = list(_history)
+    return reruns + ([_background] if _background["ops"] else [])
+
+
+def summary(reruns: Optional[List[dict]] = None) -> Dict[str, dict]:
+    """Per operation totals over the given reruns (default: all recorded)."""
+    total: Dict[str, dict] = {}
+    for rerun in history() if reruns is None else reruns:
+        for name, op in rerun["ops"].items():
+            agg = total.setdefault(name, _new_op())
+            agg["calls"] += op["calls"]
+            agg["total_ms"] += op["total_ms"]
+            agg["max_ms"] = max(agg["max_ms"], op["max_ms"])
+            agg["bytes_read"] += op["bytes_read"]
+            agg["bytes_written"] += op["bytes_written"]
+    return total
+
+
+def export_jsonl() -> str:
+    """One JSON object per rerun."""
+    return "".join(json.dumps(rerun, ensure_ascii=False) + "\n" for rerun in history())
+
+
+def reset() -> None:
+    with _history_lock:
+        _history.clear()
+    _background["ops"] = {}
@@ -0,0 +1,52 @@
+"""
+Reservation times as integer minutes since 1970-01-01.
+The data layer parses the stored ISO strings once into these and compares plain ints afterwards;
+the files keep the ISO format. Times are wall clock like the stored strings (offsets are ignored),
+reservations are stored with minute precision.
+"""
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Any, Optional
+
+_EPOCH_DAY = datetime(1970, 1, 1).toordinal()
+_MINUTE = timedelta(minutes=1)
+
+
+def to_minutes(dt: datetime) -> int:
+    """Minutes since the epoch, seconds are cut off."""
+    return (dt.toordinal() - _EPOCH_DAY) * 1440 + dt.hour * 60 + dt.minute
+
+
+def to_minutes_ceil(dt: datetime) -> int:
+    """Minutes since the epoch, rounded up to the next full minute."""
+    return to_minutes(dt) + (1 if dt.second or dt.microsecond else 0)
+
+
+def from_minutes(minutes: int) -> datetime:
+    return datetime.fromordinal(_EPOCH_DAY) + minutes * _MINUTE
+
+
+@lru_cache(maxsize=4096)
+def _iso_day(day: int) -> str:
+    return date.fromordinal(_EPOCH_DAY + day).isoformat()
+
+
+def format_minutes(minutes: int) -> str:
+    """The ISO string reservations are stored with, e.g. "2024-05-01T09:30"; like
+    from_minutes(minutes).isoformat(timespec="minutes"), but without building a datetime."""
+    day, minute = divmod(minutes, 1440)
+    hour, minute = divmod(minute, 60)
+    return f"{_iso_day(day)}T{hour:02d}:{minute:02d}"
+
+
+def duration_minutes(duration: timedelta) -> int:
+    """Length in whole minutes, rounded up."""
+    return -(-duration // _MINUTE)
+
+
+def parse_minutes(value: Any) -> Optional[int]:
+    """ISO string -> minutes since the epoch, None if it isn't a valid timestamp."""
+    try:
+        return to_minutes(datetime.fromisoformat(value))
+    except (TypeError, ValueError):
+        return None
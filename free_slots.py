@@ -0,0 +1,100 @@
+"""
+Earliest free window of a given length inside working hours.
+The backends pass the busy intervals of each device as (start, end) pairs of epoch minutes
+(see epoch_minutes) sorted by start; they are walked once instead of trying times until the
+overlap check passes.
+"""
+import heapq
+from datetime import datetime, time, timedelta
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+from epoch_minutes import duration_minutes, from_minutes, to_minutes
+
+WORK_DAY_START = time(8, 0)
+WORK_DAY_END = time(18, 0)
+# Monday .. Friday (datetime.weekday())
+WORK_DAYS = (0, 1, 2, 3, 4)
+
+INVALID_WORKDAYS_MESSAGE = "Arbeitstage müssen Wochentage 0 (Montag) bis 6 (Sonntag) sein"
+
+
+def check_workdays(workdays: Sequence[int]) -> None:
+    """ValueError unless workdays names at least one weekday and nothing else (the search for a
+    working day would never end otherwise)."""
+    days = list(workdays)
+    if not days or any(not isinstance(d, int) or isinstance(d, bool) or not 0 <= d <= 6 for d in days):
+        raise ValueError(INVALID_WORKDAYS_MESSAGE)
+
+
+def _align(t: datetime, duration: timedelta, work_start: time, work_end: time, workdays: Sequence[int]) -> datetime:
+    """Earliest t' >= t such that [t', t' + duration) lies within the working hours of one day."""
+    while True:
+        day = t.date()
+        if t.weekday() in workdays:
+            day_start = datetime.combine(day, work_start, tzinfo=t.tzinfo)
+            if t < day_start:
+                t = day_start
+            if t + duration <= datetime.combine(day, work_end, tzinfo=t.tzinfo):
+                return t
+        t = datetime.combine(day + timedelta(days=1), work_start, tzinfo=t.tzinfo)
+
+
+def _candidates(busy: Iterable[Tuple[int, int]], after: datetime, duration: timedelta,
+                work_start: time, work_end: time, workdays: Sequence[int]) -> Iterator[Tuple[datetime, bool]]:
+    """
+    Increasing lower bounds for the earliest free start of one device; the last one
+    (flagged True) is the answer. Every busy interval is looked at once.
+    """
+    length = duration_minutes(duration)
+    t = _align(after, duration, work_start, work_end, workdays)
+    t_min = to_minutes(t)
+    for start, end in busy:
+        if end <= t_min:
+            continue
+        if start >= t_min + length:
+            # sorted by start: nothing left can overlap [t, t + duration)
+            break
+        t = _align(from_minutes(end).replace(tzinfo=t.tzinfo), duration, work_start, work_end, workdays)
+        t_min = to_minutes(t)
+        yield t, False
+    yield t, True
+
+
+def earliest_slot(
+    busy_by_device: Dict[str, Iterable[Tuple[int, int]]],
+    after: datetime,
+    duration: timedelta,
+    work_start: time = WORK_DAY_START,
+    work_end: time = WORK_DAY_END,
+    workdays: Sequence[int] = WORK_DAYS,
+) -> Optional[Tuple[str, datetime]]:
+    """
+    (device_id, start) of the earliest window of `duration` at or after `after` on any of the devices,
+    or None if there is no device or the window doesn't fit into a working day.
+    All devices are advanced together through a heap ordered by their current lower bound,
+    so a device is only scanned as far as needed.
+    """
+    if duration <= timedelta(0):
+        raise ValueError("Dauer muss positiv sein")
+    check_workdays(workdays)
+    if datetime.combine(after.date(), work_start) + duration > datetime.combine(after.date(), work_end):
+        return None
+
+    if after.second or after.microsecond:
+        # reservations are stored with minute precision
+        after = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+
+    heap = []
+    for order, (device_id, busy) in enumerate(busy_by_device.items()):
+        candidates = _candidates(busy, after, duration, work_start, work_end, workdays)
+        t, final = next(candidates)
+        heap.append((t, order, final, device_id, candidates))
+    heapq.heapify(heap)
+
+    while heap:
+        t, order, final, device_id, candidates = heapq.heappop(heap)
+        if final:
+            return device_id, t
+        t, final = next(candidates)
+        heapq.heappush(heap, (t, order, final, device_id, candidates))
+    return None
@@ -0,0 +1,156 @@
+"""
+Reproducible synthetic databases for benchmarks and load tests.
+
+    python generate_data.py --users 10000 --devices 2000 --reservations 1000000 --maintenances 2000 --out big.json
+
+writes the queries.py layout (users/devices/reservations plus the TinyDB "maintenances" table, like
+database.json) to --out and, with --tinydb-out, a second file that additionally holds the TinyDB
+tables of the Serializable models (users/devices keyed by doc id, stored next to the queries.py
+data under queries.TABLE_KEY_PREFIX, as the app keeps them).
+The same --seed always gives the same data.
+"""
+import argparse
+import heapq
+import json
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+import queries
+
+START = datetime(2020, 1, 1)
+
+
+def _tiny_datetime(dt: datetime) -> str:
+    # how tinydb_serialization's DateTimeSerializer stores datetimes
+    return "{TinyDateTime}:" + dt.isoformat()
+
+
+def generate(users: int = 100, devices: int = 20, reservations: int = 1000, maintenances: int = 20, seed: int = 42) -> dict:
+    """
+    Plain data for all generators below: lists of users, devices, reservations (ordered by start,
+    never overlapping on one device, as if booked through the UI) and maintenance plans.
+    """
+    rnd = random.Random(seed)
+
+    user_list = [{"id": f"user{i}@mci.edu", "name": f"User {i}"} for i in range(users)]
+    device_list = [
+        {
+            "id": str(i + 1),
+            "device_name": f"Gerät {i + 1}",
+            "managed_by_user_id": user_list[rnd.randrange(users)]["id"] if users else "",
+            "is_active": rnd.random() > 0.1,
+        }
+        for i in range(devices)
+    ]
+
+    # each device books its share back to back with random gaps, then all are merged by start
+    per_device: List[List[tuple]] = []
+    for d in range(devices):
+        count = reservations // devices + (1 if d < reservations % devices else 0)
+        t = START + timedelta(minutes=15 * rnd.randrange(96))
+        slots = []
+        for _ in range(count):
+            t += timedelta(minutes=15 * rnd.randrange(0, 96))
+            end = t + timedelta(minutes=15 * rnd.randrange(1, 33))
+            slots.append((t, end, d))
+            t = end
+        per_device.append(slots)
+
+    reservation_list = [
+        {
+            "device_id": device_list[d]["id"],
+            "user_id": user_list[rnd.randrange(users)]["id"] if users else "",
+            "start": start.isoformat(timespec="minutes"),
+            "end": end.isoformat(timespec="minutes"),
+        }
+        for start, end, d in heapq.merge(*per_device)
+    ]
+
+    maintenance_list = []
+    for i in range(min(maintenances, devices) if devices else 0):
+        first = START + timedelta(days=rnd.randrange(365))
+        maintenance_list.append(
+            {
+                "id": device_list[i]["id"],
+                "device_id": device_list[i]["id"],
+                "first_maintenance": first,
+                "maintenance_interval_days": rnd.choice([1, 7, 14, 30, 90, 180, 365]),
+                "maintenance_cost": float(rnd.randrange(20, 2000)),
+                "end_of_life": first + timedelta(days=rnd.randrange(365, 3650)),
+                "creation_date": first,
+                "last_update": first,
+            }
+        )
+
+    return {"users": user_list, "devices": device_list, "reservations": reservation_list, "maintenances": maintenance_list}
+
+
+def _tinydb_table(docs: List[dict]) -> Dict[str, dict]:
+    return {
+        str(i + 1): {k: _tiny_datetime(v) if isinstance(v, datetime) else v for k, v in doc.items()}
+        for i, doc in enumerate(docs)
+    }
+
+
+def to_queries_db(data: dict) -> dict:
+    """The database.json layout read by queries.py (current schema version)."""
+    return {
+        "schema_version": queries.SCHEMA_VERSION,
+        "users": {u["id"]: {"name": u["name"]} for u in data["users"]},
+        "devices": {
+            d["id"]: {"device_name": d["device_name"], "managed_by_user_id": d["managed_by_user_id"], "is_active": d["is_active"]}
+            for d in data["devices"]
+        },
+        "reservations": data["reservations"],
+        "journal_seq": 0,
+        "maintenances": _tinydb_table(data["maintenances"]),
+    }
+
+
+def to_tinydb_db(data: dict) -> dict:
+    """to_queries_db plus the tables of the Serializable models (users_inheritance, devices_inheritance)."""
+    created = _tiny_datetime(START)
+    return {
+        **to_queries_db(data),
+        queries.TABLE_KEY_PREFIX + "users": {
+            str(i + 1): {"id": u["id"], "creation_date": created, "last_update": created, "name": u["name"]}
+            for i, u in enumerate(data["users"])
+        },
+        queries.TABLE_KEY_PREFIX + "devices": {
+            str(i + 1): {
+                "id": d["id"],
+                "creation_date": created,
+                "last_update": created,
+                "managed_by_user_id": d["managed_by_user_id"],
+                "is_active": d["is_active"],
+                "end_of_life": "{TinyDate}:2030-12-31",
+            }
+            for i, d in enumerate(data["devices"])
+        },
+    }
+
+
+def write(path: Path, db: dict) -> None:
+    # same formatting as queries._save_db, so load benchmarks parse realistic files
+    Path(path).write_text(json.dumps(db, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--devices", type=int, default=2_000)
+    parser.add_argument("--reservations", type=int, default=1_000_000)
+    parser.add_argument("--maintenances", type=int, default=2_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", type=Path, default=Path("database_generated.json"))
+    parser.add_argument("--tinydb-out", type=Path, default=None)
+    args = parser.parse_args()
+
+    data = generate(args.users, args.devices, args.reservations, args.maintenances, args.seed)
+    write(args.out, to_queries_db(data))
+    print(f"Wrote {args.out}")
+    if args.tinydb_out:
+        write(args.tinydb_out, to_tinydb_db(data))
+        print(f"Wrote {args.tinydb_out}")
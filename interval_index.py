@@ -0,0 +1,94 @@
+from bisect import bisect_left, bisect_right, insort
+from operator import itemgetter
+from typing import Any, Iterable, Iterator, List, Tuple
+
+_start_of = itemgetter(0)
+
+
+class IntervalIndex:
+    """
+    Half-open intervals [start, end) of one device, kept sorted for overlap queries.
+    Start/end can be anything orderable that supports subtraction (datetimes, ints, ...).
+    """
+
+    def __init__(self) -> None:
+        # (start, end, payload) sorted by start
+        self._by_start: List[Tuple[Any, Any, Any]] = []
+        # all end values, sorted on their own
+        self._ends: List[Any] = []
+        # upper bound for the length of any interval ever added
+        self._max_len = None
+
+    @classmethod
+    def from_intervals(cls, items: Iterable[Tuple[Any, Any, Any]]) -> "IntervalIndex":
+        """Build from (start, end, payload) triples with one sort instead of one insort per interval."""
+        index = cls()
+        index._by_start = sorted(items, key=_start_of)
+        index._ends = sorted(end for _, end, _ in index._by_start)
+        if index._by_start:
+            index._max_len = max(end - start for start, end, _ in index._by_start)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._by_start)
+
+    def __iter__(self) -> Iterator[Tuple[Any, Any, Any]]:
+        return iter(self._by_start)
+
+    def add(self, start, end, payload=None) -> None:
+        insort(self._by_start, (start, end, payload), key=_start_of)
+        insort(self._ends, end)
+        length = end - start
+        if self._max_len is None or length > self._max_len:
+            self._max_len = length
+
+    def remove(self, start, end, payload=None) -> bool:
+        lo = bisect_left(self._by_start, start, key=_start_of)
+        hi = bisect_right(self._by_start, start, key=_start_of)
+        for i in range(lo, hi):
+            s, e, p = self._by_start[i]
+            if e == end and p is payload:
+                del self._by_start[i]
+                del self._ends[bisect_left(self._ends, end)]
+                return True
+        return False
+
+    def overlaps_any(self, start, end) -> bool:
+        """O(log n): intervals starting before `end` minus those already over at `start`."""
+        return bisect_left(self._by_start, end, key=_start_of) - bisect_right(self._ends, start) > 0
+
+    def overlapping(self, start, end) -> List[Tuple[Any, Any, Any]]:
+        """All intervals overlapping [start, end), O(log n + k)."""
+        if not self._by_start:
+            return []
+        # nothing that starts before start - max_len can still be running at start
+        lo = bisect_right(self._by_start, start - self._max_len, key=_start_of)
+        hi = bisect_left(self._by_start, end, key=_start_of)
+        return [item for item in self._by_start[lo:hi] if item[1] > start]
+
+    def _range_bounds(self, start, end) -> Tuple[int, int]:
+        """Positions in _by_start of the intervals that may overlap [start, end) (None = open bound)."""
+        lo, hi = 0, len(self._by_start)
+        if start is not None and self._by_start:
+            lo = bisect_right(self._by_start, start - self._max_len, key=_start_of)
+        if end is not None:
+            hi = bisect_left(self._by_start, end, key=_start_of)
+        return lo, hi
+
+    def iter_range(self, start=None, end=None, reverse=False) -> Iterator[Tuple[Any, Any, Any]]:
+        """Intervals overlapping [start, end) lazily in start order (None = open bound)."""
+        lo, hi = self._range_bounds(start, end)
+        for i in (range(hi - 1, lo - 1, -1) if reverse else range(lo, hi)):
+            item = self._by_start[i]
+            if start is None or item[1] > start:
+                yield item
+
+    def snapshot_range(self, start=None, end=None, reverse=False) -> Iterator[Tuple[Any, Any, Any]]:
+        """
+        Same intervals as iter_range, but the candidates are copied right away (one slice), so
+        changes made to the index later don't affect the iteration: for readers that go on
+        after releasing the lock that guards the index.
+        """
+        lo, hi = self._range_bounds(start, end)
+        items = self._by_start[lo:hi]
+        return (item for item in (reversed(items) if reverse else items) if start is None or item[1] > start)
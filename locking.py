@@ -0,0 +1,121 @@
+"""
+Reader/writer lock for the JSON database, shared by threads (Streamlit sessions) and processes (cron scripts).
+Within a process a condition variable lets any number of readers or one writer in;
+across processes fcntl.flock on a lock file next to the database does the same.
+Where fcntl is not available (Windows) only threads are synchronized.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class ReadWriteLock:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = None
+        self._waiting_writers = 0
+        # number of readers in this process that need the shared file lock
+        self._file_readers = 0
+        self._fd = None
+        self._local = threading.local()
+
+    # ---------- file lock ----------
+    def _flock(self, mode: int) -> None:
+        if fcntl is None:
+            return
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, mode)
+
+    # ---------- public ----------
+    @contextmanager
+    def read(self, files: bool = False) -> Iterator[None]:
+        """
+        Shared access. files=True also takes the shared file lock, for reading the files
+        consistently while no other process is writing them.
+        Re-entrant, also inside write() of the same thread.
+        """
+        if self._writer is threading.current_thread():
+            yield
+            return
+        depth = getattr(self._local, "depth", 0)
+        if depth and not files:
+            self._local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.depth = depth
+            return
+
+        with self._cond:
+            # waiting writers go first, except for threads that already read (would deadlock)
+            while self._writer is not None or (self._waiting_writers and not depth):
+                self._cond.wait()
+            self._readers += 1
+            if files:
+                if self._file_readers == 0 and fcntl is not None:
+                    self._flock(fcntl.LOCK_SH)
+                self._file_readers += 1
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            with self._cond:
+                self._readers -= 1
+                if files:
+                    self._file_readers -= 1
+                    if self._file_readers == 0 and fcntl is not None:
+                        self._flock(fcntl.LOCK_UN)
+                self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        """Exclusive access for this thread, in this process and across processes. Re-entrant."""
+        me = threading.current_thread()
+        if self._writer is me:
+            yield
+            return
+        if getattr(self._local, "depth", 0):
+            raise RuntimeError("cannot upgrade a read lock to a write lock")
+
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = me
+        try:
+            if fcntl is not None:
+                self._flock(fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    self._flock(fcntl.LOCK_UN)
+        finally:
+            with self._cond:
+                self._writer = None
+                self._cond.notify_all()
+
+
+_locks: Dict[Path, ReadWriteLock] = {}
+_locks_guard = threading.Lock()
+
+
+def lock_for(db_path: Path) -> ReadWriteLock:
+    """The lock of a database file (one per path and process)"""
+    lock_path = db_path.with_name(db_path.name + ".lock")
+    with _locks_guard:
+        if lock_path not in _locks:
+            _locks[lock_path] = ReadWriteLock(lock_path)
+        return _locks[lock_path]
@@ -1,24 +1,42 @@
+import importlib
 import streamlit as st
-import ui_device
-import ui_reservations
-import ui_users
-import ui_wartungen
+import diagnostics
+import queries
+
+# sidebar entry -> page module; a page is imported when it is selected for the first time,
+# so starting the app doesn't import (and open the data of) every page
+PAGES = {
+    "Devices": "ui_device",
+    "Reservierungen": "ui_reservations",
+    "Nutzer": "ui_users",
+    "Wartungen": "ui_wartungen",
+    "Diagnostics": "ui_diagnostics",
+}
 
 st.set_page_config(page_title="Case Study 1", layout="wide")
 
 st.title("Case Study 1")
 st.write("Grundgerüst: UI → Logik → Datenbank (JSON)")
 
+# changes the write-behind accepted but could not store (another process booked meanwhile)
+for change in queries.take_dropped_changes():
+    args = change["args"]
+    if change["op"] == "insert_reservation":
+        what = f'Reservierung von Gerät {args["device_id"]}, {args["start"]} – {args["end"]}'
+    elif change["op"] == "add_recurring":
+        what = f'Serie von Gerät {args["rule"]["device_id"]} ab {args["rule"]["start"]}'
+    else:
+        what = change["op"]
+    st.error(f"Nicht gespeichert: {what} ({change['error']}).")
+
 seite = st.sidebar.selectbox(
     "Navigation",
-    ["Devices", "Reservierungen", "Nutzer", "Wartungen"]
+    list(PAGES.keys())
 )
 
-if seite == "Devices":
-    ui_device.render()
-elif seite == "Reservierungen":
-    ui_reservations.render()
-elif seite == "Wartungen":
-    ui_wartungen.render()
-else:
-    ui_users.render()
\ No newline at end of file
+# everything measured until the end of this script run is attributed to this rerun
+diagnostics.start_rerun(seite)
+try:
+    importlib.import_module(PAGES[seite]).render()
+finally:
+    diagnostics.finish_rerun()
\ No newline at end of file
@@ -1,15 +1,194 @@
+import atexit
+import functools
+import heapq
 import json
+import marshal
+import os
+import struct
+import sys
+import tempfile
+import threading
+import traceback
+import zlib
+from array import array
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from itertools import chain, islice
+from operator import is_, itemgetter
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 
-DB_PATH = Path(__file__).parent / "database.json"
+import archive
+import diagnostics
+from epoch_minutes import format_minutes, parse_minutes, to_minutes, to_minutes_ceil
+from free_slots import WORK_DAY_END, WORK_DAY_START, WORK_DAYS, check_workdays, earliest_slot
+from interval_index import IntervalIndex
+from locking import lock_for
+from recurrence import EMPTY_RULE_MESSAGE, Recurrence
 
+DB_PATH = Path(os.environ.get("CASE_STUDY_DB_PATH") or Path(__file__).parent / "database.json")
 
+# "json" (database.json + journal, implemented here) or "sqlite" (sqlite_backend.py)
+DB_BACKEND = os.environ.get("CASE_STUDY_DB_BACKEND", "json")
 
+# Mutations are appended to a journal next to DB_PATH and folded back into the snapshot
+# once JOURNAL_COMPACT_AFTER records have piled up.
+# The journal is fsynced every JOURNAL_FSYNC_EVERY records (or on sync()).
+JOURNAL_FSYNC_EVERY = 8
+JOURNAL_COMPACT_AFTER = 500
+
+# Write-behind (CASE_STUDY_WRITE_BEHIND=<seconds>, off by default): mutations only change the
+# in-memory snapshot and a background thread appends everything that piled up within that many
+# seconds to the journal in one write (and compacts), see flush(). Meant for one app process:
+# while changes are waiting, changes of other processes are picked up only with the next flush.
+# Once WRITE_BEHIND_MAX_PENDING changes are waiting (CASE_STUDY_WRITE_BEHIND_MAX), the commit that
+# adds the last one flushes right away.
+WRITE_BEHIND_INTERVAL = float(os.environ.get("CASE_STUDY_WRITE_BEHIND") or 0)
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get("CASE_STUDY_WRITE_BEHIND_MAX") or 100)
+
+# Binary snapshot (CASE_STUDY_BINARY_SNAPSHOT=1, off by default): whenever database.json is written
+# (or had to be parsed), a marshal copy of it is written next to it, together with the reservation
+# times already parsed into epoch minutes. Loads use it instead of the JSON as long as it belongs
+# to the current database.json. It is a cache only: JSON stays the format to keep, edit and export.
+BINARY_SNAPSHOT = os.environ.get("CASE_STUDY_BINARY_SNAPSHOT") == "1"
+
+# Archive (CASE_STUDY_ARCHIVE_DAYS=<days>, off by default): every compaction moves the reservations
+# that ended more than that many days ago out of database.json into the append-only file
+# database.json.archive (see archive_reservations and archive.py), so loads only parse and keep the
+# recent ones. All reads of reservations (lists, history, conflicts, free slots, utilization)
+# cover both parts.
+ARCHIVE_AFTER_DAYS = float(os.environ.get("CASE_STUDY_ARCHIVE_DAYS") or 0)
+
+CONFLICT_MESSAGE = "Gerät ist in diesem Zeitraum bereits reserviert"
+USER_IN_USE_MESSAGE = "Nutzer verwaltet noch Geräte oder hat Reservierungen"
+DEVICE_IN_USE_MESSAGE = "Gerät hat noch Reservierungen oder Wartungen"
+REASSIGN_TARGET_MESSAGE = "Ziel der Übertragung existiert nicht"
+CHANGES_DROPPED_MESSAGE = "Änderungen verworfen, sie passen nicht mehr zu den Daten eines anderen Prozesses"
+
+# What delete_user / delete_device do with the rows that reference the deleted entry
+DELETE_POLICIES = ("cascade", "reassign", "restrict")
+
+# Top-level keys of the document that belong to this module. Every other key holding a dict is a
+# TinyDB table of the models (see read_tables); a table whose name collides with one of these keys
+# is stored as TABLE_KEY_PREFIX + name.
+_OWN_KEYS = ("schema_version", "journal_seq", "users", "devices", "reservations", "archive", "recurring")
+TABLE_KEY_PREFIX = "tinydb_"
+
+# In-process snapshot of the database (database.json + replayed journal).
+# "key" identifies the file versions the snapshot was read from (path, inode, mtime, size),
+# so the files are only parsed again when they really changed on disk.
+# "seq" is the sequence number of the last journal record contained in "db".
+# "index" maps device ids to an IntervalIndex of their reservations, built on first use.
+# "refs" holds the reverse indexes used by deletes (see _references), built on first use.
+# "version" grows whenever "db" is replaced or changed; memoized query results are keyed on it.
+# "pending" holds the mutations applied to "db" but not journaled yet (write-behind only), as
+# (op, args, args given to _commit, prepare), see flush().
+# "minutes" are the start / end columns of a binary snapshot for the first rows of
+# db["reservations"], used (and dropped) by the first index build.
+# "archive" is the view of the archived reservations (see _archive), opened on first use.
+# "rules" holds the recurring reservations per device (see _recurring), built on first use.
+_cache: Dict[str, Any] = {
+    "key": None, "db": None, "seq": 0, "unsynced": 0, "index": None, "refs": None, "version": 0, "pending": [],
+    "minutes": None, "archive": None, "rules": None,
+}
+
+
+def _journal_path() -> Path:
+    return DB_PATH.with_name(DB_PATH.name + ".journal")
+
+
+def _snapshot_path() -> Path:
+    return DB_PATH.with_name(DB_PATH.name + ".snapshot")
+
+
+def _archive_path() -> Path:
+    return DB_PATH.with_name(DB_PATH.name + ".archive")
+
+
+def _stat_key(path: Path) -> Optional[tuple]:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (str(path), st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _file_key() -> Optional[tuple]:
+    db_key = _stat_key(DB_PATH)
+    if db_key is None:
+        return None
+    return (db_key, _stat_key(_journal_path()))
+
+
+# read once: os.umask can only be read by setting it, which would race with other threads
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _lock():
+    """Reader/writer lock of the current DB_PATH (threads and processes, see locking.py)."""
+    return lock_for(DB_PATH)
+
+
+def _shared(func):
+    """Run a read function under the shared lock, so no writer changes the snapshot meanwhile."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _lock().read():
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _file_mode(path: Path) -> int:
+    """Permissions for a file replacing path: those of path, or the umask default of a new file."""
+    try:
+        return path.stat().st_mode & 0o777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def _write_temp(path: Path, data: bytes) -> str:
+    """Write data to a new, fsynced file next to path and return its name.
+    The file gets the permissions of path (mkstemp creates it owner-only, os.replace keeps that)."""
+    fd, tmp = tempfile.mkstemp(prefix=path.name + ".", suffix=".tmp", dir=path.parent)
+    try:
+        with open(fd, "wb") as f:
+            os.fchmod(f.fileno(), _file_mode(path))
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return tmp
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    # readers either see the old or the new file, never a half written one
+    tmp = _write_temp(path, data)
+    try:
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _encode_db(db: dict) -> bytes:
+    return json.dumps(db, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+@diagnostics.timed("queries._save_db")
 def _save_db(db: dict) -> None:
-    DB_PATH.write_text(json.dumps(db, indent=2, ensure_ascii=False), encoding="utf-8")
+    """Write a full snapshot of db; db["journal_seq"] tells which journal records it contains."""
+    data = _encode_db(db)
+    _write_atomic(DB_PATH, data)
+    diagnostics.count_bytes("queries._save_db", written=len(data))
+    if BINARY_SNAPSHOT:
+        _write_snapshot(db, _stat_key(DB_PATH))
 
 
+@diagnostics.timed("queries._normalize_db")
 def _normalize_db(db: Any) -> dict:
    
     if not isinstance(db, dict):
@@ -104,24 +283,537 @@ def _normalize_db(db: Any) -> dict:
     return {"users": users, "devices": devices, "reservations": new_res}
 
 
+def _empty_db() -> dict:
+    return {"schema_version": SCHEMA_VERSION, "users": {}, "devices": {}, "reservations": []}
+
+
+def _migrate_to_v1(db: dict) -> dict:
+    """Legacy layouts (list-style users/devices, name-keyed reservations) -> dict layout."""
+    migrated = _normalize_db(db)
+    # keep tables we don't manage ourselves (e.g. the TinyDB "maintenances" table)
+    for k, v in db.items():
+        if k not in migrated:
+            migrated[k] = v
+    return migrated
+
+
+def _migrate_to_v2(db: dict) -> dict:
+    """The device page stored the manager as its label "Name (user id)" -> plain user id."""
+    users = db["users"]
+    for d in db["devices"].values():
+        manager = str(d.get("managed_by_user_id", ""))
+        if manager not in users and manager.endswith(")") and "(" in manager:
+            user_id = manager[manager.rindex("(") + 1:-1]
+            if user_id in users:
+                d["managed_by_user_id"] = user_id
+    return db
+
+
+# MIGRATIONS[n] turns a schema version n document into version n + 1
+MIGRATIONS = [_migrate_to_v1, _migrate_to_v2]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def _is_current(db: Any) -> bool:
+    """Cheap shape check for documents that claim to be on the current schema version."""
+    if not isinstance(db, dict) or db.get("schema_version") != SCHEMA_VERSION:
+        return False
+    users, devices, reservations = db.get("users"), db.get("devices"), db.get("reservations")
+    return (
+        isinstance(users, dict)
+        and isinstance(devices, dict)
+        and isinstance(reservations, list)
+        and all(isinstance(u, dict) for u in users.values())
+        and all(isinstance(d, dict) for d in devices.values())
+        and all(isinstance(r, dict) for r in reservations)
+    )
+
+
+def _migrate(db: Any) -> dict:
+    if not isinstance(db, dict):
+        db = {}
+    version = db.get("schema_version", 0)
+    if not isinstance(version, int) or not 0 <= version <= SCHEMA_VERSION:
+        version = 0
+    if version == SCHEMA_VERSION:
+        # current version but invalid shape (edited by hand?) -> rebuild it from scratch
+        version = 0
+
+    for migration in MIGRATIONS[version:]:
+        db = migration(db)
+    # version first, so it is the first thing one sees in the file
+    return {"schema_version": SCHEMA_VERSION, **{k: v for k, v in db.items() if k != "schema_version"}}
+
+
+@diagnostics.timed("queries._load_db")
 def _load_db() -> dict:
-    if not DB_PATH.exists():
-        
-        db = {"users": {}, "devices": {}, "reservations": []}
-        _save_db(db)
-        return db
+    """Return the database, re-reading the file only if it changed on disk.
+
+    Loading never writes the database (only the binary snapshot, a cache): documents on the current
+    schema version are used as they are, older ones are migrated and written back exactly once.
+    Journal records written after the last compaction are replayed on top of the snapshot.
+    The returned dict is the cached snapshot itself: mutators change it in place
+    through _commit(), which keeps the cache in sync with the files.
+    While write-behind changes are pending the snapshot is newer than the files and is kept.
+    """
+    if _cache["pending"]:
+        return _cache["db"]
+    key = _file_key()
+    if key is not None and key == _cache["key"]:
+        return _cache["db"]
+
+    # no writer (of any process) may touch the files while they are read
+    with _lock().read(files=True):
+        return _read_files()
+
+
+@diagnostics.timed("queries._read_files")
+def _read_files() -> dict:
+    key = _file_key()
+    if key is not None and key == _cache["key"]:
+        return _cache["db"]
+
+    if key is None:
+        # nothing on disk yet, the first mutation creates the file
+        if _cache["db"] is None or _cache["key"] is not None:
+            _set_snapshot(_empty_db(), None, 0)
+        return _cache["db"]
+
+    loaded = _read_snapshot(key[0]) if BINARY_SNAPSHOT else None
+    if loaded is not None:
+        db, minutes = loaded
+    else:
+        try:
+            data = DB_PATH.read_bytes()
+            diagnostics.count_bytes("queries._read_files", read=len(data))
+            raw = json.loads(data)
+        except Exception:
+            # unreadable file: serve an empty database but leave the file alone
+            return _set_snapshot(_empty_db(), key, 0)
 
+        minutes = None
+        if _is_current(raw):
+            db = raw
+            if BINARY_SNAPSHOT:
+                # missing or outdated: the next load can skip the JSON (and the parsing of the times)
+                minutes = _write_snapshot(db, key[0])
+        else:
+            db = _migrate(raw)
+            _save_db(db)
+
+    rows = list(db["reservations"]) if minutes is not None else None
+    # seq is local: other threads may be reloading at the same time
+    seq = _replay_journal(db, db.get("journal_seq", 0))
+    _set_snapshot(db, _file_key(), seq)
+    # the columns stay valid as long as replay only appended (deletes move rows around)
+    if rows is not None and len(db["reservations"]) >= len(rows) and all(map(is_, rows, db["reservations"])):
+        _cache["minutes"] = minutes
+    return db
+
+
+def _set_snapshot(db: dict, key: Optional[tuple], seq: int) -> dict:
+    _cache.update(db=db, key=key, seq=seq, index=None, refs=None, minutes=None, archive=None, rules=None)
+    _cache["version"] += 1
+    return db
+
+
+# ---------- binary snapshot ----------
+# database.json.snapshot: header, then marshal.dumps((db, start minutes, end minutes)).
+# The header names the database.json (inode, mtime, size) the snapshot was made from;
+# marshal data is only readable by the Python version that wrote it.
+_SNAPSHOT_MAGIC = b"CSDBSNAP"
+_SNAPSHOT_FORMAT = 1
+_SNAPSHOT_HEADER = struct.Struct("<8sHBBHQqQ")
+
+
+def _snapshot_header(json_key: tuple) -> tuple:
+    return (_SNAPSHOT_MAGIC, _SNAPSHOT_FORMAT, *sys.version_info[:2], marshal.version, *json_key[1:])
+
+
+def _reservation_minutes(db: dict) -> Tuple[array, array]:
+    """Start and end minutes of every row of db["reservations"]; 0, 0 for rows the index skips."""
+    index = _cache["index"] if db is _cache["db"] else None
+    # reuse the parsed times of the index where there is one
+    known = {id(r): (start, end) for device_index in (index or {}).values() for start, end, r in device_index}
+    starts, ends = array("q"), array("q")
+    for r in db["reservations"]:
+        pair = known.get(id(r))
+        if pair is None:
+            start, end = parse_minutes(r.get("start")), parse_minutes(r.get("end"))
+            pair = (start, end) if start is not None and end is not None and end > start else (0, 0)
+        starts.append(pair[0])
+        ends.append(pair[1])
+    return starts, ends
+
+
+@diagnostics.timed("queries._write_snapshot")
+def _write_snapshot(db: dict, json_key: Optional[tuple]) -> Tuple[array, array]:
+    """Write the snapshot of db, the contents of the database.json identified by json_key."""
+    minutes = _reservation_minutes(db)
+    # the same ids repeat in every reservation; marshal stores an interned string only once
+    for r in db["reservations"]:
+        for field in ("device_id", "user_id"):
+            if type(r.get(field)) is str:
+                r[field] = sys.intern(r[field])
+    if json_key is not None:
+        data = _SNAPSHOT_HEADER.pack(*_snapshot_header(json_key)) + marshal.dumps(
+            (db, minutes[0].tobytes(), minutes[1].tobytes())
+        )
+        _write_atomic(_snapshot_path(), data)
+        diagnostics.count_bytes("queries._write_snapshot", written=len(data))
+    return minutes
+
+
+@diagnostics.timed("queries._read_snapshot")
+def _read_snapshot(json_key: tuple) -> Optional[Tuple[dict, Tuple[array, array]]]:
+    """(db, (start minutes, end minutes)) if there is a readable snapshot of the database.json json_key."""
     try:
-        raw = json.loads(DB_PATH.read_text(encoding="utf-8"))
+        data = _snapshot_path().read_bytes()
+    except FileNotFoundError:
+        return None
+    diagnostics.count_bytes("queries._read_snapshot", read=len(data))
+    if len(data) < _SNAPSHOT_HEADER.size or _SNAPSHOT_HEADER.unpack_from(data) != _snapshot_header(json_key):
+        return None
+    try:
+        db, starts, ends = marshal.loads(memoryview(data)[_SNAPSHOT_HEADER.size:])
+    except (EOFError, ValueError, TypeError):
+        return None
+    if not _is_current(db):
+        return None
+    return db, (array("q", starts), array("q", ends))
+
+
+# ---------- journal ----------
+
+def _encode_record(record: dict) -> bytes:
+    payload = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+
+def _decode_record(line: bytes) -> Optional[dict]:
+    """Inverse of _encode_record; None for torn or corrupted lines."""
+    if not line.endswith(b"\n") or len(line) < 10 or line[8:9] != b" ":
+        return None
+    payload = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def _replay_journal(db: dict, seq: int) -> int:
+    """Apply the journal records newer than seq (the snapshot's journal_seq) to db, return the new seq.
+
+    Replay stops at the first torn or corrupted record (a crash in the middle of an append);
+    that tail is cut off so later appends don't end up behind garbage.
+    """
+    path = _journal_path()
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return seq
+    diagnostics.count_bytes("queries._replay_journal", read=len(data))
+
+    good = 0
+    for line in data.splitlines(keepends=True):
+        record = _decode_record(line)
+        if record is None:
+            break
+        good += len(line)
+        if record["seq"] <= seq:
+            # already contained in the snapshot (crash between compaction and truncation)
+            continue
+        _OPS[record["op"]](db, **record["args"])
+        seq = record["seq"]
+
+    if good < len(data):
+        with open(path, "r+b") as f:
+            f.truncate(good)
+    return seq
+
+
+def _append_journal(ops: List[Tuple[str, dict]], fsync: bool = False) -> None:
+    """Append one record per (op, args) in a single write; fsync every JOURNAL_FSYNC_EVERY records or if asked."""
+    seq = _cache["seq"]
+    data = b"".join(_encode_record({"seq": seq + i, "op": op, "args": args}) for i, (op, args) in enumerate(ops, 1))
+    with open(_journal_path(), "ab") as f:
+        f.write(data)
+        _cache["unsynced"] += len(ops)
+        if fsync or _cache["unsynced"] >= JOURNAL_FSYNC_EVERY:
+            f.flush()
+            os.fsync(f.fileno())
+            _cache["unsynced"] = 0
+    _cache["seq"] = seq + len(ops)
+    diagnostics.count_bytes("queries._append_journal", written=len(data))
+
+
+def _commit(op: str, prepare: Optional[Callable[[dict], dict]] = None, **args: Any) -> None:
+    """
+    Apply a mutation to the cached snapshot and append it to the journal
+    (with write-behind: queue it for the next flush()).
+
+    Optimistic concurrency: prepare(db) derives further arguments from the current data
+    (e.g. a new id) or rejects the mutation by raising. It first runs without the write lock;
+    if another writer changed the data in the meantime (file state, journal seq or, for commits of
+    this process that are still pending, the version differ from what prepare saw), the data is
+    reloaded and prepare runs again, now under the write lock.
+    """
+    db = _load_db()
+    seen = _cache["key"]
+    version = _cache["version"]
+    op_args = args
+    if prepare is not None:
+        with _lock().read():
+            op_args = {**args, **prepare(db)}
+
+    with _lock().write():
+        if _file_key() != seen or _cache["key"] != seen or _cache["db"] is not db or _cache["version"] != version:
+            # someone else wrote (or reloaded the snapshot) after prepare looked at it;
+            # nobody can change anything while we hold the write lock, so one retry is enough
+            db = _load_db()
+            seen = _cache["key"]
+            if prepare is not None:
+                op_args = {**args, **prepare(db)}
+        if op_args.get("changes") == {}:
+            # nothing differs (e.g. TinyDB's internal writes that match no document): no record and
+            # no new version, which would throw away memoized results and the models' indexes
+            return
+
+        if seen is None:
+            _save_base(db)
+        changes = _OPS[op](db, **op_args)
+        # archive positions are only valid for the files as they are now (see archive_reservations)
+        if WRITE_BEHIND_INTERVAL > 0 and op != "archive_reservations":
+            _cache["pending"].append((op, op_args, args, prepare))
+            _schedule_flush()
+        else:
+            _append_journal([(op, op_args)])
+            _cache["key"] = _file_key()
+        _cache["version"] += 1
+        _update_indexes(db, op, op_args, changes)
+        if len(_cache["pending"]) >= WRITE_BEHIND_MAX_PENDING:
+            flush()
+
+        # archive runs come from compact() (which writes the file anyway) or are left to the next write
+        if (
+            WRITE_BEHIND_INTERVAL <= 0
+            and op != "archive_reservations"
+            and _cache["seq"] - db.get("journal_seq", 0) >= JOURNAL_COMPACT_AFTER
+        ):
+            compact()
+
+
+def _save_base(db: dict) -> None:
+    # first write ever: the journal needs a snapshot to be replayed onto
+    db["journal_seq"] = _cache["seq"]
+    _save_db(db)
+    _cache["key"] = _file_key()
+
+
+@diagnostics.timed("queries.flush")
+def flush() -> None:
+    """
+    Journal the changes waiting for the write-behind thread now (one write, fsynced).
+    If another process wrote the files meanwhile, its data is loaded and ours is applied on top
+    (see _reapply_pending); ValueError names the changes that were dropped because they no longer fit.
+    """
+    with _lock().write():
+        if _writer["timer"] is not None:
+            _writer["timer"].cancel()
+            _writer["timer"] = None
+        pending = _cache["pending"]
+        if not pending:
+            return
+        dropped = []
+        if _file_key() != _cache["key"]:
+            pending, dropped = _reapply_pending(pending)
+        if _cache["key"] is None:
+            _save_base(_cache["db"])
+        if pending:
+            _append_journal([(op, op_args) for op, op_args, _, _ in pending], fsync=True)
+        _cache["pending"] = []
+        _cache["key"] = _file_key()
+    if dropped:
+        _dropped.extend({"op": op, "args": args, "error": str(error)} for op, args, error in dropped)
+        raise ValueError(f"{CHANGES_DROPPED_MESSAGE}: " + "; ".join(f"{op} ({error})" for op, _, error in dropped))
+
+
+# Changes flush() had to drop after the caller was told they were saved, until the UI takes them.
+_dropped: List[dict] = []
+
+
+def take_dropped_changes() -> List[dict]:
+    """
+    The write-behind changes that flush() dropped since the last call (see _reapply_pending), as
+    {"op", "args", "error"}: the app shows them on its next run, the call that made them has
+    returned long ago.
+    """
+    with _lock().write():
+        taken = list(_dropped)
+        _dropped.clear()
+    return taken
+
+
+def _reapply_pending(pending: List[tuple]) -> Tuple[List[tuple], List[tuple]]:
+    """
+    Load the files another process wrote and apply the pending changes on top (under the write lock).
+    The ids and row positions their prepare() chose may be taken or gone there, so prepare runs
+    again against the fresh data; changes it rejects now are dropped.
+    Returns the pending changes to journal and the dropped ones as (op, args, error).
+    """
+    db = _read_files()
+    kept, dropped = [], []
+    for op, op_args, args, prepare in pending:
+        # the diff of write_tables applies by doc id; derived again from the complete tables it
+        # would undo the documents the other process wrote
+        if prepare is not None and op != "write_tables":
+            try:
+                op_args = {**args, **prepare(db)}
+            except ValueError as e:
+                dropped.append((op, args, e))
+                continue
+        changes = _OPS[op](db, **op_args)
+        _cache["version"] += 1
+        _update_indexes(db, op, op_args, changes)
+        kept.append((op, op_args, args, prepare))
+    return kept, dropped
+
+
+# ---------- write-behind ----------
+# The first pending change starts a timer, the flush it triggers writes everything that came meanwhile.
+_writer: Dict[str, Any] = {"timer": None, "atexit": False, "compacting": False}
+
+
+def _schedule_flush() -> None:
+    """Called under the write lock."""
+    if _writer["timer"] is not None:
+        return
+    if not _writer["atexit"]:
+        # the timer thread is a daemon, whatever is still pending at exit is written here
+        atexit.register(flush)
+        _writer["atexit"] = True
+    _writer["timer"] = threading.Timer(WRITE_BEHIND_INTERVAL, _flush_in_background)
+    _writer["timer"].daemon = True
+    _writer["timer"].start()
+
+
+def _flush_in_background() -> None:
+    try:
+        flush()
     except Exception:
-        raw = {"users": {}, "devices": {}, "reservations": []}
+        traceback.print_exc()
+        with _lock().write():
+            if _cache["pending"]:
+                # the changes are still pending, try again after the next interval
+                _schedule_flush()
+        return
+    if _cache["seq"] - _cache["db"].get("journal_seq", 0) >= JOURNAL_COMPACT_AFTER:
+        try:
+            _compact_behind()
+        except Exception:
+            traceback.print_exc()
 
-    db = _normalize_db(raw)
-    _save_db(db)  
-    return db
+
+@diagnostics.timed("queries._compact_behind")
+def _compact_behind() -> None:
+    """
+    compact() for the write-behind timer. The write lock is only held to copy the snapshot and to
+    put the new file in place; encoding and writing it doesn't hold up writers. Journal records
+    appended meanwhile stay in the journal.
+    """
+    with _lock().write():
+        if _writer["compacting"]:
+            return
+        _archive_expired()
+        flush()
+        db_key = _stat_key(DB_PATH)
+        seq = _cache["seq"]
+        # marshal is a fast deep copy of JSON-like data
+        blob = marshal.dumps(_cache["db"])
+        _writer["compacting"] = True
+    tmp = None
+    try:
+        db = marshal.loads(blob)
+        db["journal_seq"] = seq
+        data = _encode_db(db)
+        tmp = _write_temp(DB_PATH, data)
+        with _lock().write():
+            if _stat_key(DB_PATH) != db_key:
+                # another process compacted meanwhile
+                return
+            os.replace(tmp, DB_PATH)
+            tmp = None
+            _trim_journal(seq)
+            _cache["db"]["journal_seq"] = seq
+            _cache["key"] = _file_key()
+            json_key = _stat_key(DB_PATH)
+        diagnostics.count_bytes("queries._compact_behind", written=len(data))
+        if BINARY_SNAPSHOT:
+            # a snapshot that got outdated meanwhile is simply not used
+            _write_snapshot(db, json_key)
+    finally:
+        if tmp is not None:
+            os.unlink(tmp)
+        _writer["compacting"] = False
+
+
+def _trim_journal(seq: int) -> None:
+    """Drop the journal records up to seq, the snapshot contains them now."""
+    path = _journal_path()
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return
+    keep = []
+    for line in data.splitlines(keepends=True):
+        record = _decode_record(line)
+        if record is None:
+            break
+        if record["seq"] > seq:
+            keep.append(line)
+    _write_atomic(path, b"".join(keep))
+    _cache["unsynced"] = 0
+
+
+def sync() -> None:
+    """Force all changes made so far onto the disk (pending write-behind changes included)."""
+    flush()
+    if not _cache["unsynced"]:
+        return
+    path = _journal_path()
+    if path.exists():
+        with open(path, "ab") as f:
+            os.fsync(f.fileno())
+    _cache["unsynced"] = 0
+
+
+def compact() -> None:
+    """Fold the journal into database.json and start a new, empty journal
+    (moving expired reservations into the archive first, see ARCHIVE_AFTER_DAYS)."""
+    with _lock().write():
+        _archive_expired()
+        flush()
+        db = _load_db()
+        db["journal_seq"] = _cache["seq"]
+        _save_db(db)
+        # a crash before this truncate is harmless: replay skips records up to journal_seq
+        path = _journal_path()
+        if path.exists():
+            with open(path, "r+b") as f:
+                f.truncate(0)
+        _cache["unsynced"] = 0
+        _cache["key"] = _file_key()
 
 
+def db_version() -> int:
+    """Number that grows whenever the data may have changed (own writes or changes on disk)."""
+    _load_db()
+    return _cache["version"]
 
+
+@_shared
 def get_users() -> List[dict]:
     db = _load_db()
     users = db.get("users", {})
@@ -134,6 +826,7 @@ def get_users() -> List[dict]:
     return out
 
 
+@_shared
 def get_devices() -> List[dict]:
     db = _load_db()
     devices = db.get("devices", {})
@@ -158,7 +851,10 @@ def find_devices() -> List[dict]:
     return get_devices()
 
 
+@_shared
 def list_reservations() -> List[dict]:
+    """All reservations, archived ones included. Recurring reservations are stored as rules and
+    have no window to be expanded in here: see iter_reservations and get_recurring_reservations."""
     db = _load_db()
     res = db.get("reservations", [])
     if not isinstance(res, list):
@@ -175,77 +871,1094 @@ def list_reservations() -> List[dict]:
                 "end": r.get("end", ""),
             }
         )
+    out.extend(_archived_rows())
     return out
 
 
-def insert_reservation(new_res: dict) -> None:
+# ---------- reservation index ----------
+
+def _index_reservation(index: Dict[str, IntervalIndex], r: dict) -> None:
+    start, end = parse_minutes(r.get("start")), parse_minutes(r.get("end"))
+    if start is None or end is None or end <= start:
+        return
+    index.setdefault(str(r.get("device_id", "")), IntervalIndex()).add(start, end, r)
+
+
+def _reservation_index() -> Dict[str, IntervalIndex]:
+    """
+    Per-device interval index over the cached reservations. The ISO strings are parsed once here
+    into epoch minutes kept next to the records, all overlap and range checks compare those ints.
+    """
+    _load_db()
+    if _cache["index"] is None:
+        by_device: Dict[str, list] = {}
+        # times parsed in advance by the binary snapshot, for the rows it contained
+        starts, ends = _cache["minutes"] or ((), ())
+        known = len(starts)
+        for pos, r in enumerate(_cache["db"]["reservations"]):
+            if pos < known:
+                start, end = starts[pos], ends[pos]
+            else:
+                start, end = parse_minutes(r.get("start")), parse_minutes(r.get("end"))
+                if start is None or end is None:
+                    continue
+            if end > start:
+                by_device.setdefault(str(r.get("device_id", "")), []).append((start, end, r))
+        _cache["minutes"] = None
+        # bulk build: one sort per device instead of an insort per reservation
+        _cache["index"] = {dev_id: IntervalIndex.from_intervals(items) for dev_id, items in by_device.items()}
+    return _cache["index"]
+
+
+def _is_free(device_id: str, start: int, end: int) -> bool:
+    device_index = _reservation_index().get(device_id)
+    if device_index is not None and device_index.overlaps_any(start, end):
+        return False
+    if any(rec.overlaps_any(start, end) for _, _, rec in _recurring().get(device_id, ())):
+        return False
+    return next(_archived(_archive(), device_id, start, end), None) is None
+
+
+def _unindex_reservation(index: Dict[str, IntervalIndex], r: dict) -> None:
+    device_index = index.get(str(r.get("device_id", "")))
+    start, end = parse_minutes(r.get("start")), parse_minutes(r.get("end"))
+    if device_index is not None and start is not None and end is not None:
+        device_index.remove(start, end, r)
+
+
+def _update_indexes(db: dict, op: str, args: dict, changes: Any) -> None:
+    """Keep the indexes that were built already in step with a mutation (changes: what the op returned)."""
+    index, refs = _cache["index"], _cache["refs"]
+    rows = db["reservations"]
+    if op in ("delete_user", "delete_device", "archive_reservations"):
+        _cache["archive"] = None
+    if op in ("delete_user", "delete_device", "add_recurring", "skip_recurring", "delete_recurring"):
+        _cache["rules"] = None
+    if op == "archive_reservations":
+        # moves most rows at once: rebuilding on the next use is cheaper than removing them one by one
+        _cache["index"] = _cache["refs"] = None
+        return
+
+    if op in ("insert_reservation", "insert_reservations"):
+        count = 1 if op == "insert_reservation" else len(args["reservations"])
+        for pos in range(len(rows) - count, len(rows)):
+            if index is not None:
+                _index_reservation(index, rows[pos])
+            if refs is not None:
+                _ref_add(refs, pos, rows[pos])
+        return
+
+    if op == "write_tables":
+        for doc_id, old, new in changes.get("maintenances", ()) if refs is not None else ():
+            if isinstance(old, dict):
+                refs["maintenances"].get(str(old.get("device_id")), set()).discard(doc_id)
+            if isinstance(new, dict):
+                refs["maintenances"].setdefault(str(new.get("device_id")), set()).add(doc_id)
+        return
+
+    if refs is not None and op in ("add_device", "update_device"):
+        previous = changes if op == "update_device" else None
+        current = db["devices"][args["device_id"]]["managed_by_user_id"]
+        if previous is not None:
+            refs["managed"].get(previous, set()).discard(args["device_id"])
+        refs["managed"].setdefault(current, set()).add(args["device_id"])
+        return
+
+    if op not in ("delete_user", "delete_device") or changes is None:
+        return
+    reassign_to = args.get("reassign_to")
+
+    if op == "delete_device":
+        device_id = args["device_id"]
+        moved_index = index.pop(device_id, None) if index is not None else None
+        if reassign_to is not None and moved_index is not None:
+            target = index.setdefault(reassign_to, IntervalIndex())
+            for start, end, r in moved_index:
+                target.add(start, end, r)
+        if refs is not None:
+            if changes["device"] is not None:
+                refs["managed"].get(changes["device"].get("managed_by_user_id", ""), set()).discard(device_id)
+            res_positions = refs["device_res"].pop(device_id, set())
+            maintenances = refs["maintenances"].pop(device_id, set())
+            if reassign_to is not None:
+                refs["device_res"].setdefault(reassign_to, set()).update(res_positions)
+                refs["maintenances"].setdefault(reassign_to, set()).update(maintenances)
+
+    if "removed" in changes:
+        if index is not None:
+            for dev_id in changes.get("devices", ()):
+                index.pop(dev_id, None)
+            for _, r in changes["removed"]:
+                _unindex_reservation(index, r)
+        if refs is not None:
+            # gaps first, then the rows that were moved into them (in the order they moved)
+            for pos, r in changes["removed"]:
+                _ref_discard(refs, pos, r)
+            for old, new, r in changes["moved"]:
+                _ref_discard(refs, old, r)
+                _ref_add(refs, new, r)
+            for dev_id in changes.get("devices", ()):
+                refs["device_res"].pop(dev_id, None)
+                refs["maintenances"].pop(dev_id, None)
+
+    if op == "delete_user" and refs is not None:
+        managed = refs["managed"].pop(args["user_id"], set())
+        res_positions = refs["user_res"].pop(args["user_id"], set())
+        if reassign_to is not None:
+            refs["managed"].setdefault(reassign_to, set()).update(managed)
+            refs["user_res"].setdefault(reassign_to, set()).update(res_positions)
+
+
+# ---------- reverse indexes ----------
+
+def _maintenance_table(db: dict) -> dict:
+    """The TinyDB "maintenances" table stored in the same file (doc id -> document), if any."""
+    table = db.get("maintenances")
+    return table if isinstance(table, dict) else {}
+
+
+def _ref_add(refs: dict, pos: int, r: dict) -> None:
+    refs["user_res"].setdefault(str(r.get("user_id", "")), set()).add(pos)
+    refs["device_res"].setdefault(str(r.get("device_id", "")), set()).add(pos)
+
+
+def _ref_discard(refs: dict, pos: int, r: dict) -> None:
+    refs["user_res"].get(str(r.get("user_id", "")), set()).discard(pos)
+    refs["device_res"].get(str(r.get("device_id", "")), set()).discard(pos)
+
+
+def _references() -> dict:
+    """
+    Reverse indexes over the cached snapshot, so deletes find the rows referencing a user or device
+    without scanning: "managed" user id -> managed device ids, "user_res" / "device_res"
+    user / device id -> positions in db["reservations"], "maintenances" device id -> doc ids in the
+    maintenances table. Built with one scan on first use, then kept up to date by _update_indexes.
+    """
     db = _load_db()
-    res = db.get("reservations", [])
-    if not isinstance(res, list):
-        res = []
-
-    res.append(
-        {
-            "device_id": str(new_res.get("device_id", "")),
-            "user_id": str(new_res.get("user_id", "")),
-            "start": str(new_res.get("start", "")),
-            "end": str(new_res.get("end", "")),
+    if _cache["refs"] is None:
+        refs: Dict[str, Dict[str, set]] = {"managed": {}, "user_res": {}, "device_res": {}, "maintenances": {}}
+        for dev_id, d in db["devices"].items():
+            refs["managed"].setdefault(str(d.get("managed_by_user_id", "")), set()).add(dev_id)
+        for pos, r in enumerate(db["reservations"]):
+            _ref_add(refs, pos, r)
+        for doc_id, doc in _maintenance_table(db).items():
+            if isinstance(doc, dict):
+                refs["maintenances"].setdefault(str(doc.get("device_id")), set()).add(doc_id)
+        _cache["refs"] = refs
+    return _cache["refs"]
+
+
+# ---------- archive ----------
+# db["archive"] describes database.json.archive: "segments" (see archive.py) and the ids the numbers
+# in its records stand for, "devices" and "users" (None once deleted with cascade; reassign points
+# a number at the new id). The records themselves are never rewritten.
+
+def _archive_meta(db: dict) -> dict:
+    meta = db.get("archive")
+    return meta if isinstance(meta, dict) else {"segments": [], "devices": [], "users": []}
+
+
+def _numbers(ids: List[Optional[str]]) -> Dict[str, List[int]]:
+    """id -> the record numbers standing for it."""
+    out: Dict[str, List[int]] = {}
+    for no, item_id in enumerate(ids):
+        if item_id is not None:
+            out.setdefault(item_id, []).append(no)
+    return out
+
+
+def _archive() -> dict:
+    """
+    View of the archived reservations of the cached snapshot: "reader" (archive.ArchiveReader over
+    the mapped file), the id lists "devices" / "users" and their reverse maps "device_nos" /
+    "user_nos". Opened on first use, dropped whenever db["archive"] changes.
+    """
+    db = _load_db()
+    if _cache["archive"] is None:
+        meta = _archive_meta(db)
+        # copies: writers change the lists of db["archive"] in place, readers may still use this view
+        _cache["archive"] = {
+            "reader": archive.ArchiveReader(_archive_path(), list(meta["segments"])),
+            "devices": list(meta["devices"]),
+            "users": list(meta["users"]),
+            "device_nos": _numbers(meta["devices"]),
+            "user_nos": _numbers(meta["users"]),
         }
+    return _cache["archive"]
+
+
+def _archived_row(view: dict, rec: tuple) -> dict:
+    return {
+        "device_id": view["devices"][rec[0]],
+        "user_id": view["users"][rec[1]],
+        "start": format_minutes(rec[2]),
+        "end": format_minutes(rec[3]),
+    }
+
+
+def _archived_rows() -> Iterator[dict]:
+    view = _archive()
+    devices, users = view["devices"], view["users"]
+    for rec in view["reader"].all_records():
+        if devices[rec[0]] is not None and users[rec[1]] is not None:
+            yield _archived_row(view, rec)
+
+
+def _archived(
+    view: dict,
+    device_id: str,
+    lo: Optional[int] = None,
+    hi: Optional[int] = None,
+    descending: bool = False,
+    user_id: Optional[str] = None,
+) -> Iterator[Tuple[int, int, dict]]:
+    """Archived reservations (view: _archive()) of the device overlapping [lo, hi) as (start, end, row)
+    like the index items, ordered by start; the rows are built only for the items actually consumed."""
+    users = view["users"]
+    wanted = None if user_id is None else set(view["user_nos"].get(user_id, ()))
+    if wanted is not None and not wanted:
+        return
+    reader = view["reader"]
+    records = heapq.merge(
+        *(reader.device_records(no, lo, hi, descending) for no in view["device_nos"].get(device_id, ())),
+        key=itemgetter(2),
+        reverse=descending,
     )
-    db["reservations"] = res
-    _save_db(db)
+    for rec in records:
+        if users[rec[1]] is not None and (wanted is None or rec[1] in wanted):
+            yield rec[2], rec[3], _archived_row(view, rec)
 
 
-def update_device(device_id: str, managed_by_user_id: Optional[str] = None, is_active: Optional[bool] = None) -> None:
+def _archived_in_use(device_ids: Sequence[str] = (), user_id: Optional[str] = None) -> bool:
+    """Whether archived reservations of the devices or of the user are still visible."""
+    view = _archive()
+    reader, devices, users = view["reader"], view["devices"], view["users"]
+    for dev_id in device_ids:
+        for no in view["device_nos"].get(dev_id, ()):
+            if any(users[rec[1]] is not None for rec in reader.device_records(no)):
+                return True
+    wanted = set(view["user_nos"].get(user_id, ())) if user_id is not None else set()
+    # the records are ordered by device, a user's can be anywhere
+    return bool(wanted) and any(rec[1] in wanted and devices[rec[0]] is not None for rec in reader.all_records())
+
+
+def _archive_remap(kind: str, item_ids: Sequence[str], new_id: Optional[str]) -> List[list]:
+    """[[number, new id]] for every record number of the devices / users (journal argument)."""
+    nos = _archive()["device_nos" if kind == "devices" else "user_nos"]
+    return [[no, new_id] for item_id in item_ids for no in nos.get(item_id, ())]
+
+
+def _optional_args(**args: list) -> dict:
+    # only the non-empty ones: journal records of databases without archive or recurring
+    # reservations stay as they were
+    return {name: value for name, value in args.items() if value}
+
+
+def _rules_of(db: dict, field: str, ids: Sequence[str]) -> List[str]:
+    """Ids of the recurring reservations whose device_id / user_id is one of ids."""
+    return sorted(
+        rule_id for rule_id, rule in _recurring_table(db).items() if isinstance(rule, dict) and str(rule.get(field, "")) in ids
+    )
+
+
+@diagnostics.timed("queries.archive_reservations")
+def archive_reservations(before: datetime) -> int:
+    """
+    Move the reservations that ended at or before `before` out of database.json into the archive
+    (one new segment of database.json.archive) and return how many were moved. The records are
+    on disk before the journal record that removes the rows: after a crash in between nothing
+    references them and the next run overwrites them. Rows with unreadable times stay where they are.
+    """
+    horizon = to_minutes(before)
+    with _lock().write():
+        # the positions must stay valid until the record is journaled: with write-behind, changes
+        # of another process loaded by a later flush() would move the rows (see _commit)
+        flush()
+        db = _load_db()
+        view = _archive()
+        # ids archived before keep their (first) number, new ones are numbered after the known ones
+        numbers = {
+            "devices": {item_id: nos[0] for item_id, nos in view["device_nos"].items()},
+            "users": {item_id: nos[0] for item_id, nos in view["user_nos"].items()},
+        }
+        new: Dict[str, List[str]] = {"devices": [], "users": []}
+
+        def number(kind: str, item_id: str) -> int:
+            known = numbers[kind]
+            if item_id not in known:
+                known[item_id] = len(view[kind]) + len(new[kind])
+                new[kind].append(item_id)
+            return known[item_id]
+
+        records, chosen = [], set()
+        for dev_id, device_index in _reservation_index().items():
+            ended = [item for item in device_index.iter_range(None, horizon) if item[1] <= horizon]
+            if not ended:
+                continue
+            device = number("devices", dev_id)
+            for start, end, r in ended:
+                records.append((device, number("users", str(r.get("user_id", ""))), start, end))
+                chosen.add(id(r))
+        if not records:
+            return 0
+        positions = [pos for pos, r in enumerate(db["reservations"]) if id(r) in chosen]
+
+        data, segment = archive.pack_segment(records)
+        segment[archive.FIRST] = len(view["reader"])
+        archive.append_segment(_archive_path(), segment[archive.FIRST], data)
+        _commit("archive_reservations", positions=positions, segment=segment, devices=new["devices"], users=new["users"])
+        diagnostics.count_bytes("queries.archive_reservations", written=len(data))
+        return len(positions)
+
+
+def _archive_expired() -> None:
+    """Archive what ended more than ARCHIVE_AFTER_DAYS ago (compactions, under the write lock)."""
+    if ARCHIVE_AFTER_DAYS > 0:
+        archive_reservations(datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS))
+
+
+# ---------- recurring reservations ----------
+# db["recurring"]: rule id -> rule (device_id, user_id, start / end of the first occurrence, freq,
+# interval, until, count, exceptions; see recurrence.py). Occurrences are never stored: readers
+# expand them for the window they look at.
+
+def _recurring_table(db: dict) -> dict:
+    table = db.get("recurring")
+    return table if isinstance(table, dict) else {}
+
+
+def _recurring() -> Dict[str, List[Tuple[str, dict, Recurrence]]]:
+    """Per device the recurring reservations as (rule id, rule, Recurrence), built on first use.
+    Rules that can't be expanded (edited by hand) are left out."""
     db = _load_db()
-    devs = db.get("devices", {})
-    if not isinstance(devs, dict):
-        devs = {}
+    if _cache["rules"] is None:
+        rules: Dict[str, List[Tuple[str, dict, Recurrence]]] = {}
+        for rule_id, rule in _recurring_table(db).items():
+            try:
+                rec = Recurrence.from_rule(rule)
+            except (AttributeError, TypeError, ValueError):
+                continue
+            rules.setdefault(str(rule.get("device_id", "")), []).append((rule_id, rule, rec))
+        _cache["rules"] = rules
+    return _cache["rules"]
 
-    did = str(device_id)
-    if did not in devs or not isinstance(devs[did], dict):
-        devs[did] = {"device_name": f"Device {did}", "managed_by_user_id": "", "is_active": True}
 
-    if managed_by_user_id is not None:
-        devs[did]["managed_by_user_id"] = managed_by_user_id
-    if is_active is not None:
-        devs[did]["is_active"] = bool(is_active)
+def _rule_occurrences(
+    rule_id: str, rule: dict, rec: Recurrence, lo: Optional[int], hi: Optional[int], descending: bool
+) -> Iterator[Tuple[int, int, dict]]:
+    for start, end, _ in rec.occurrences(lo, hi, descending):
+        yield start, end, {
+            "device_id": str(rule.get("device_id", "")),
+            "user_id": str(rule.get("user_id", "")),
+            "start": format_minutes(start),
+            "end": format_minutes(end),
+            "recurring_id": rule_id,
+        }
+
+
+def _occurrences(
+    device_id: str,
+    lo: Optional[int] = None,
+    hi: Optional[int] = None,
+    descending: bool = False,
+    user_id: Optional[str] = None,
+    rules: Optional[Dict[str, List[Tuple[str, dict, Recurrence]]]] = None,
+) -> Iterator[Tuple[int, int, dict]]:
+    """Occurrences of the device's recurring reservations (rules: a _recurring() taken earlier)
+    overlapping [lo, hi) as (start, end, row) like the index items, ordered by start; a row names
+    its rule in "recurring_id"."""
+    parts = [
+        _rule_occurrences(rule_id, rule, rec, lo, hi, descending)
+        for rule_id, rule, rec in (_recurring() if rules is None else rules).get(device_id, ())
+        if user_id is None or str(rule.get("user_id", "")) == user_id
+    ]
+    return heapq.merge(*parts, key=itemgetter(0), reverse=descending)
 
-    db["devices"] = devs
-    _save_db(db)
+
+def _rule_is_free(device_id: str, rec: Recurrence, ignore: Optional[str] = None) -> bool:
+    """
+    Whether no occurrence of rec overlaps a reservation of the device (single or recurring, except
+    the rule `ignore`). Single bookings are only looked at within the span of the rule and checked
+    against it by arithmetic, other rules through Recurrence.overlaps: no occurrence list is built.
+    """
+    device_index = _reservation_index().get(device_id)
+    live = device_index.iter_range(rec.start, rec.end) if device_index is not None else ()
+    archived = _archived(_archive(), device_id, rec.start, rec.end)
+    if any(rec.overlaps_any(start, end) for start, end, _ in chain(live, archived)):
+        return False
+    return not any(rule_id != ignore and rec.overlaps(other) for rule_id, _, other in _recurring().get(device_id, ()))
+
+
+@_shared
+def get_recurring_reservations() -> List[dict]:
+    """The recurring reservations (rules, not occurrences) with their "id"."""
+    return [{"id": rule_id, **rule} for rules in _recurring().values() for rule_id, rule, _ in rules]
+
+
+@_shared
+def find_conflicts(device_id: str, start: datetime, end: datetime) -> List[dict]:
+    """Reservations of the device that overlap [start, end), ordered by start."""
+    lo, hi = to_minutes(start), to_minutes_ceil(end)
+    device_index = _reservation_index().get(str(device_id))
+    live = device_index.overlapping(lo, hi) if device_index is not None else []
+    merged = heapq.merge(
+        live, _archived(_archive(), str(device_id), lo, hi), _occurrences(str(device_id), lo, hi), key=itemgetter(0)
+    )
+    return [dict(r) for _, _, r in merged]
+
+
+@_shared
+def is_device_free(device_id: str, start: datetime, end: datetime) -> bool:
+    return _is_free(str(device_id), to_minutes(start), to_minutes_ceil(end))
+
+
+@_shared
+def find_free_slot(
+    duration: timedelta,
+    after: datetime,
+    device_id: Optional[str] = None,
+    work_start: time = WORK_DAY_START,
+    work_end: time = WORK_DAY_END,
+    workdays: Sequence[int] = WORK_DAYS,
+) -> Optional[dict]:
+    """
+    Earliest window of `duration` starting at or after `after` within working hours, on the given
+    device or (device_id None) on any active device: {"device_id", "start", "end"} or None.
+    ValueError if workdays isn't a non-empty selection of weekdays 0 (Monday) to 6.
+    """
+    check_workdays(workdays)
+    index = _reservation_index()
+    if device_id is not None:
+        device_ids = [str(device_id)]
+    else:
+        device_ids = [dev_id for dev_id, d in _load_db()["devices"].items() if d.get("is_active", True)]
+    lo = to_minutes(after)
+    view = _archive()
+
+    def busy_periods(dev_id: str) -> Iterator[Tuple[int, int]]:
+        live = index[dev_id].iter_range(lo) if dev_id in index else ()
+        for start, end, _ in heapq.merge(live, _archived(view, dev_id, lo), _occurrences(dev_id, lo), key=itemgetter(0)):
+            yield start, end
+
+    busy = {dev_id: busy_periods(dev_id) for dev_id in device_ids}
+    found = earliest_slot(busy, after, duration, work_start, work_end, workdays)
+    if found is None:
+        return None
+    dev_id, start = found
+    return {"device_id": dev_id, "start": start, "end": start + duration}
+
+
+@_shared
+def reservation_intervals() -> Dict[str, Tuple[List[int], List[int]]]:
+    """Per device the starts and ends of its reservations as epoch minutes, ordered by start
+    (input for columnar analytics, see utilization.py), archived and recurring ones included."""
+    intervals = {
+        dev_id: ([start for start, _, _ in device_index], [end for _, end, _ in device_index])
+        for dev_id, device_index in _reservation_index().items()
+    }
+    view = _archive()
+    devices, users = view["devices"], view["users"]
+    extra: Dict[str, List[Tuple[int, int]]] = {}
+    for device, user, start, end in view["reader"].all_records():
+        if devices[device] is not None and users[user] is not None:
+            extra.setdefault(devices[device], []).append((start, end))
+    # recurring ones end at their until / count, expanding them all is bounded
+    for dev_id, rules in _recurring().items():
+        for _, _, rec in rules:
+            extra.setdefault(dev_id, []).extend((start, end) for start, end, _ in rec.occurrences())
+    for dev_id, items in extra.items():
+        starts, ends = intervals.get(dev_id, ([], []))
+        items = sorted(items + list(zip(starts, ends)))
+        intervals[dev_id] = ([start for start, _ in items], [end for _, end in items])
+    return intervals
+
+
+def _deferred(bound: int, open_source: Callable[[], Iterator[tuple]]) -> Iterator[tuple]:
+    """
+    Source for heapq.merge that opens open_source() only when the merge gets to `bound` (no item
+    of it comes before that): a page of recent reservations never touches the archive.
+    The placeholder item it yields first has the payload None.
+    """
+    yield bound, bound, None
+    yield from open_source()
+
+
+def iter_reservations(
+    device_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    descending: bool = False,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> Iterator[dict]:
+    """
+    Reservations ordered by start time, filtered by device, user and time window
+    (reservations overlapping [start, end)), produced lazily one page at a time.
+    Per-device indexes (and the archive segments) are already sorted, so they are merged instead
+    of sorting everything. Occurrences of recurring reservations are expanded as the merge reaches them.
+    The reservations are those of the moment of the first next(): the sources are taken under the
+    shared lock, the merge runs without it.
+    """
+    lo = None if start is None else to_minutes(start)
+    hi = None if end is None else to_minutes_ceil(end)
+    user = None if user_id is None else str(user_id)
+    with _lock().read():
+        index = _reservation_index()
+        view = _archive()
+        rules = _recurring()
+        if device_id is not None:
+            device_ids = [str(device_id)]
+        else:
+            device_ids = list(dict.fromkeys(chain(index, view["device_nos"], rules)))
+        # copies of the index ranges: writers change the index lists in place
+        sources = [index[dev_id].snapshot_range(lo, hi, descending) for dev_id in device_ids if dev_id in index]
+    # the rule list and the archive view of this snapshot are replaced, not changed, by writers
+    sources += [_occurrences(dev_id, lo, hi, descending, user, rules) for dev_id in device_ids if dev_id in rules]
+    span = view["reader"].span()
+    if span is not None:
+        archived = [dev_id for dev_id in device_ids if dev_id in view["device_nos"]]
+
+        def open_archive() -> Iterator[tuple]:
+            parts = (_archived(view, dev_id, lo, hi, descending, user) for dev_id in archived)
+            return heapq.merge(*parts, key=itemgetter(0), reverse=descending)
+
+        sources.append(_deferred(span[1] if descending else span[0], open_archive))
+    merged = heapq.merge(*sources, key=itemgetter(0), reverse=descending)
+    rows = (r for _, _, r in merged if r is not None and (user is None or r.get("user_id") == user))
+    for r in islice(rows, offset, None if limit is None else offset + limit):
+        yield dict(r)
+
+
+def _reservation_args(r: dict) -> dict:
+    return {
+        "device_id": str(r.get("device_id", "")),
+        "user_id": str(r.get("user_id", "")),
+        "start": str(r.get("start", "")),
+        "end": str(r.get("end", "")),
+    }
+
+
+def _reject_conflicts(reservations: List[dict]) -> Callable[[dict], dict]:
+    """prepare() for _commit that raises ValueError if a reservation overlaps an existing one."""
+    def prepare(db: dict) -> dict:
+        for r in reservations:
+            start, end = parse_minutes(r["start"]), parse_minutes(r["end"])
+            if start is not None and end is not None and not _is_free(r["device_id"], start, end):
+                raise ValueError(CONFLICT_MESSAGE)
+        return {}
+
+    return prepare
+
+
+def insert_reservation(new_res: dict, check_conflicts: bool = False) -> None:
+    """With check_conflicts=True the insert fails with ValueError if the device is already booked
+    (checked atomically with the write, unlike a separate is_device_free call)."""
+    args = _reservation_args(new_res)
+    _commit("insert_reservation", _reject_conflicts([args]) if check_conflicts else None, **args)
+
+
+def insert_reservations(new_reservations: List[dict], check_conflicts: bool = False) -> None:
+    """Insert several reservations with a single journal record (one write for the whole batch)."""
+    if not new_reservations:
+        return
+    rows = [_reservation_args(r) for r in new_reservations]
+    _commit("insert_reservations", _reject_conflicts(rows) if check_conflicts else None, reservations=rows)
+
+
+def _recurring_args(rule: dict) -> dict:
+    return {
+        "device_id": str(rule.get("device_id", "")),
+        "user_id": str(rule.get("user_id", "")),
+        "start": str(rule.get("start", "")),
+        "end": str(rule.get("end", "")),
+        "freq": rule.get("freq", "weekly"),
+        "interval": rule.get("interval", 1),
+        "until": None if rule.get("until") is None else str(rule["until"])[:10],
+        "count": rule.get("count"),
+        "exceptions": sorted({str(day)[:10] for day in rule.get("exceptions") or ()}),
+    }
+
+
+def add_recurring_reservation(rule: dict, check_conflicts: bool = False) -> None:
+    """
+    Store a recurring reservation as one rule: "device_id", "user_id", "start" / "end" of the first
+    occurrence, "freq" ("daily", "weekly" or "interval"), "interval" (days / weeks / minutes between
+    occurrences, default 1), "until" (last day) and / or "count", "exceptions" (days to skip).
+    ValueError if the rule is invalid or has no occurrence or, with check_conflicts=True, an occurrence overlaps a
+    reservation of the device (checked atomically with the write).
+    """
+    args = _recurring_args(rule)
+    rec = Recurrence.from_rule(args)
+    if not len(rec):
+        raise ValueError(EMPTY_RULE_MESSAGE)
+
+    def prepare(db: dict) -> dict:
+        if check_conflicts and not _rule_is_free(args["device_id"], rec):
+            raise ValueError(CONFLICT_MESSAGE)
+        # chosen here and journaled, like device ids
+        return {"rule_id": str(max([int(k) for k in _recurring_table(db).keys()] + [0]) + 1)}
+
+    _commit("add_recurring", prepare, rule=args)
+
+
+def skip_recurring_occurrence(rule_id: str, day: date) -> None:
+    """Cancel the occurrences of a recurring reservation on one day (adds it to the exceptions)."""
+    _commit("skip_recurring", rule_id=str(rule_id), day=day.isoformat())
+
+
+def delete_recurring_reservation(rule_id: str) -> None:
+    _commit("delete_recurring", rule_id=str(rule_id))
+
+
+def update_device(device_id: str, managed_by_user_id: Optional[str] = None, is_active: Optional[bool] = None) -> None:
+    _commit("update_device", device_id=str(device_id), managed_by_user_id=managed_by_user_id, is_active=is_active)
 
 def add_user(user_id: str, name: str) -> None:
-    db = _load_db()
-    users = db.get("users", {})
-    users[str(user_id)] = {"name": name}
-    db["users"] = users
-    _save_db(db)
+    _commit("add_user", user_id=str(user_id), name=name)
 
 
-def delete_user(user_id: str) -> None:
-    db = _load_db()
-    users = db.get("users", {})
-    users.pop(str(user_id), None)
-    db["users"] = users
-    _save_db(db)
+def _check_policy(policy: str, reassign_to: Optional[str]) -> None:
+    if policy not in DELETE_POLICIES:
+        raise ValueError(f"Unknown delete policy {policy!r} (expected one of {', '.join(DELETE_POLICIES)})")
+    if policy == "reassign" and not reassign_to:
+        raise ValueError(REASSIGN_TARGET_MESSAGE)
+
+
+def delete_user(user_id: str, policy: str = "restrict", reassign_to: Optional[str] = None) -> None:
+    """
+    Delete a user together with what references them, in one journal record:
+    "restrict" (the default) raises ValueError while anything still references the user,
+    "cascade" also deletes their reservations and the devices they manage (with the reservations
+    and maintenance records of those devices), "reassign" hands devices and reservations over to
+    the user reassign_to.
+    The rows are found through reverse indexes, so the cost grows with their number only.
+    """
+    user_id = str(user_id)
+    _check_policy(policy, reassign_to)
+
+    def affected(db: dict) -> dict:
+        refs = _references()
+        devices = sorted(refs["managed"].get(user_id, ()))
+        reservations = set(refs["user_res"].get(user_id, ()))
+        rules = _rules_of(db, "user_id", [user_id])
+        if policy == "restrict":
+            if devices or reservations or rules or _archived_in_use(user_id=user_id):
+                raise ValueError(USER_IN_USE_MESSAGE)
+            return {}
+        if policy == "reassign":
+            if str(reassign_to) not in db["users"] or str(reassign_to) == user_id:
+                raise ValueError(REASSIGN_TARGET_MESSAGE)
+            return {
+                "reassign_to": str(reassign_to),
+                "devices": devices,
+                "reservations": sorted(reservations),
+                **_optional_args(
+                    archive_users=_archive_remap("users", [user_id], str(reassign_to)),
+                    recurring=rules,
+                ),
+            }
+
+        maintenances: List[str] = []
+        for dev_id in devices:
+            reservations.update(refs["device_res"].get(dev_id, ()))
+            maintenances.extend(sorted(refs["maintenances"].get(dev_id, ())))
+        return {
+            "devices": devices,
+            "reservations": sorted(reservations),
+            "maintenances": maintenances,
+            **_optional_args(
+                archive_users=_archive_remap("users", [user_id], None),
+                archive_devices=_archive_remap("devices", devices, None),
+                recurring=sorted(set(rules) | set(_rules_of(db, "device_id", devices))),
+            ),
+        }
+
+    _commit("delete_user", affected, user_id=user_id)
 
 def add_device(device_name: str, managed_by_user_id: str) -> None:
+    def new_id(db: dict) -> dict:
+        # the id is chosen here and journaled, so replaying the record gives the same id
+        return {"device_id": str(max([int(k) for k in db["devices"].keys()] + [0]) + 1)}
+
+    _commit("add_device", new_id, device_name=device_name, managed_by_user_id=managed_by_user_id)
+
+
+def delete_device(device_id: str, policy: str = "restrict", reassign_to: Optional[str] = None) -> None:
+    """
+    Delete a device together with what references it, in one journal record:
+    "restrict" (the default) raises ValueError while the device still has reservations or
+    maintenance records, "cascade" also deletes them, "reassign" moves them to the device
+    reassign_to (ValueError if a reservation overlaps one there).
+    """
+    device_id = str(device_id)
+    _check_policy(policy, reassign_to)
+
+    def affected(db: dict) -> dict:
+        refs = _references()
+        reservations = sorted(refs["device_res"].get(device_id, ()))
+        maintenances = sorted(refs["maintenances"].get(device_id, ()))
+        rules = _rules_of(db, "device_id", [device_id])
+        if policy == "restrict":
+            if reservations or maintenances or rules or _archived_in_use(device_ids=[device_id]):
+                raise ValueError(DEVICE_IN_USE_MESSAGE)
+            return {}
+        if policy == "reassign":
+            target_id = str(reassign_to)
+            if target_id not in db["devices"] or target_id == device_id:
+                raise ValueError(REASSIGN_TARGET_MESSAGE)
+            for pos in reservations:
+                r = db["reservations"][pos]
+                start, end = parse_minutes(r.get("start")), parse_minutes(r.get("end"))
+                if start is not None and end is not None and not _is_free(target_id, start, end):
+                    raise ValueError(CONFLICT_MESSAGE)
+            for start, end, _ in _archived(_archive(), device_id):
+                if not _is_free(target_id, start, end):
+                    raise ValueError(CONFLICT_MESSAGE)
+            for _, _, rec in _recurring().get(device_id, ()):
+                if not _rule_is_free(target_id, rec):
+                    raise ValueError(CONFLICT_MESSAGE)
+            return {
+                "reassign_to": target_id,
+                "reservations": reservations,
+                "maintenances": maintenances,
+                **_optional_args(archive_devices=_archive_remap("devices", [device_id], target_id), recurring=rules),
+            }
+        return {
+            "reservations": reservations,
+            "maintenances": maintenances,
+            **_optional_args(archive_devices=_archive_remap("devices", [device_id], None), recurring=rules),
+        }
+
+    _commit("delete_device", affected, device_id=device_id)
+
+
+# ---------- TinyDB tables ----------
+# The TinyDB models (database_inheritance.SharedStorage) keep their tables in the same snapshot,
+# so both APIs share one parse of the file and one writer: every TinyDB write is a journal record.
+
+def _table_key(name: str) -> str:
+    return TABLE_KEY_PREFIX + name if name in _OWN_KEYS else name
+
+
+def _table_name(key: str) -> Optional[str]:
+    """Inverse of _table_key; None for the keys of this module."""
+    if key in _OWN_KEYS:
+        return None
+    if key.startswith(TABLE_KEY_PREFIX) and key[len(TABLE_KEY_PREFIX):] in _OWN_KEYS:
+        return key[len(TABLE_KEY_PREFIX):]
+    return key
+
+
+@_shared
+def read_tables() -> Tuple[int, Dict[str, dict]]:
+    """
+    The TinyDB tables (table name -> doc id -> stored document) together with the version of the
+    snapshot they belong to. The tables are the cached snapshot itself and must not be modified.
+    """
     db = _load_db()
-    devices = db.get("devices", {})
-    new_id = str(max([int(k) for k in devices.keys()] + [0]) + 1)
+    tables = {}
+    for key, value in db.items():
+        name = _table_name(key)
+        if name is not None and isinstance(value, dict):
+            tables[name] = value
+    return _cache["version"], tables
+
+
+def write_tables(tables: Dict[str, dict]) -> None:
+    """
+    Store the complete new contents of TinyDB tables (name -> doc id -> document, JSON-ready).
+    Only the documents that differ from the snapshot are journaled, in one record for all tables;
+    if none differs nothing is written.
+    """
+    def diff(db: dict) -> dict:
+        changes = {}
+        for name, docs in tables.items():
+            old = db.get(_table_key(name))
+            old = old if isinstance(old, dict) else {}
+            upsert = {doc_id: doc for doc_id, doc in docs.items() if old.get(doc_id) != doc}
+            remove = [doc_id for doc_id in old if doc_id not in docs]
+            if upsert or remove or _table_key(name) not in db:
+                changes[name] = {"upsert": upsert, "remove": remove}
+        return {"changes": changes}
+
+    _commit("write_tables", diff)
+
+
+# ---------- journal operations ----------
+# Each operation applies one journaled mutation to a database dict.
+# They are used both for live writes and for replaying the journal on load.
+
+def _op_insert_reservation(db: dict, device_id: str, user_id: str, start: str, end: str) -> None:
+    db["reservations"].append({"device_id": device_id, "user_id": user_id, "start": start, "end": end})
+
+
+def _op_insert_reservations(db: dict, reservations: List[dict]) -> None:
+    db["reservations"].extend(dict(r) for r in reservations)
+
+
+def _op_update_device(db: dict, device_id: str, managed_by_user_id: Optional[str], is_active: Optional[bool]) -> Optional[str]:
+    devs = db["devices"]
+    previous = devs[device_id].get("managed_by_user_id", "") if device_id in devs else None
+    if device_id not in devs:
+        devs[device_id] = {"device_name": f"Device {device_id}", "managed_by_user_id": "", "is_active": True}
+
+    if managed_by_user_id is not None:
+        devs[device_id]["managed_by_user_id"] = managed_by_user_id
+    if is_active is not None:
+        devs[device_id]["is_active"] = bool(is_active)
+    return previous
+
+
+def _op_add_user(db: dict, user_id: str, name: str) -> None:
+    db["users"][user_id] = {"name": name}
 
-    devices[new_id] = {
+
+def _remove_reservations(db: dict, positions: List[int]) -> Tuple[List[tuple], List[tuple]]:
+    """
+    Remove the reservations at the given positions in O(1) each: the last row moves into the gap
+    (the order of db["reservations"] carries no meaning, readers order by time).
+    Returns [(position, removed row)] and [(old position, new position, moved row)] for the indexes.
+    """
+    rows = db["reservations"]
+    removed, moved = [], []
+    # from the back, so the row moved into a gap is never one that is removed later
+    for pos in sorted(set(positions), reverse=True):
+        if pos >= len(rows):
+            continue
+        last = rows.pop()
+        if pos == len(rows):
+            removed.append((pos, last))
+        else:
+            removed.append((pos, rows[pos]))
+            rows[pos] = last
+            moved.append((len(rows), pos, last))
+    return removed, moved
+
+
+def _remove_maintenances(db: dict, doc_ids: List[str]) -> None:
+    table = _maintenance_table(db)
+    for doc_id in doc_ids:
+        table.pop(doc_id, None)
+
+
+def _op_delete_user(
+    db: dict,
+    user_id: str,
+    reassign_to: Optional[str] = None,
+    devices: List[str] = (),
+    reservations: List[int] = (),
+    maintenances: List[str] = (),
+    archive_users: List[list] = (),
+    archive_devices: List[list] = (),
+    recurring: List[str] = (),
+) -> dict:
+    """devices / reservations / maintenances / recurring: the rows referencing the user (found by
+    delete_user); they are handed over to reassign_to or deleted.
+    archive_*: [[number, new id or None]] for db["archive"]."""
+    db["users"].pop(user_id, None)
+    _remap_archive(db, "users", archive_users)
+    _remap_archive(db, "devices", archive_devices)
+    _reassign_rules(db, recurring, "user_id", reassign_to)
+    if reassign_to is not None:
+        for dev_id in devices:
+            if dev_id in db["devices"]:
+                db["devices"][dev_id]["managed_by_user_id"] = reassign_to
+        for pos in reservations:
+            db["reservations"][pos]["user_id"] = reassign_to
+        return {}
+
+    for dev_id in devices:
+        db["devices"].pop(dev_id, None)
+    _remove_maintenances(db, maintenances)
+    removed, moved = _remove_reservations(db, reservations)
+    return {"removed": removed, "moved": moved, "devices": list(devices)}
+
+
+def _op_add_device(db: dict, device_id: str, device_name: str, managed_by_user_id: str) -> None:
+    db["devices"][device_id] = {
         "device_name": device_name,
         "managed_by_user_id": managed_by_user_id,
         "is_active": True
     }
-    db["devices"] = devices
-    _save_db(db)
 
 
-def delete_device(device_id: str) -> None:
-    db = _load_db()
-    devices = db.get("devices", {})
-    devices.pop(str(device_id), None)
-    db["devices"] = devices
-    _save_db(db)
+def _op_delete_device(
+    db: dict,
+    device_id: str,
+    reassign_to: Optional[str] = None,
+    reservations: List[int] = (),
+    maintenances: List[str] = (),
+    archive_devices: List[list] = (),
+    recurring: List[str] = (),
+) -> dict:
+    """reservations / maintenances / recurring: the rows referencing the device (found by
+    delete_device); they are moved to the device reassign_to or deleted.
+    archive_devices: see _op_delete_user."""
+    device = db["devices"].pop(device_id, None)
+    _remap_archive(db, "devices", archive_devices)
+    _reassign_rules(db, recurring, "device_id", reassign_to)
+    if reassign_to is not None:
+        for pos in reservations:
+            db["reservations"][pos]["device_id"] = reassign_to
+        table = _maintenance_table(db)
+        for doc_id in maintenances:
+            if doc_id in table:
+                table[doc_id]["device_id"] = reassign_to
+        return {"device": device}
+
+    _remove_maintenances(db, maintenances)
+    removed, moved = _remove_reservations(db, reservations)
+    return {"device": device, "removed": removed, "moved": moved}
+
+
+def _reassign_rules(db: dict, rule_ids: List[str], field: str, reassign_to: Optional[str]) -> None:
+    """Hand the recurring reservations over to reassign_to, or delete them (None)."""
+    table = _recurring_table(db)
+    for rule_id in rule_ids:
+        if reassign_to is None:
+            table.pop(rule_id, None)
+        elif rule_id in table:
+            table[rule_id][field] = reassign_to
+
+
+def _op_add_recurring(db: dict, rule_id: str, rule: dict) -> None:
+    if not isinstance(db.get("recurring"), dict):
+        db["recurring"] = {}
+    db["recurring"][rule_id] = dict(rule)
+
+
+def _op_skip_recurring(db: dict, rule_id: str, day: str) -> None:
+    rule = _recurring_table(db).get(rule_id)
+    if isinstance(rule, dict):
+        rule["exceptions"] = sorted(set(rule.get("exceptions") or ()) | {day})
+
+
+def _op_delete_recurring(db: dict, rule_id: str) -> None:
+    _recurring_table(db).pop(rule_id, None)
+
+
+def _remap_archive(db: dict, kind: str, pairs: List[list]) -> None:
+    ids = _archive_meta(db)[kind]
+    for no, new_id in pairs:
+        ids[no] = new_id
+
+
+def _op_archive_reservations(db: dict, positions: List[int], segment: List[int], devices: List[str], users: List[str]) -> None:
+    """segment: the records archive_reservations appended to database.json.archive for the rows at
+    positions; devices / users: ids that got the next record numbers."""
+    if not isinstance(db.get("archive"), dict):
+        db["archive"] = _archive_meta(db)
+    meta = db["archive"]
+    meta["segments"].append(segment)
+    meta["devices"].extend(devices)
+    meta["users"].extend(users)
+    # keeps the order of the remaining rows; the indexes are rebuilt anyway (see _update_indexes)
+    gone = set(positions)
+    rows = db["reservations"]
+    rows[:] = [r for pos, r in enumerate(rows) if pos not in gone]
+
+
+def _op_write_tables(db: dict, changes: Dict[str, dict]) -> Dict[str, List[tuple]]:
+    """Returns the replaced documents per table as [(doc id, old or None, new or None)] for the indexes."""
+    replaced = {}
+    for name, change in changes.items():
+        key = _table_key(name)
+        if not isinstance(db.get(key), dict):
+            db[key] = {}
+        table = db[key]
+        rows = replaced[name] = []
+        for doc_id in change["remove"]:
+            rows.append((doc_id, table.pop(doc_id, None), None))
+        for doc_id, doc in change["upsert"].items():
+            rows.append((doc_id, table.get(doc_id), doc))
+            table[doc_id] = doc
+    return replaced
+
+
+_OPS = {
+    "insert_reservation": _op_insert_reservation,
+    "insert_reservations": _op_insert_reservations,
+    "update_device": _op_update_device,
+    "add_user": _op_add_user,
+    "delete_user": _op_delete_user,
+    "add_device": _op_add_device,
+    "delete_device": _op_delete_device,
+    "write_tables": _op_write_tables,
+    "archive_reservations": _op_archive_reservations,
+    "add_recurring": _op_add_recurring,
+    "skip_recurring": _op_skip_recurring,
+    "delete_recurring": _op_delete_recurring,
+}
+
+
+# ---------- backend selection ----------
+# Public functions that every storage backend implements with the same signatures.
+BACKEND_API = (
+    "db_version",
+    "get_users",
+    "get_devices",
+    "find_devices",
+    "list_reservations",
+    "iter_reservations",
+    "find_conflicts",
+    "is_device_free",
+    "find_free_slot",
+    "reservation_intervals",
+    "insert_reservation",
+    "insert_reservations",
+    "update_device",
+    "add_user",
+    "delete_user",
+    "add_device",
+    "delete_device",
+)
+
+if DB_BACKEND == "sqlite":
+    import sqlite_backend
+
+    globals().update({name: getattr(sqlite_backend, name) for name in BACKEND_API})
+elif DB_BACKEND != "json":
+    raise ValueError(f"Unknown CASE_STUDY_DB_BACKEND {DB_BACKEND!r} (expected 'json' or 'sqlite')")
+
+
+# ---------- memoization ----------
+# Results are shared between callers (and Streamlit sessions) until db_version() changes,
+# so they must be treated as read-only. Only results of the current version are kept (all of them
+# go with the first call after a change), at most MEMO_SIZE, the least recently used go first.
+MEMO_SIZE = 256
+_memo: "OrderedDict[tuple, Any]" = OrderedDict()
+_memo_state: Dict[str, Any] = {"version": None, "lock": threading.Lock()}
+
+
+def memoized(func):
+    """Cache func(*args) until the next change of db_version()."""
+    @functools.wraps(func)
+    def wrapper(*args):
+        version = db_version()
+        key = (func.__module__, func.__qualname__, args)
+        with _memo_state["lock"]:
+            if _memo_state["version"] != version:
+                _memo.clear()
+                _memo_state["version"] = version
+            elif key in _memo:
+                _memo.move_to_end(key)
+                return _memo[key]
+        result = func(*args)
+        with _memo_state["lock"]:
+            # not if the data changed meanwhile: the result may belong to either version
+            if _memo_state["version"] == version:
+                _memo[key] = result
+                if len(_memo) > MEMO_SIZE:
+                    _memo.popitem(last=False)
+        return result
+
+    return wrapper
+
+
+MEMOIZED_API = ("get_users", "get_devices", "find_devices", "list_reservations")
+globals().update({name: memoized(globals()[name]) for name in MEMOIZED_API})
+
+# ---------- diagnostics ----------
+# outermost wrapper, so memo hits are measured as well
+globals().update({name: diagnostics.timed(f"queries.{name}")(globals()[name]) for name in BACKEND_API})
@@ -0,0 +1,122 @@
+"""
+Recurring reservations: one stored rule instead of one row per occurrence.
+A rule repeats a reservation every `interval` days ("daily"), weeks ("weekly") or minutes
+("interval") until a day and / or for a number of occurrences, minus exception days.
+Times are epoch minutes (wall clock, see epoch_minutes), so a rule is the arithmetic progression
+start + k * period: occurrences are produced lazily for the window asked for, and overlap checks
+work on the progression instead of a list of occurrences.
+"""
+from datetime import date, datetime
+from math import gcd
+from typing import Any, FrozenSet, Iterator, Optional, Tuple
+
+from epoch_minutes import parse_minutes, to_minutes
+
+# minutes per interval step
+FREQUENCIES = {"daily": 1440, "weekly": 7 * 1440, "interval": 1}
+
+INVALID_RULE_MESSAGE = "Ungültige Serie"
+UNBOUNDED_RULE_MESSAGE = "Serie braucht ein Enddatum oder eine Anzahl"
+OVERLAPPING_RULE_MESSAGE = "Termine einer Serie dürfen sich nicht überschneiden"
+EMPTY_RULE_MESSAGE = "Serie hat keinen Termin"
+
+
+def _day_minutes(value: Any) -> Optional[int]:
+    """ISO date (or datetime) string -> epoch minutes of the start of that day."""
+    try:
+        return to_minutes(datetime.combine(date.fromisoformat(str(value)[:10]), datetime.min.time()))
+    except ValueError:
+        return None
+
+
+class Recurrence:
+    """The occurrences of one rule: [start + k * period, start + k * period + length) for k in
+    range(count) except the k in skipped."""
+
+    __slots__ = ("start", "length", "period", "count", "skipped")
+
+    def __init__(self, start: int, length: int, period: int, count: int, skipped: FrozenSet[int] = frozenset()) -> None:
+        self.start = start
+        self.length = length
+        self.period = period
+        self.count = count
+        self.skipped = skipped
+
+    @classmethod
+    def from_rule(cls, rule: dict) -> "Recurrence":
+        """Raises ValueError (with a message for the UI) if the rule can't be expanded."""
+        start, end = parse_minutes(rule.get("start")), parse_minutes(rule.get("end"))
+        step = FREQUENCIES.get(rule.get("freq"))
+        interval = rule.get("interval", 1)
+        if start is None or end is None or end <= start or step is None or not isinstance(interval, int) or interval < 1:
+            raise ValueError(INVALID_RULE_MESSAGE)
+        period = step * interval
+        if end - start > period:
+            raise ValueError(OVERLAPPING_RULE_MESSAGE)
+
+        count, until = rule.get("count"), rule.get("until")
+        if count is None and until is None:
+            raise ValueError(UNBOUNDED_RULE_MESSAGE)
+        limit = count if isinstance(count, int) and count >= 0 else None
+        if count is not None and limit is None:
+            raise ValueError(INVALID_RULE_MESSAGE)
+        if until is not None:
+            until_day = _day_minutes(until)
+            if until_day is None:
+                raise ValueError(INVALID_RULE_MESSAGE)
+            # occurrences starting on the until day are included
+            by_date = max(0, -((start - until_day - 1440) // period))
+            limit = by_date if limit is None else min(limit, by_date)
+
+        rec = cls(start, end - start, period, limit)
+        skipped = set()
+        for day in rule.get("exceptions") or ():
+            day_start = _day_minutes(day)
+            if day_start is None:
+                raise ValueError(INVALID_RULE_MESSAGE)
+            # every occurrence starting on that day
+            first = max(0, -((start - day_start) // period))
+            skipped.update(range(first, min(rec.count, -((start - day_start - 1440) // period))))
+        rec.skipped = frozenset(skipped)
+        return rec
+
+    def __len__(self) -> int:
+        return self.count - len(self.skipped)
+
+    @property
+    def end(self) -> int:
+        """End of the last occurrence (the start if there are none)."""
+        return self.start + (self.count - 1) * self.period + self.length if self.count else self.start
+
+    def _k_range(self, lo: Optional[int], hi: Optional[int]) -> range:
+        """The k whose occurrence overlaps [lo, hi) (None: open end), skipped ones included."""
+        first = 0 if lo is None else max(0, (lo - self.length - self.start) // self.period + 1)
+        stop = self.count if hi is None else min(self.count, max(0, -((self.start - hi) // self.period)))
+        return range(first, stop)
+
+    def occurrences(self, lo: Optional[int] = None, hi: Optional[int] = None, reverse: bool = False) -> Iterator[Tuple[int, int, int]]:
+        """(start, end, k) of the occurrences overlapping [lo, hi) lazily in start order."""
+        ks = self._k_range(lo, hi)
+        for k in reversed(ks) if reverse else ks:
+            if k not in self.skipped:
+                start = self.start + k * self.period
+                yield start, start + self.length, k
+
+    def overlaps_any(self, lo: int, hi: int) -> bool:
+        # at most len(skipped) + 1 steps, whatever the window
+        return next(self.occurrences(lo, hi), None) is not None
+
+    def overlaps(self, other: "Recurrence") -> bool:
+        """Whether an occurrence of self overlaps one of other."""
+        lo, hi = max(self.start, other.start), min(self.end, other.end)
+        if lo >= hi or not len(self) or not len(other):
+            return False
+        # start differences of the two progressions are all congruent modulo gcd of the periods:
+        # if none of them can fall into (-other.length, self.length), the rules never meet
+        g = gcd(self.period, other.period)
+        offset = (other.start - self.start) % g
+        if offset >= self.length and offset <= g - other.length:
+            return False
+        # otherwise walk the rule with fewer occurrences in the common window, checking the other by arithmetic
+        sparse, dense = (self, other) if len(self._k_range(lo, hi)) <= len(other._k_range(lo, hi)) else (other, self)
+        return any(dense.overlaps_any(start, end) for start, end, _ in sparse.occurrences(lo, hi))
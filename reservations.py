@@ -1,5 +1,6 @@
 import uuid
-from datetime import date
+from datetime import date, datetime, time
+from typing import List
 import queries
 
 
@@ -12,24 +13,13 @@ class Reservation:
         self.end_date = end_date      
 
 
-def _overlaps(start_a: date, end_a: date, start_b: date, end_b: date) -> bool:
-    return start_a < end_b and start_b < end_a
+def _as_datetime(d: date) -> datetime:
+    # plain dates mean "from midnight"; datetimes (a date subclass) are kept as they are
+    return d if isinstance(d, datetime) else datetime.combine(d, time())
 
 
 def is_device_available(device_id: str, start_date: date, end_date: date) -> bool:
-    reservations = queries.list_reservations()
-
-    for r in reservations:
-        if r.get("device_id") != device_id:
-            continue
-
-        existing_start = date.fromisoformat(r["start_date"])
-        existing_end = date.fromisoformat(r["end_date"])
-
-        if _overlaps(start_date, end_date, existing_start, existing_end):
-            return False
-
-    return True
+    return queries.is_device_free(str(device_id), _as_datetime(start_date), _as_datetime(end_date))
 
 
 def create_reservation(device_id, user_email, start_date: date, end_date: date):
@@ -37,7 +27,7 @@ def create_reservation(device_id, user_email, start_date: date, end_date: date):
         raise ValueError("Startdatum muss vor dem Enddatum liegen")
 
     if not is_device_available(device_id, start_date, end_date):
-        raise ValueError("Gerät ist in diesem Zeitraum bereits reserviert")
+        raise ValueError(queries.CONFLICT_MESSAGE)
 
     reservation = Reservation(
         reservation_id=str(uuid.uuid4()),
@@ -47,10 +37,104 @@ def create_reservation(device_id, user_email, start_date: date, end_date: date):
         end_date=end_date.isoformat(),
     )
 
-    queries.insert_reservation(reservation.__dict__)
+    queries.insert_reservation(
+        {
+            "device_id": str(device_id),
+            "user_id": str(user_email),
+            "start": _as_datetime(start_date).isoformat(timespec="minutes"),
+            "end": _as_datetime(end_date).isoformat(timespec="minutes"),
+        },
+        # re-checked atomically with the write, another session may have booked in the meantime
+        check_conflicts=True,
+    )
     return reservation
 
 
+def create_reservations_batch(items: List[dict], all_or_nothing: bool = False) -> List[dict]:
+    """
+    Book many reservations at once, e.g. recurring lab slots.
+    Each item is a dict with the arguments of create_reservation
+    (device_id, user_email, start_date, end_date).
+
+    The batch is checked against existing bookings and against itself: items are swept
+    per device in start order, so of two overlapping items the earlier one wins.
+    Everything accepted is persisted with a single write. Items that another session booked over
+    between the check and the write are rejected as well, the rest is written.
+    With all_or_nothing=True a single rejected item rejects the whole batch.
+
+    Returns one dict per item, in input order:
+    {"index": i, "accepted": bool, "reason": str | None, "reservation": Reservation | None}
+    """
+    results = [{"index": i, "accepted": False, "reason": None, "reservation": None} for i in range(len(items))]
+
+    candidates = []
+    for i, item in enumerate(items):
+        start, end = _as_datetime(item["start_date"]), _as_datetime(item["end_date"])
+        if start >= end:
+            results[i]["reason"] = "Startdatum muss vor dem Enddatum liegen"
+        else:
+            candidates.append((str(item["device_id"]), start, end, i))
+
+    # sweep: per device in start order, remembering how far accepted items of the batch reach
+    candidates.sort()
+    accepted = []
+    last_device, reach, reach_index = None, None, None
+    for device_id, start, end, i in candidates:
+        if device_id != last_device:
+            last_device, reach, reach_index = device_id, None, None
+
+        if reach is not None and start < reach:
+            results[i]["reason"] = f"Überschneidung mit Eintrag {reach_index} dieses Stapels"
+        elif not queries.is_device_free(device_id, start, end):
+            results[i]["reason"] = queries.CONFLICT_MESSAGE
+        else:
+            accepted.append((device_id, start, end, i))
+            if reach is None or end > reach:
+                reach, reach_index = end, i
+
+    if all_or_nothing and len(accepted) < len(items):
+        for _, _, _, i in accepted:
+            results[i]["reason"] = "Stapel wegen abgelehnter Einträge verworfen"
+        return results
+
+    accepted.sort(key=lambda a: a[3])
+    while accepted:
+        rows = [
+            {
+                "device_id": device_id,
+                "user_id": str(items[i]["user_email"]),
+                "start": start.isoformat(timespec="minutes"),
+                "end": end.isoformat(timespec="minutes"),
+            }
+            for device_id, start, end, i in accepted
+        ]
+        try:
+            queries.insert_reservations(rows, check_conflicts=True)
+            break
+        except ValueError:
+            # another session booked after the sweep looked: reject what overlaps now and try the rest
+            lost = [a for a in accepted if not queries.is_device_free(a[0], a[1], a[2])]
+            for _, _, _, i in lost:
+                results[i]["reason"] = queries.CONFLICT_MESSAGE
+            if all_or_nothing and lost:
+                for _, _, _, i in accepted:
+                    results[i]["reason"] = results[i]["reason"] or "Stapel wegen abgelehnter Einträge verworfen"
+                return results
+            accepted = [a for a in accepted if a not in lost]
+
+    for device_id, start, end, i in accepted:
+        item = items[i]
+        results[i]["accepted"] = True
+        results[i]["reservation"] = Reservation(
+            reservation_id=str(uuid.uuid4()),
+            device_id=item["device_id"],
+            user_email=item["user_email"],
+            start_date=item["start_date"].isoformat(),
+            end_date=item["end_date"].isoformat(),
+        )
+    return results
+
+
 def list_reservations():
     return queries.list_reservations()
 
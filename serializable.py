@@ -1,10 +1,25 @@
 from abc import ABC, abstractmethod
-from datetime import datetime
+from datetime import datetime, date, time
 from tinydb import Query
 from typing import Self
 
+import diagnostics
+import queries
+
+# Values of these types are stored as they are (the serializer middleware takes care of dates)
+_PLAIN_TYPES = frozenset({str, int, float, bool, type(None), datetime, date, time})
+_MISSING = object()
+
 class Serializable(ABC):
+    # Subclasses declare their own fields as __slots__ in assignment order; together they form
+    # the field plan that store_data turns into the stored document
+    __slots__ = ("id", "creation_date", "last_update")
+
     db_connector =  None
+    # Attributes with an in-memory hash index for find_by_attribute, declared by subclasses.
+    # The index maps attribute -> value -> doc ids for one version of the database (queries.db_version):
+    # store_data/delete keep it up to date, any other change (queries.py, other processes) rebuilds it.
+    indexed_attributes: tuple[str, ...] = ()
 
     def __init__(self, id, creation_date: datetime = None, last_update: datetime = None) -> None:
         self.id = id
@@ -16,32 +31,127 @@ class Serializable(ABC):
     def instantiate_from_dict(cls, data: dict) -> Self:
         pass
 
+    @diagnostics.timed("Serializable.store_data")
     def store_data(self):
         print("Storing data...")
         self.last_update = datetime.now()
 
         query = Query()
+        data = self._to_document()
+        version = queries.db_version()
         # upsert: https://tinydb.readthedocs.io/en/latest/usage.html#upserting-data
-        result = self.db_connector.upsert(self.__to_dict(), query.id == self.id)
-        if result:
+        doc_ids = self.db_connector.upsert(data, query.id == self.id)
+        if type(self)._index_follows(version):
+            for doc_id in doc_ids:
+                type(self)._index_discard(doc_id)
+                type(self)._index_add(doc_id, data)
+        if doc_ids:
             print("Data updated.")
         else:
             print("Data inserted.")
 
     
+    @diagnostics.timed("Serializable.delete")
     def delete(self):
         print("Deleting data...")
         query = Query()
-        if self.db_connector.remove(query.id == self.id):
+        version = queries.db_version()
+        doc_ids = self.db_connector.remove(query.id == self.id)
+        if type(self)._index_follows(version):
+            for doc_id in doc_ids:
+                type(self)._index_discard(doc_id)
+        if doc_ids:
             print("Data deleted.")
         else:
             print("Data not found.")
-    
+
+    # ---------- attribute index ----------
+    @classmethod
+    def _attribute_index(cls) -> dict:
+        """Index of this class' table, built with one scan on first use and whenever the database changed"""
+        index = cls.__dict__.get("_index_data")
+        if index is None or index["version"] != queries.db_version():
+            cls._rebuild_index()
+        return cls.__dict__["_index_data"]
+
+    @classmethod
+    def _rebuild_index(cls) -> None:
+        # "values": attribute -> value -> doc ids, "docs": doc id -> indexed (attribute, value) pairs,
+        # "version": the database version the index describes
+        version = queries.db_version()
+        cls._index_data = {"values": {attr: {} for attr in cls.indexed_attributes}, "docs": {}, "version": version}
+        for doc in cls.db_connector.all():
+            cls._index_add(doc.doc_id, doc)
+
+    @classmethod
+    def _index_follows(cls, version: int) -> bool:
+        """
+        After an own write that started on database version `version`: whether the index can be
+        updated in place, i.e. it described that version and nothing but this write came in between.
+        Otherwise it is dropped and rebuilt on the next lookup.
+        """
+        index = cls.__dict__.get("_index_data")
+        if index is None:
+            return False
+        current = queries.db_version()
+        if index["version"] != version or current != version + 1:
+            del cls._index_data
+            return False
+        index["version"] = current
+        return True
+
+    @classmethod
+    def _index_add(cls, doc_id: int, data: dict) -> None:
+        index = cls.__dict__["_index_data"]
+        entries = []
+        for attr in cls.indexed_attributes:
+            value = data.get(attr)
+            try:
+                index["values"][attr].setdefault(value, set()).add(doc_id)
+            except TypeError:
+                continue  # unhashable values are only found by scanning
+            entries.append((attr, value))
+        index["docs"][doc_id] = entries
+
     @classmethod
+    def _index_discard(cls, doc_id: int) -> None:
+        index = cls.__dict__["_index_data"]
+        for attr, value in index["docs"].pop(doc_id, ()):
+            doc_ids = index["values"][attr].get(value)
+            if doc_ids is not None:
+                doc_ids.discard(doc_id)
+                if not doc_ids:
+                    del index["values"][attr][value]
+
+    @classmethod
+    def _find_indexed(cls, by_attribute: str, attribute_value) -> list | None:
+        """Documents with the given value via the index, None if the index turned out stale"""
+        try:
+            doc_ids = sorted(cls._attribute_index()["values"][by_attribute].get(attribute_value, ()))
+        except TypeError:
+            return None
+        result = []
+        for doc_id in doc_ids:
+            doc = cls.db_connector.get(doc_id=doc_id)
+            if doc is None or doc.get(by_attribute) != attribute_value:
+                # the table was changed behind our back (e.g. by another process)
+                return None
+            result.append(doc)
+        return result
+
+    @classmethod
+    @diagnostics.timed("Serializable.find_by_attribute")
     def find_by_attribute(cls, by_attribute: str, attribute_value: str, num_to_return=1) -> Self | list[Self]:
         # Load data from the database and create an instance of the Device class
-        DeviceQuery = Query()
-        result = cls.db_connector.search(DeviceQuery[by_attribute] == attribute_value)
+        result = None
+        if by_attribute in cls.indexed_attributes:
+            result = cls._find_indexed(by_attribute, attribute_value)
+            if result is None:
+                cls._rebuild_index()
+        if result is None:
+            # no (usable) index for this attribute -> scan the table
+            DeviceQuery = Query()
+            result = cls.db_connector.search(DeviceQuery[by_attribute] == attribute_value)
 
         if result:
             if num_to_return == -1:
@@ -55,6 +165,7 @@ class Serializable(ABC):
 
            
     @classmethod
+    @diagnostics.timed("Serializable.find_all")
     def find_all(cls) -> list[Self]:
         # Load all data from the database and create instances of the Device class
         devices = []
@@ -70,6 +181,36 @@ class Serializable(ABC):
     def __str__(self):
         pass
     
+    @classmethod
+    def _field_plan(cls) -> tuple[str, ...]:
+        """Names of the declared fields of cls (base class fields first), compiled once per class"""
+        plan = cls.__dict__.get("_compiled_fields")
+        if plan is None:
+            fields = []
+            for klass in reversed(cls.__mro__):
+                slots = klass.__dict__.get("__slots__", ())
+                for name in (slots,) if isinstance(slots, str) else slots:
+                    if name not in fields and name not in ("__dict__", "__weakref__"):
+                        fields.append(name)
+            plan = cls._compiled_fields = tuple(fields)
+        return plan
+
+    def _to_document(self) -> dict:
+        """
+        The dict that is stored for this object. Same result as __to_dict(), but driven by the
+        field plan; only values that aren't plain (lists, dicts, objects) take the recursive path.
+        """
+        data = {}
+        for name in self._field_plan():
+            value = getattr(self, name, _MISSING)
+            if value is _MISSING:
+                continue
+            data[name] = value if type(value) in _PLAIN_TYPES else self.__to_dict(value)
+        # subclasses without __slots__ keep their own fields in __dict__
+        for name, value in getattr(self, "__dict__", {}).items():
+            data[name] = value if type(value) in _PLAIN_TYPES else self.__to_dict(value)
+        return data
+
     #Do not modify this function unless you really know what you are doing!
     def __to_dict(self, *args):
         """
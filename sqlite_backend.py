@@ -0,0 +1,451 @@
+"""
+SQLite implementation of the queries.py API.
+Select it with CASE_STUDY_DB_BACKEND=sqlite; the functions keep the exact signatures and
+return values of their JSON counterparts in queries.py.
+Existing data can be copied over with `python sqlite_backend.py` (see import_json).
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from epoch_minutes import parse_minutes
+from free_slots import WORK_DAY_END, WORK_DAY_START, WORK_DAYS, check_workdays, earliest_slot
+
+DB_PATH = Path(os.environ.get("CASE_STUDY_SQLITE_PATH", Path(__file__).parent / "database.sqlite3"))
+
+CONFLICT_MESSAGE = "Gerät ist in diesem Zeitraum bereits reserviert"
+USER_IN_USE_MESSAGE = "Nutzer verwaltet noch Geräte oder hat Reservierungen"
+DEVICE_IN_USE_MESSAGE = "Gerät hat noch Reservierungen oder Wartungen"
+REASSIGN_TARGET_MESSAGE = "Ziel der Übertragung existiert nicht"
+
+DELETE_POLICIES = ("cascade", "reassign", "restrict")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS devices (
+    id TEXT PRIMARY KEY,
+    device_name TEXT NOT NULL,
+    managed_by_user_id TEXT NOT NULL DEFAULT '',
+    is_active INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS reservations (
+    id INTEGER PRIMARY KEY,
+    device_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    "start" TEXT NOT NULL,
+    "end" TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reservations_device_time ON reservations (device_id, "start", "end");
+CREATE INDEX IF NOT EXISTS idx_devices_managed_by ON devices (managed_by_user_id);
+CREATE INDEX IF NOT EXISTS idx_reservations_user ON reservations (user_id);
+-- single row; every write transaction bumps version (see db_version)
+CREATE TABLE IF NOT EXISTS meta (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (id, version) VALUES (1, 0);
+"""
+
+# sqlite3 connections must not be shared between threads (Streamlit runs sessions in threads)
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != DB_PATH:
+        conn = sqlite3.connect(DB_PATH)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn, _local.path = conn, DB_PATH
+    return conn
+
+
+@contextmanager
+def _transaction():
+    """Write transaction that holds SQLite's write lock from the start (BEGIN IMMEDIATE),
+    so checks done inside it can't be invalidated by a concurrent writer."""
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def _iso(dt: datetime) -> str:
+    # same format as the stored values, so ISO strings compare in time order
+    if dt.second or dt.microsecond:
+        return dt.isoformat()
+    return dt.isoformat(timespec="minutes")
+
+
+def _reservation_row(r: dict) -> tuple:
+    return (
+        str(r.get("device_id", "")),
+        str(r.get("user_id", "")),
+        str(r.get("start", "")),
+        str(r.get("end", "")),
+    )
+
+
+def _bump_version(conn: sqlite3.Connection) -> None:
+    conn.execute("UPDATE meta SET version = version + 1 WHERE id = 1")
+
+
+def db_version() -> int:
+    """Grows with every committed write, also those of other processes."""
+    (version,) = _connect().execute("SELECT version FROM meta WHERE id = 1").fetchone()
+    return version
+
+
+def get_users() -> List[dict]:
+    rows = _connect().execute("SELECT id, name FROM users ORDER BY rowid")
+    return [{"id": row["id"], "name": row["name"]} for row in rows]
+
+
+def get_devices() -> List[dict]:
+    rows = _connect().execute("SELECT id, device_name, managed_by_user_id, is_active FROM devices ORDER BY rowid")
+    return [
+        {
+            "id": row["id"],
+            "device_name": row["device_name"],
+            "managed_by_user_id": row["managed_by_user_id"],
+            "is_active": bool(row["is_active"]),
+        }
+        for row in rows
+    ]
+
+
+def find_devices() -> List[dict]:
+    return get_devices()
+
+
+def list_reservations() -> List[dict]:
+    rows = _connect().execute('SELECT device_id, user_id, "start", "end" FROM reservations ORDER BY id')
+    return [dict(row) for row in rows]
+
+
+def iter_reservations(
+    device_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    descending: bool = False,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> Iterator[dict]:
+    """Same as queries.iter_reservations; rows are streamed from the cursor."""
+    where, params = [], []
+    if device_id is not None:
+        where.append("device_id = ?")
+        params.append(str(device_id))
+    if user_id is not None:
+        where.append("user_id = ?")
+        params.append(str(user_id))
+    if end is not None:
+        where.append('"start" < ?')
+        params.append(_iso(end))
+    if start is not None:
+        where.append('"end" > ?')
+        params.append(_iso(start))
+
+    sql = 'SELECT device_id, user_id, "start", "end" FROM reservations'
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += ' ORDER BY "start" DESC' if descending else ' ORDER BY "start"'
+    sql += " LIMIT ? OFFSET ?"
+    params += [-1 if limit is None else limit, offset]
+
+    for row in _connect().execute(sql, params):
+        yield dict(row)
+
+
+def find_conflicts(device_id: str, start: datetime, end: datetime) -> List[dict]:
+    """Reservations of the device that overlap [start, end), ordered by start."""
+    rows = _connect().execute(
+        'SELECT device_id, user_id, "start", "end" FROM reservations '
+        'WHERE device_id = ? AND "start" < ? AND "end" > ? ORDER BY "start"',
+        (str(device_id), _iso(end), _iso(start)),
+    )
+    return [dict(row) for row in rows]
+
+
+def is_device_free(device_id: str, start: datetime, end: datetime) -> bool:
+    row = _connect().execute(
+        'SELECT 1 FROM reservations WHERE device_id = ? AND "start" < ? AND "end" > ? LIMIT 1',
+        (str(device_id), _iso(end), _iso(start)),
+    ).fetchone()
+    return row is None
+
+
+
+def _busy_intervals(conn: sqlite3.Connection, device_id: str, after: datetime) -> Iterator[Tuple[int, int]]:
+    rows = conn.execute(
+        'SELECT "start", "end" FROM reservations WHERE device_id = ? AND "end" > ? ORDER BY "start"',
+        (device_id, _iso(after)),
+    )
+    for start, end in rows:
+        start, end = parse_minutes(start), parse_minutes(end)
+        if start is not None and end is not None and end > start:
+            yield start, end
+
+
+def find_free_slot(
+    duration: timedelta,
+    after: datetime,
+    device_id: Optional[str] = None,
+    work_start: time = WORK_DAY_START,
+    work_end: time = WORK_DAY_END,
+    workdays: Sequence[int] = WORK_DAYS,
+) -> Optional[dict]:
+    """Same as queries.find_free_slot; one cursor per device, read only as far as needed."""
+    check_workdays(workdays)
+    conn = _connect()
+    if device_id is not None:
+        device_ids = [str(device_id)]
+    else:
+        device_ids = [row[0] for row in conn.execute("SELECT id FROM devices WHERE is_active = 1 ORDER BY rowid")]
+    busy = {dev_id: _busy_intervals(conn, dev_id, after) for dev_id in device_ids}
+    found = earliest_slot(busy, after, duration, work_start, work_end, workdays)
+    if found is None:
+        return None
+    dev_id, start = found
+    return {"device_id": dev_id, "start": start, "end": start + duration}
+
+
+def reservation_intervals() -> Dict[str, Tuple[List[int], List[int]]]:
+    """Same as queries.reservation_intervals."""
+    out: Dict[str, Tuple[List[int], List[int]]] = {}
+    rows = _connect().execute('SELECT device_id, "start", "end" FROM reservations ORDER BY device_id, "start"')
+    for device_id, start, end in rows:
+        start, end = parse_minutes(start), parse_minutes(end)
+        if start is None or end is None or end <= start:
+            continue
+        starts, ends = out.setdefault(device_id, ([], []))
+        starts.append(start)
+        ends.append(end)
+    return out
+
+def _reject_conflicts(conn: sqlite3.Connection, rows: List[tuple]) -> None:
+    for device_id, _, start, end in rows:
+        hit = conn.execute(
+            'SELECT 1 FROM reservations WHERE device_id = ? AND "start" < ? AND "end" > ? LIMIT 1',
+            (device_id, end, start),
+        ).fetchone()
+        if hit is not None:
+            raise ValueError(CONFLICT_MESSAGE)
+
+
+def insert_reservation(new_res: dict, check_conflicts: bool = False) -> None:
+    with _transaction() as conn:
+        if check_conflicts:
+            _reject_conflicts(conn, [_reservation_row(new_res)])
+        _bump_version(conn)
+        conn.execute('INSERT INTO reservations (device_id, user_id, "start", "end") VALUES (?, ?, ?, ?)', _reservation_row(new_res))
+
+
+def insert_reservations(new_reservations: List[dict], check_conflicts: bool = False) -> None:
+    rows = [_reservation_row(r) for r in new_reservations]
+    with _transaction() as conn:
+        if check_conflicts:
+            _reject_conflicts(conn, rows)
+        _bump_version(conn)
+        conn.executemany('INSERT INTO reservations (device_id, user_id, "start", "end") VALUES (?, ?, ?, ?)', rows)
+
+
+def update_device(device_id: str, managed_by_user_id: Optional[str] = None, is_active: Optional[bool] = None) -> None:
+    did = str(device_id)
+    with _transaction() as conn:
+        _bump_version(conn)
+        conn.execute(
+            "INSERT OR IGNORE INTO devices (id, device_name, managed_by_user_id, is_active) VALUES (?, ?, '', 1)",
+            (did, f"Device {did}"),
+        )
+        if managed_by_user_id is not None:
+            conn.execute("UPDATE devices SET managed_by_user_id = ? WHERE id = ?", (managed_by_user_id, did))
+        if is_active is not None:
+            conn.execute("UPDATE devices SET is_active = ? WHERE id = ?", (int(bool(is_active)), did))
+
+
+def add_user(user_id: str, name: str) -> None:
+    with _transaction() as conn:
+        _bump_version(conn)
+        conn.execute("INSERT OR REPLACE INTO users (id, name) VALUES (?, ?)", (str(user_id), name))
+
+
+def _check_policy(policy: str, reassign_to: Optional[str]) -> None:
+    if policy not in DELETE_POLICIES:
+        raise ValueError(f"Unknown delete policy {policy!r} (expected one of {', '.join(DELETE_POLICIES)})")
+    if policy == "reassign" and not reassign_to:
+        raise ValueError(REASSIGN_TARGET_MESSAGE)
+
+
+def delete_user(user_id: str, policy: str = "restrict", reassign_to: Optional[str] = None) -> None:
+    """Same as queries.delete_user; the referencing rows are found through the user/manager indexes.
+    The maintenance records of devices deleted with "cascade" are deleted after the commit, see _update_maintenances."""
+    user_id = str(user_id)
+    _check_policy(policy, reassign_to)
+    devices: List[str] = []
+    with _transaction() as conn:
+        if policy == "restrict":
+            in_use = conn.execute(
+                "SELECT EXISTS (SELECT 1 FROM devices WHERE managed_by_user_id = ?) "
+                "OR EXISTS (SELECT 1 FROM reservations WHERE user_id = ?)",
+                (user_id, user_id),
+            ).fetchone()[0]
+            if in_use:
+                raise ValueError(USER_IN_USE_MESSAGE)
+        elif policy == "reassign":
+            target = str(reassign_to)
+            if target == user_id or conn.execute("SELECT 1 FROM users WHERE id = ?", (target,)).fetchone() is None:
+                raise ValueError(REASSIGN_TARGET_MESSAGE)
+            conn.execute("UPDATE devices SET managed_by_user_id = ? WHERE managed_by_user_id = ?", (target, user_id))
+            conn.execute("UPDATE reservations SET user_id = ? WHERE user_id = ?", (target, user_id))
+        else:
+            devices = [row[0] for row in conn.execute("SELECT id FROM devices WHERE managed_by_user_id = ?", (user_id,))]
+            conn.execute(
+                "DELETE FROM reservations WHERE user_id = ? "
+                "OR device_id IN (SELECT id FROM devices WHERE managed_by_user_id = ?)",
+                (user_id, user_id),
+            )
+            conn.execute("DELETE FROM devices WHERE managed_by_user_id = ?", (user_id,))
+        _bump_version(conn)
+        conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    _update_maintenances(devices, None)
+
+
+# The maintenance records are a table of the TinyDB models, which keep it in database.json with
+# either backend (see queries.read_tables). The two files share no transaction, so they are not
+# changed atomically: the deletes check the records inside their SQLite transaction but change them
+# only once it is committed. A failure in between leaves records of a deleted device behind (found
+# again by the next delete of that id), never changes for a delete that was rolled back.
+
+def _maintenances_of(device_ids: Sequence[str]) -> List[str]:
+    """Doc ids of the maintenance records of the devices."""
+    import queries
+
+    _, tables = queries.read_tables()
+    return sorted(
+        doc_id
+        for doc_id, doc in tables.get("maintenances", {}).items()
+        if isinstance(doc, dict) and str(doc.get("device_id")) in device_ids
+    )
+
+
+def _update_maintenances(device_ids: Sequence[str], reassign_to: Optional[str]) -> None:
+    """Move the maintenance records of the devices to the device reassign_to, or delete them (None).
+    Called after the SQLite commit (see above), so it also catches records added meanwhile."""
+    doc_ids = _maintenances_of(device_ids)
+    if not doc_ids:
+        return
+    import queries
+
+    _, tables = queries.read_tables()
+    table = dict(tables.get("maintenances", {}))
+    for doc_id in doc_ids:
+        if reassign_to is None:
+            table.pop(doc_id, None)
+        elif doc_id in table:
+            table[doc_id] = {**table[doc_id], "device_id": reassign_to}
+    queries.write_tables({"maintenances": table})
+
+
+def add_device(device_name: str, managed_by_user_id: str) -> None:
+    with _transaction() as conn:
+        _bump_version(conn)
+        (max_id,) = conn.execute("SELECT COALESCE(MAX(CAST(id AS INTEGER)), 0) FROM devices").fetchone()
+        conn.execute(
+            "INSERT INTO devices (id, device_name, managed_by_user_id, is_active) VALUES (?, ?, ?, 1)",
+            (str(max_id + 1), device_name, managed_by_user_id),
+        )
+
+
+def delete_device(device_id: str, policy: str = "restrict", reassign_to: Optional[str] = None) -> None:
+    """Same as queries.delete_device (the maintenance records stay in database.json and are changed
+    after the commit, see _update_maintenances)."""
+    device_id = str(device_id)
+    _check_policy(policy, reassign_to)
+    with _transaction() as conn:
+        if policy == "restrict":
+            if _maintenances_of([device_id]) or conn.execute("SELECT 1 FROM reservations WHERE device_id = ? LIMIT 1", (device_id,)).fetchone():
+                raise ValueError(DEVICE_IN_USE_MESSAGE)
+        elif policy == "reassign":
+            target = str(reassign_to)
+            if target == device_id or conn.execute("SELECT 1 FROM devices WHERE id = ?", (target,)).fetchone() is None:
+                raise ValueError(REASSIGN_TARGET_MESSAGE)
+            overlap = conn.execute(
+                'SELECT 1 FROM reservations a JOIN reservations b ON b.device_id = ? AND b."start" < a."end" AND b."end" > a."start" '
+                "WHERE a.device_id = ? LIMIT 1",
+                (target, device_id),
+            ).fetchone()
+            if overlap:
+                raise ValueError(CONFLICT_MESSAGE)
+            conn.execute("UPDATE reservations SET device_id = ? WHERE device_id = ?", (target, device_id))
+        else:
+            conn.execute("DELETE FROM reservations WHERE device_id = ?", (device_id,))
+        _bump_version(conn)
+        conn.execute("DELETE FROM devices WHERE id = ?", (device_id,))
+    if policy != "restrict":
+        _update_maintenances([device_id], str(reassign_to) if policy == "reassign" else None)
+
+
+def import_json(json_path: Optional[Path] = None) -> dict:
+    """
+    Replace the SQLite contents with the JSON database (journal and archived reservations included)
+    in one transaction. SQLite has no recurring reservations: every occurrence of a rule becomes a
+    row (the rules are bounded by until / count). Returns the number of imported rows per table.
+    """
+    import queries
+
+    previous_path = queries.DB_PATH
+    if json_path is not None:
+        queries.DB_PATH = Path(json_path)
+    try:
+        with queries._lock().read():
+            db = queries._load_db()
+            reservations = [_reservation_row(r) for r in db["reservations"]]
+            # moved out of database.json by queries.archive_reservations; SQLite keeps them in one table
+            reservations.extend(_reservation_row(r) for r in queries._archived_rows())
+            for rules in queries._recurring().values():
+                for rule_id, rule, rec in rules:
+                    reservations.extend(
+                        _reservation_row(r) for _, _, r in queries._rule_occurrences(rule_id, rule, rec, None, None, False)
+                    )
+    finally:
+        queries.DB_PATH = previous_path
+
+    with _transaction() as conn:
+        _bump_version(conn)
+        conn.execute("DELETE FROM reservations")
+        conn.execute("DELETE FROM devices")
+        conn.execute("DELETE FROM users")
+        conn.executemany(
+            "INSERT INTO users (id, name) VALUES (?, ?)",
+            [(str(uid), u.get("name", str(uid))) for uid, u in db["users"].items()],
+        )
+        conn.executemany(
+            "INSERT INTO devices (id, device_name, managed_by_user_id, is_active) VALUES (?, ?, ?, ?)",
+            [
+                (str(did), d.get("device_name", str(did)), d.get("managed_by_user_id", ""), int(bool(d.get("is_active", True))))
+                for did, d in db["devices"].items()
+            ],
+        )
+        conn.executemany('INSERT INTO reservations (device_id, user_id, "start", "end") VALUES (?, ?, ?, ?)', reservations)
+
+    return {"users": len(db["users"]), "devices": len(db["devices"]), "reservations": len(reservations)}
+
+
+if __name__ == "__main__":
+    counts = import_json()
+    print(f"Imported into {DB_PATH}: {counts}")
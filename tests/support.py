@@ -0,0 +1,46 @@
+"""
+Shared setup of the tests: every test gets its own database files in a temporary directory,
+queries.py starts with an empty in-process snapshot and nothing touches the repository's database.json.
+"""
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import queries
+
+
+def reset_cache() -> None:
+    """Forget the in-process snapshot, as if the process had just started."""
+    timer = queries._writer["timer"]
+    if timer is not None:
+        timer.cancel()
+    queries._writer["timer"] = None
+    queries._cache.update(
+        key=None, db=None, seq=0, unsynced=0, index=None, refs=None, pending=[], minutes=None, archive=None, rules=None
+    )
+    queries._cache["version"] += 1
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.db_path = Path(tmp.name) / "database.json"
+        for name, value in (("DB_PATH", self.db_path), ("WRITE_BEHIND_INTERVAL", 0.0), ("ARCHIVE_AFTER_DAYS", 0.0)):
+            patcher = mock.patch.object(queries, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        reset_cache()
+        self.addCleanup(reset_cache)
+
+    @property
+    def journal_path(self) -> Path:
+        return queries._journal_path()
+
+    def read_file(self) -> dict:
+        return json.loads(self.db_path.read_text(encoding="utf-8"))
+
+    def write_file(self, db: dict) -> None:
+        self.db_path.write_text(json.dumps(db), encoding="utf-8")
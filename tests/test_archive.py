@@ -0,0 +1,77 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import queries
+import sqlite_backend
+from support import DatabaseTestCase, reset_cache
+
+
+def reservation(device_id: str, user_id: str, d: int, hour: int = 9) -> dict:
+    return {
+        "device_id": device_id,
+        "user_id": user_id,
+        "start": datetime(2026, 1, d, hour).isoformat(timespec="minutes"),
+        "end": datetime(2026, 1, d, hour + 1).isoformat(timespec="minutes"),
+    }
+
+
+class ArchiveTest(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        queries.add_user("u1", "User")
+        queries.add_user("u2", "Other")
+        queries.add_device("Scope", "u1")
+        queries.add_device("Laser", "u1")
+        self.rows = [reservation("1", "u1", d) for d in range(5, 15)] + [reservation("2", "u2", d, 11) for d in range(5, 15)]
+        queries.insert_reservations(self.rows)
+
+    def ordered(self, rows) -> list:
+        return sorted((r["start"], r["device_id"], r["user_id"], r["end"]) for r in rows)
+
+    def test_round_trip(self):
+        self.assertEqual(queries.archive_reservations(datetime(2026, 1, 10)), 10)
+        self.assertEqual(len(queries._load_db()["reservations"]), 10)
+        self.assertEqual(self.ordered(queries.list_reservations()), self.ordered(self.rows))
+        self.assertEqual(self.ordered(queries.iter_reservations()), self.ordered(self.rows))
+
+        # a later run adds a segment, the numbers of known ids are kept
+        self.assertEqual(queries.archive_reservations(datetime(2026, 1, 12)), 4)
+        queries.compact()
+        reset_cache()
+        self.assertEqual(self.ordered(queries.list_reservations()), self.ordered(self.rows))
+        self.assertEqual(
+            [r["start"][8:10] for r in queries.iter_reservations(device_id="1", descending=True, limit=7)],
+            ["14", "13", "12", "11", "10", "09", "08"],
+        )
+        self.assertEqual(queries.archive_reservations(datetime(2026, 1, 12)), 0)
+
+    def test_conflicts_with_archived_rows(self):
+        queries.archive_reservations(datetime(2026, 1, 10))
+        start, end = datetime(2026, 1, 6, 9, 30), datetime(2026, 1, 6, 10, 30)
+        self.assertFalse(queries.is_device_free("1", start, end))
+        self.assertEqual([r["start"] for r in queries.find_conflicts("1", start, end)], ["2026-01-06T09:00"])
+        with self.assertRaisesRegex(ValueError, queries.CONFLICT_MESSAGE):
+            queries.insert_reservation({**reservation("1", "u2", 6), "start": "2026-01-06T09:30"}, check_conflicts=True)
+        self.assertTrue(queries.is_device_free("2", start, end))
+
+    def test_deletes_see_archived_rows(self):
+        queries.archive_reservations(datetime(2026, 1, 20))
+        self.assertEqual(queries._load_db()["reservations"], [])
+        with self.assertRaisesRegex(ValueError, queries.USER_IN_USE_MESSAGE):
+            queries.delete_user("u2")
+        queries.delete_user("u2", "reassign", "u1")
+        self.assertEqual({r["user_id"] for r in queries.list_reservations()}, {"u1"})
+        queries.delete_device("2", "cascade")
+        self.assertEqual(self.ordered(queries.list_reservations()), self.ordered(self.rows[:10]))
+
+    def test_import_into_sqlite(self):
+        queries.archive_reservations(datetime(2026, 1, 10))
+        queries.compact()
+        with mock.patch.object(sqlite_backend, "DB_PATH", self.db_path.with_name("database.sqlite3")):
+            self.assertEqual(sqlite_backend.import_json(self.db_path), {"users": 2, "devices": 2, "reservations": 20})
+            self.assertEqual(self.ordered(sqlite_backend.list_reservations()), self.ordered(self.rows))
+
+
+if __name__ == "__main__":
+    unittest.main()
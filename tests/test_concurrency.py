@@ -0,0 +1,159 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import queries
+from support import DatabaseTestCase
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+class RacingLock:
+    """Lock of queries.py that lets every thread prepare its mutation before any of them may write."""
+
+    def __init__(self, lock, threads: int) -> None:
+        self.lock = lock
+        self.barrier = threading.Barrier(threads)
+        self.waited = set()
+
+    def read(self, *args, **kwargs):
+        return self.lock.read(*args, **kwargs)
+
+    def write(self, *args, **kwargs):
+        me = threading.get_ident()
+        if me not in self.waited:
+            self.waited.add(me)
+            self.barrier.wait(timeout=5)
+        return self.lock.write(*args, **kwargs)
+
+
+def race(*calls) -> list:
+    """Run the calls in parallel threads; returns the exception (or None) of each call."""
+    racing = RacingLock(queries._lock(), len(calls))
+    errors = [None] * len(calls)
+
+    def run(i: int) -> None:
+        try:
+            calls[i]()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(calls))]
+    with mock.patch.object(queries, "_lock", lambda: racing):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=10)
+    return errors
+
+
+def reservation(start: str, end: str, user_id: str = "u1") -> dict:
+    return {"device_id": "1", "user_id": user_id, "start": start, "end": end}
+
+
+class OptimisticConcurrencyTest(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        queries.add_user("u1", "User")
+        queries.add_user("u2", "Other")
+        queries.add_device("Scope", "u1")
+
+    def test_conflicting_commit_prepares_again(self):
+        errors = race(
+            lambda: queries.insert_reservation(reservation("2026-01-07T09:00", "2026-01-07T10:00"), check_conflicts=True),
+            lambda: queries.insert_reservation(reservation("2026-01-07T09:30", "2026-01-07T11:00", "u2"), check_conflicts=True),
+        )
+        self.assertEqual(sorted(str(e) for e in errors if e is not None), [queries.CONFLICT_MESSAGE])
+        self.assertEqual(len(queries.list_reservations()), 1)
+
+    def test_concurrent_new_ids(self):
+        self.assertEqual(race(lambda: queries.add_device("Laser", "u1"), lambda: queries.add_device("Lamp", "u2")), [None, None])
+        self.assertEqual(sorted(d["id"] for d in queries.get_devices()), ["1", "2", "3"])
+
+
+class WriteBehindTest(OptimisticConcurrencyTest):
+    """The same races with write-behind: commits of this process leave the files alone until flush()."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        queries.sync()
+        # long enough that only the explicit flush() calls write
+        patcher = mock.patch.object(queries, "WRITE_BEHIND_INTERVAL", 60.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def other_process(self, code: str) -> None:
+        env = {**os.environ, "CASE_STUDY_DB_PATH": str(self.db_path), "CASE_STUDY_WRITE_BEHIND": ""}
+        subprocess.run([sys.executable, "-c", "import queries\n" + code], cwd=REPO, env=env, check=True, capture_output=True)
+
+    def test_concurrent_new_ids(self):
+        super().test_concurrent_new_ids()
+        queries.flush()
+        self.assertEqual(sorted(d["id"] for d in queries.get_devices()), ["1", "2", "3"])
+
+    def test_flush_prepares_again_on_data_of_another_process(self):
+        queries.insert_reservations([
+            reservation("2026-01-07T09:00", "2026-01-07T10:00", "u2"),
+            reservation("2026-01-08T09:00", "2026-01-08T10:00"),
+        ])
+        queries.flush()
+        queries.add_device("Laser", "u1")
+        queries.add_user("u3", "Third")
+        queries.insert_reservation(reservation("2026-01-09T09:00", "2026-01-09T10:00", "u3"))
+        queries.delete_user("u3", "cascade")
+        # takes device id 2 and moves the rows the pending delete refers to
+        self.other_process("queries.add_device('Lamp', 'u1')\nqueries.delete_user('u2', 'cascade')\n")
+        queries.flush()
+        self.assertEqual(
+            [(d["id"], d["device_name"]) for d in queries.get_devices()], [("1", "Scope"), ("2", "Lamp"), ("3", "Laser")]
+        )
+        self.assertEqual([r["user_id"] for r in queries.list_reservations()], ["u1"])
+
+    def test_flush_after_max_pending_changes(self):
+        with mock.patch.object(queries, "WRITE_BEHIND_MAX_PENDING", 3):
+            queries.add_user("u3", "Third")
+            queries.add_user("u4", "Fourth")
+            self.assertEqual(len(queries._cache["pending"]), 2)
+            queries.add_user("u5", "Fifth")
+        self.assertEqual(queries._cache["pending"], [])
+        self.assertIn(b'"u5"', self.journal_path.read_bytes())
+
+    def test_flush_drops_changes_that_no_longer_fit(self):
+        queries.insert_reservation(reservation("2026-01-07T09:00", "2026-01-07T10:00"), check_conflicts=True)
+        queries.add_user("u3", "Third")
+        self.other_process(
+            "queries.insert_reservation({'device_id': '1', 'user_id': 'u2', 'start': '2026-01-07T09:30', 'end': '2026-01-07T10:30'})\n"
+        )
+        with self.assertRaisesRegex(ValueError, queries.CHANGES_DROPPED_MESSAGE):
+            queries.flush()
+        self.assertEqual([r["user_id"] for r in queries.list_reservations()], ["u2"])
+        self.assertIn("u3", [u["id"] for u in queries.get_users()])
+        self.assertFalse(queries._cache["pending"])
+        # kept for the next run of the app
+        self.assertEqual(
+            queries.take_dropped_changes(),
+            [{"op": "insert_reservation", "args": reservation("2026-01-07T09:00", "2026-01-07T10:00"), "error": queries.CONFLICT_MESSAGE}],
+        )
+        self.assertEqual(queries.take_dropped_changes(), [])
+
+    def test_background_flush_keeps_dropped_changes(self):
+        queries.insert_reservation(reservation("2026-01-07T09:00", "2026-01-07T10:00"), check_conflicts=True)
+        self.other_process(
+            "queries.insert_reservation({'device_id': '1', 'user_id': 'u2', 'start': '2026-01-07T09:30', 'end': '2026-01-07T10:30'})\n"
+        )
+        with contextlib.redirect_stderr(io.StringIO()) as err:
+            queries._flush_in_background()
+        self.assertIn(queries.CHANGES_DROPPED_MESSAGE, err.getvalue())
+        # nothing left to retry
+        self.assertIsNone(queries._writer["timer"])
+        self.assertEqual([c["op"] for c in queries.take_dropped_changes()], ["insert_reservation"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import sqlite3
+import unittest
+from unittest import mock
+
+import queries
+import sqlite_backend
+from support import DatabaseTestCase
+
+
+def reservation(device_id: str, user_id: str, d: int) -> dict:
+    return {"device_id": device_id, "user_id": user_id, "start": f"2026-01-{d:02d}T09:00", "end": f"2026-01-{d:02d}T10:00"}
+
+
+class DeletePolicies:
+    """Tests for both backends. u1 manages device 1, u2 device 2; both have reservations on the
+    device of the other."""
+
+    backend = queries
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.open_backend()
+        self.backend.add_user("u1", "User")
+        self.backend.add_user("u2", "Other")
+        self.backend.add_device("Scope", "u1")
+        self.backend.add_device("Laser", "u2")
+        self.backend.insert_reservations([reservation("1", "u2", 7), reservation("2", "u2", 8), reservation("2", "u1", 9)])
+        queries.write_tables({"maintenances": {"m1": {"device_id": "1"}, "m2": {"device_id": "2"}}})
+
+    def open_backend(self) -> None:
+        pass
+
+    def users(self) -> list:
+        return sorted(u["id"] for u in self.backend.get_users())
+
+    def devices(self) -> list:
+        return sorted((d["id"], d["managed_by_user_id"]) for d in self.backend.get_devices())
+
+    def reservations(self) -> list:
+        return sorted((r["device_id"], r["user_id"], r["start"][8:10]) for r in self.backend.list_reservations())
+
+    def maintenances(self) -> dict:
+        return {doc_id: doc["device_id"] for doc_id, doc in queries.read_tables()[1].get("maintenances", {}).items()}
+
+    def test_restrict_is_the_default(self):
+        with self.assertRaisesRegex(ValueError, queries.USER_IN_USE_MESSAGE):
+            self.backend.delete_user("u1")
+        with self.assertRaisesRegex(ValueError, queries.DEVICE_IN_USE_MESSAGE):
+            self.backend.delete_device("1")
+        self.assertEqual(self.users(), ["u1", "u2"])
+        self.assertEqual(len(self.devices()), 2)
+        self.assertEqual(len(self.reservations()), 3)
+
+        self.backend.add_user("u3", "Unused")
+        self.backend.delete_user("u3")
+        self.assertEqual(self.users(), ["u1", "u2"])
+
+    def test_restrict_counts_maintenance_records(self):
+        self.backend.add_device("Lamp", "u1")
+        queries.write_tables({"maintenances": {**queries.read_tables()[1]["maintenances"], "m3": {"device_id": "3"}}})
+        with self.assertRaisesRegex(ValueError, queries.DEVICE_IN_USE_MESSAGE):
+            self.backend.delete_device("3", "restrict")
+        self.backend.add_device("Fan", "u1")
+        self.backend.delete_device("4", "restrict")
+        self.assertEqual([d[0] for d in self.devices()], ["1", "2", "3"])
+
+    def test_cascade_user(self):
+        self.backend.delete_user("u1", "cascade")
+        self.assertEqual(self.users(), ["u2"])
+        self.assertEqual(self.devices(), [("2", "u2")])
+        self.assertEqual(self.reservations(), [("2", "u2", "08")])
+        self.assertEqual(self.maintenances(), {"m2": "2"})
+
+    def test_reassign_user(self):
+        self.backend.delete_user("u1", "reassign", "u2")
+        self.assertEqual(self.users(), ["u2"])
+        self.assertEqual(self.devices(), [("1", "u2"), ("2", "u2")])
+        self.assertEqual(self.reservations(), [("1", "u2", "07"), ("2", "u2", "08"), ("2", "u2", "09")])
+        with self.assertRaisesRegex(ValueError, queries.REASSIGN_TARGET_MESSAGE):
+            self.backend.delete_user("u2", "reassign", "u1")
+
+    def test_cascade_device(self):
+        self.backend.delete_device("2", "cascade")
+        self.assertEqual(self.devices(), [("1", "u1")])
+        self.assertEqual(self.reservations(), [("1", "u2", "07")])
+        self.assertEqual(self.maintenances(), {"m1": "1"})
+
+    def test_reassign_device(self):
+        self.backend.delete_device("2", "reassign", "1")
+        self.assertEqual(self.devices(), [("1", "u1")])
+        self.assertEqual(self.reservations(), [("1", "u1", "09"), ("1", "u2", "07"), ("1", "u2", "08")])
+        self.assertEqual(self.maintenances(), {"m1": "1", "m2": "1"})
+
+    def test_reassign_device_with_overlap(self):
+        self.backend.insert_reservation(reservation("1", "u1", 8))
+        with self.assertRaisesRegex(ValueError, queries.CONFLICT_MESSAGE):
+            self.backend.delete_device("2", "reassign", "1")
+        self.assertEqual(len(self.devices()), 2)
+        self.assertEqual(self.maintenances(), {"m1": "1", "m2": "2"})
+
+
+class JsonDeletePoliciesTest(DeletePolicies, DatabaseTestCase):
+    """The reverse indexes and interval indexes are kept up to date by the deletes, not rebuilt."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        queries._references()
+        queries._reservation_index()
+
+    def tearDown(self) -> None:
+        refs = queries._cache["refs"]
+        index = queries._reservation_index()
+        queries._cache.update(refs=None, index=None)
+        self.assertEqual(self.normalized(refs), self.normalized(queries._references()))
+        self.assertEqual(self.intervals(index), self.intervals(queries._reservation_index()))
+        super().tearDown()
+
+    @staticmethod
+    def normalized(refs: dict) -> dict:
+        return {kind: {key: ids for key, ids in by_key.items() if ids} for kind, by_key in refs.items()}
+
+    @staticmethod
+    def intervals(index: dict) -> dict:
+        out = {}
+        for dev_id, device_index in index.items():
+            rows = [(start, end, r["user_id"], r["device_id"]) for start, end, r in device_index]
+            if rows:
+                out[dev_id] = rows
+        return out
+
+
+class SqliteDeletePoliciesTest(DeletePolicies, DatabaseTestCase):
+    """The maintenance records stay in database.json next to the SQLite database."""
+
+    backend = sqlite_backend
+
+    def open_backend(self) -> None:
+        patcher = mock.patch.object(sqlite_backend, "DB_PATH", self.db_path.with_name("database.sqlite3"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rolled_back_delete_keeps_the_maintenances(self):
+        failing = mock.patch.object(sqlite_backend, "_bump_version", side_effect=sqlite3.OperationalError("disk I/O error"))
+        for delete in (lambda: sqlite_backend.delete_device("2", "cascade"), lambda: sqlite_backend.delete_user("u1", "cascade")):
+            with failing, self.assertRaises(sqlite3.OperationalError):
+                delete()
+            self.assertEqual(len(self.devices()), 2)
+            self.assertEqual(self.maintenances(), {"m1": "1", "m2": "2"})
+
+
+if __name__ == "__main__":
+    unittest.main()
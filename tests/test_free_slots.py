@@ -0,0 +1,87 @@
+import random
+import re
+import unittest
+from datetime import datetime, time, timedelta
+from unittest import mock
+
+import queries
+import sqlite_backend
+from epoch_minutes import duration_minutes, from_minutes, to_minutes
+from free_slots import INVALID_WORKDAYS_MESSAGE, earliest_slot
+from support import DatabaseTestCase
+
+
+def brute_force(busy: dict, after: datetime, duration: timedelta, work_start: time, work_end: time, workdays, days: int = 21):
+    """The first minute (and the first device in order) the window fits, tried one by one."""
+    if after.second or after.microsecond:
+        after = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    length = duration_minutes(duration)
+    first = to_minutes(after)
+    for t in range(first, first + days * 1440):
+        start = from_minutes(t)
+        if start.weekday() not in workdays or start.time() < work_start:
+            continue
+        if from_minutes(t + length) > datetime.combine(start.date(), work_end):
+            continue
+        for device_id, intervals in busy.items():
+            if all(end <= t or begin >= t + length for begin, end in intervals):
+                return device_id, start
+    return None
+
+
+class EarliestSlotTest(unittest.TestCase):
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        # Thursday: the searches cross evenings, weekends and bookings that span day boundaries
+        base = datetime(2026, 1, 8)
+        for case in range(60):
+            busy = {}
+            for device_id in ("1", "2", "3")[: rng.randint(1, 3)]:
+                intervals = []
+                for _ in range(rng.randint(0, 8)):
+                    begin = to_minutes(base) + rng.randrange(0, 6 * 1440, 15)
+                    intervals.append((begin, begin + rng.randrange(15, 1200, 15)))
+                busy[device_id] = sorted(intervals)
+            after = base + timedelta(minutes=rng.randrange(0, 5 * 1440), seconds=rng.choice((0, 30)))
+            duration = timedelta(minutes=rng.randrange(15, 600, 5))
+            work_start, work_end = rng.choice(((time(8), time(18)), (time(0), time(23, 59)), (time(9, 30), time(12))))
+            workdays = rng.choice(((0, 1, 2, 3, 4), (5, 6), (0,), (4, 0), tuple(range(7))))
+            with self.subTest(case=case):
+                self.assertEqual(
+                    earliest_slot({k: iter(v) for k, v in busy.items()}, after, duration, work_start, work_end, workdays),
+                    brute_force(busy, after, duration, work_start, work_end, workdays),
+                )
+
+    def test_invalid_workdays(self):
+        for workdays in ((), (7,), (-1,), ("0",), (0, 9)):
+            with self.subTest(workdays=workdays):
+                with self.assertRaisesRegex(ValueError, re.escape(INVALID_WORKDAYS_MESSAGE)):
+                    earliest_slot({"1": iter(())}, datetime(2026, 1, 8), timedelta(hours=1), workdays=workdays)
+
+
+class FindFreeSlotTest(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        queries.add_user("u1", "User")
+        queries.add_device("Scope", "u1")
+        # Friday afternoon into Monday morning
+        queries.insert_reservation({"device_id": "1", "user_id": "u1", "start": "2026-01-09T13:00", "end": "2026-01-12T10:00"})
+
+    def test_slot_after_a_booking_over_the_weekend(self):
+        self.assertEqual(
+            queries.find_free_slot(timedelta(hours=2), datetime(2026, 1, 9, 12)),
+            {"device_id": "1", "start": datetime(2026, 1, 12, 10), "end": datetime(2026, 1, 12, 12)},
+        )
+
+    def test_invalid_workdays_are_rejected_up_front(self):
+        with mock.patch.object(sqlite_backend, "DB_PATH", self.db_path.with_name("database.sqlite3")):
+            for find in (queries.find_free_slot, sqlite_backend.find_free_slot):
+                with self.subTest(backend=find.__module__):
+                    with self.assertRaisesRegex(ValueError, re.escape(INVALID_WORKDAYS_MESSAGE)):
+                        find(timedelta(hours=1), datetime(2026, 1, 9), workdays=(7,))
+                    with self.assertRaisesRegex(ValueError, re.escape(INVALID_WORKDAYS_MESSAGE)):
+                        find(timedelta(hours=1), datetime(2026, 1, 9), workdays=())
+
+
+if __name__ == "__main__":
+    unittest.main()
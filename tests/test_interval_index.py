@@ -0,0 +1,79 @@
+import random
+import unittest
+from datetime import datetime, timedelta
+
+from epoch_minutes import format_minutes, parse_minutes, to_minutes, to_minutes_ceil
+from interval_index import IntervalIndex
+
+BASE = to_minutes(datetime(2026, 1, 5))
+
+
+def random_intervals(rng: random.Random, n: int) -> list:
+    items = []
+    for no in range(n):
+        start = BASE + rng.randrange(0, 3 * 1440, 15)
+        items.append((start, start + rng.randrange(15, 600, 15), no))
+    return items
+
+
+def overlapping(items: list, start, end) -> list:
+    """Half-open [start, end) against half-open intervals, one by one."""
+    return sorted(item for item in items if (start is None or item[1] > start) and (end is None or item[0] < end))
+
+
+class IntervalIndexTest(unittest.TestCase):
+    def test_queries_match_brute_force(self):
+        rng = random.Random(17)
+        for case in range(40):
+            items = random_intervals(rng, rng.randint(0, 30))
+            # bulk built and built one by one, with some removed again
+            bulk = IntervalIndex.from_intervals(items)
+            single = IntervalIndex()
+            extra = [(start, end, f"x{no}") for start, end, no in random_intervals(rng, 5)]
+            for item in items + extra:
+                single.add(*item)
+            for item in extra:
+                self.assertTrue(single.remove(*item))
+            self.assertFalse(single.remove(BASE, BASE + 1, "missing"))
+
+            probes = [(BASE + rng.randrange(-60, 4 * 1440, 15), rng.randrange(0, 300, 15)) for _ in range(30)]
+            # touching the ends and starts of existing intervals
+            probes += [(end, 15) for _, end, _ in items[:5]] + [(start - 15, 15) for start, _, _ in items[:5]]
+            for start, length in probes:
+                end = start + length
+                expected = overlapping(items, start, end)
+                for index in (bulk, single):
+                    with self.subTest(case=case, start=format_minutes(start), length=length):
+                        self.assertEqual(index.overlaps_any(start, end), bool(expected))
+                        self.assertEqual(sorted(index.overlapping(start, end)), expected)
+                        self.assertEqual(sorted(index.iter_range(start, end)), expected)
+                        self.assertEqual(sorted(index.snapshot_range(start, end, reverse=True)), expected)
+            for start, end in ((None, None), (None, BASE + 1440), (BASE + 1440, None)):
+                with self.subTest(case=case, start=start, end=end):
+                    self.assertEqual([item[0] for item in bulk.iter_range(start, end)], [s for s, _, _ in sorted(overlapping(items, start, end))])
+
+    def test_minute_rounding_keeps_overlaps_exact(self):
+        # minute-precision reservations against query times with seconds
+        rng = random.Random(1)
+        index = IntervalIndex.from_intervals(random_intervals(rng, 25))
+        for _ in range(300):
+            start = datetime(2026, 1, 5) + timedelta(seconds=rng.randrange(0, 3 * 86400, 30))
+            end = start + timedelta(seconds=rng.randrange(1, 3 * 3600))
+            expected = any(
+                datetime.fromisoformat(format_minutes(s)) < end and datetime.fromisoformat(format_minutes(e)) > start
+                for s, e, _ in index
+            )
+            with self.subTest(start=start, end=end):
+                self.assertEqual(index.overlaps_any(to_minutes(start), to_minutes_ceil(end)), expected)
+
+    def test_parse_and_format_round_trip(self):
+        for minutes in (0, 59, 1440, BASE, BASE + 1439, BASE + 1440 * 365 + 61):
+            with self.subTest(minutes=minutes):
+                self.assertEqual(parse_minutes(format_minutes(minutes)), minutes)
+        for value in (None, "", "2026-13-01T00:00", 5):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_minutes(value))
+
+
+if __name__ == "__main__":
+    unittest.main()
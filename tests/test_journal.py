@@ -0,0 +1,99 @@
+import os
+import stat
+import unittest
+from unittest import mock
+
+import queries
+from support import DatabaseTestCase, reset_cache
+
+
+def reservation(device_id: str, start: str, end: str, user_id: str = "u1") -> dict:
+    return {"device_id": device_id, "user_id": user_id, "start": start, "end": end}
+
+
+class JournalTest(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        queries.add_user("u1", "User")
+        queries.add_device("Scope", "u1")
+
+    def test_mutations_are_appended_not_rewritten(self):
+        data = self.db_path.read_bytes()
+        queries.insert_reservation(reservation("1", "2026-01-07T09:00", "2026-01-07T10:00"))
+        self.assertEqual(self.db_path.read_bytes(), data)
+        self.assertEqual(len(self.journal_path.read_bytes().splitlines()), 3)
+
+    def test_replay_after_crash(self):
+        queries.insert_reservation(reservation("1", "2026-01-07T09:00", "2026-01-07T10:00"))
+        queries.sync()
+        reset_cache()
+        self.assertEqual(queries.get_users(), [{"id": "u1", "name": "User"}])
+        self.assertEqual([d["id"] for d in queries.get_devices()], ["1"])
+        self.assertEqual(len(queries.list_reservations()), 1)
+
+    def test_torn_tail_is_cut_off(self):
+        queries.insert_reservation(reservation("1", "2026-01-07T09:00", "2026-01-07T10:00"))
+        good = self.journal_path.read_bytes()
+        # the process died in the middle of the next append
+        torn = queries._encode_record({"seq": 4, "op": "add_user", "args": {"user_id": "u2", "name": "Lost"}})
+        self.journal_path.write_bytes(good + torn[: len(torn) // 2])
+
+        reset_cache()
+        self.assertEqual([u["id"] for u in queries.get_users()], ["u1"])
+        self.assertEqual(self.journal_path.read_bytes(), good)
+
+        # later appends are not hidden behind the garbage
+        queries.add_user("u3", "Later")
+        reset_cache()
+        self.assertEqual([u["id"] for u in queries.get_users()], ["u1", "u3"])
+
+    def test_replay_stops_at_a_corrupted_record(self):
+        queries.add_user("u2", "Second")
+        queries.add_user("u3", "Third")
+        lines = self.journal_path.read_bytes().splitlines(keepends=True)
+        # flip a byte in the payload of the fourth record (add_user u2): its checksum no longer matches
+        lines[2] = lines[2].replace(b"Second", b"Secand")
+        self.journal_path.write_bytes(b"".join(lines))
+
+        reset_cache()
+        self.assertEqual([u["id"] for u in queries.get_users()], ["u1"])
+        self.assertEqual(len(self.journal_path.read_bytes().splitlines()), 2)
+
+    def test_crash_between_compaction_and_truncation(self):
+        queries.insert_reservation(reservation("1", "2026-01-07T09:00", "2026-01-07T10:00"))
+        journal = self.journal_path.read_bytes()
+        queries.compact()
+        self.assertEqual(self.journal_path.read_bytes(), b"")
+        # the journal was not truncated: its records are contained in the snapshot already
+        self.journal_path.write_bytes(journal)
+
+        reset_cache()
+        self.assertEqual(len(queries.list_reservations()), 1)
+        self.assertEqual([d["id"] for d in queries.get_devices()], ["1"])
+
+    def test_automatic_compaction(self):
+        with mock.patch.object(queries, "JOURNAL_COMPACT_AFTER", 5):
+            for i in range(6):
+                queries.insert_reservation(reservation("1", f"2026-01-{i + 1:02d}T09:00", f"2026-01-{i + 1:02d}T10:00"))
+        self.assertEqual(self.read_file()["journal_seq"], 5)
+        reset_cache()
+        self.assertEqual(len(queries.list_reservations()), 6)
+
+    def test_file_permissions_survive_writes(self):
+        mode = stat.S_IMODE(self.db_path.stat().st_mode)
+        self.assertEqual(mode, 0o666 & ~queries._UMASK)
+        for mode in (0o644, 0o640):
+            os.chmod(self.db_path, mode)
+            queries.add_user(f"u{mode}", "User")
+            queries.compact()
+            self.assertEqual(stat.S_IMODE(self.db_path.stat().st_mode), mode)
+
+    def test_trimmed_journal_keeps_its_permissions(self):
+        queries.insert_reservation(reservation("1", "2026-01-07T09:00", "2026-01-07T10:00"))
+        os.chmod(self.journal_path, 0o644)
+        queries._trim_journal(1)
+        self.assertEqual(stat.S_IMODE(self.journal_path.stat().st_mode), 0o644)
+
+
+if __name__ == "__main__":
+    unittest.main()
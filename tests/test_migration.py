@@ -0,0 +1,81 @@
+import unittest
+
+import queries
+from database_inheritance import DatabaseConnector
+from support import DatabaseTestCase, reset_cache
+
+LEGACY_DB = {
+    "users": [{"id": "admin@mci.edu", "name": "Admin"}, {"id": "tech@mci.edu", "name": "Tech"}],
+    "devices": [
+        {"id": "1", "device_name": "Laser", "managed_by_user_id": "Admin (admin@mci.edu)", "is_active": True},
+        {"device_name": "Scope", "managed_by_user_id": "tech@mci.edu"},
+    ],
+    "reservations": [
+        {"device_name": "Scope", "user_id": "tech@mci.edu", "start": "2026-01-07T09:00", "end": "2026-01-07T10:00"},
+        {"device_name": "unknown", "user_id": "tech@mci.edu", "start": "2026-01-07T09:00", "end": "2026-01-07T10:00"},
+    ],
+    "maintenances": {"1": {"id": "1", "device_id": "1", "maintenance_cost": 10.0}},
+}
+
+
+class MigrationTest(DatabaseTestCase):
+    def test_legacy_document_is_migrated_and_written_once(self):
+        self.write_file(LEGACY_DB)
+
+        self.assertEqual(
+            queries.get_devices(),
+            [
+                {"id": "1", "device_name": "Laser", "managed_by_user_id": "admin@mci.edu", "is_active": True},
+                {"id": "2", "device_name": "Scope", "managed_by_user_id": "tech@mci.edu", "is_active": True},
+            ],
+        )
+        self.assertEqual(queries.list_reservations(), [
+            {"device_id": "2", "user_id": "tech@mci.edu", "start": "2026-01-07T09:00", "end": "2026-01-07T10:00"},
+        ])
+        stored = self.read_file()
+        self.assertEqual(stored["schema_version"], queries.SCHEMA_VERSION)
+        # tables of the TinyDB models are kept
+        self.assertEqual(stored["maintenances"], LEGACY_DB["maintenances"])
+
+        # a fresh process reads the migrated file without writing it again
+        stat = self.db_path.stat()
+        reset_cache()
+        queries.get_users()
+        self.assertEqual(self.db_path.stat().st_mtime_ns, stat.st_mtime_ns)
+        self.assertEqual(self.db_path.stat().st_ino, stat.st_ino)
+
+    def test_current_document_is_not_rewritten_on_read(self):
+        queries.add_user("u1", "User")
+        queries.compact()
+        data = self.db_path.read_bytes()
+        stat = self.db_path.stat()
+
+        reset_cache()
+        self.assertEqual(queries.get_users(), [{"id": "u1", "name": "User"}])
+        self.assertEqual(self.db_path.read_bytes(), data)
+        self.assertEqual(self.db_path.stat().st_mtime_ns, stat.st_mtime_ns)
+
+    def test_unreadable_file_is_left_alone(self):
+        self.db_path.write_bytes(b"{not json")
+        self.assertEqual(queries.get_users(), [])
+        self.assertEqual(self.db_path.read_bytes(), b"{not json")
+
+    def test_tinydb_tables_next_to_the_metadata(self):
+        # schema_version and journal_seq are plain ints at the top level of the file;
+        # the TinyDB models must only ever see the tables
+        queries.add_user("u1", "User")
+        table = DatabaseConnector().get_table("maintenances")
+        table.insert({"id": "m1", "device_id": "1"})
+        queries.compact()
+        stored = self.read_file()
+        self.assertIsInstance(stored["schema_version"], int)
+        self.assertIsInstance(stored["journal_seq"], int)
+
+        reset_cache()
+        self.assertEqual([doc["id"] for doc in table.all()], ["m1"])
+        self.assertNotIn("schema_version", DatabaseConnector().db.tables())
+        self.assertNotIn("journal_seq", DatabaseConnector().db.tables())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import unittest
+from datetime import date, datetime, time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import queries
+from database_inheritance import DatabaseConnector, _encode
+from devices_inheritance import Device
+from support import DatabaseTestCase
+from users_inheritance import User
+from wartungen import MaintenanceManager
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def quietly(func, *args):
+    # the models report every write on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+
+class AttributeIndexTest(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        queries.add_user("u1", "User")
+        queries.add_device("Scope", "u1")
+        queries.add_device("Laser", "u1")
+        self.maintenance = MaintenanceManager("m1", "1", datetime(2026, 1, 1), 30, 10.0)
+        quietly(self.maintenance.store_data)
+
+    def find(self, attribute: str, value: str):
+        return quietly(MaintenanceManager.find_by_attribute, attribute, value)
+
+    def test_own_writes(self):
+        self.assertEqual(self.find("device_id", "1").id, "m1")
+        self.maintenance.device_id = "2"
+        quietly(self.maintenance.store_data)
+        self.assertIsNone(self.find("device_id", "1"))
+        self.assertEqual(self.find("device_id", "2").id, "m1")
+        quietly(self.maintenance.delete)
+        self.assertIsNone(self.find("id", "m1"))
+
+    def test_changes_made_by_queries(self):
+        self.assertEqual(self.find("device_id", "1").id, "m1")
+        self.assertIsNone(self.find("device_id", "2"))
+        queries.delete_device("1", "reassign", "2")
+        self.assertEqual(self.find("device_id", "2").id, "m1")
+        self.assertIsNone(self.find("device_id", "1"))
+
+    def test_changes_of_another_process(self):
+        self.assertIsNone(self.find("device_id", "2"))
+        code = (
+            "from datetime import datetime\n"
+            "from wartungen import MaintenanceManager\n"
+            "MaintenanceManager('m2', '2', datetime(2026, 1, 1), 30, 5.0).store_data()\n"
+        )
+        env = {**os.environ, "CASE_STUDY_DB_PATH": str(self.db_path)}
+        subprocess.run([sys.executable, "-c", code], cwd=REPO, env=env, check=True, capture_output=True)
+        self.assertEqual(self.find("device_id", "2").id, "m2")
+
+
+class ConnectorSettingsTest(DatabaseTestCase):
+    def test_write_back_settings_configure_the_write_behind(self):
+        with mock.patch.object(DatabaseConnector, "_DatabaseConnector__instance", None), \
+                mock.patch.object(DatabaseConnector, "WRITE_CACHE_SIZE", 5), \
+                mock.patch.object(DatabaseConnector, "FLUSH_INTERVAL", 60.0), \
+                mock.patch.object(queries, "WRITE_BEHIND_MAX_PENDING", 100):
+            DatabaseConnector()
+            self.assertEqual((queries.WRITE_BEHIND_MAX_PENDING, queries.WRITE_BEHIND_INTERVAL), (5, 60.0))
+
+
+class Booking(MaintenanceManager):
+    # no __slots__: the extra fields live in __dict__
+    def __init__(self, *args, slots=None, note=None) -> None:
+        super().__init__(*args)
+        self.slots = slots
+        self.note = note
+
+
+def legacy_document(cls, *args, **kwargs) -> dict:
+    """What store_data stored before the field plan: __to_dict() of an instance whose fields sit in
+    its __dict__ in assignment order."""
+    fields = SimpleNamespace()
+
+    class Recording(cls):
+        def __setattr__(self, name, value):
+            setattr(fields, name, value)
+
+    obj = Recording(*args, **kwargs)
+    return obj._Serializable__to_dict(fields)
+
+
+class DocumentTest(unittest.TestCase):
+    def test_same_documents_as_before(self):
+        created, updated = datetime(2025, 3, 4, 5, 6, 7, 890), datetime(2026, 1, 2, 3, 4)
+        cases = [
+            (User, ("u1", "User", created, updated), {}),
+            (User, ("u2", None, created, updated), {}),
+            (Device, ("1", "u1", date(2030, 12, 31), created, updated), {}),
+            (Device, ("2", None, datetime(2030, 12, 31, 23, 59), created, updated), {}),
+            (MaintenanceManager, ("m1", "1", datetime(2026, 1, 1, 8), 30, 12.5, datetime(2030, 1, 1), created, updated), {}),
+            (MaintenanceManager, ("m2", "1", None, None, 0.0, None, created, updated), {}),
+            (MaintenanceManager, ("m3", "2", date(2026, 1, 1), 7, 3, date(2027, 1, 1), created, updated), {}),
+            (Booking, ("m4", "1", datetime(2026, 1, 1), 30, 1.0, None, created, updated), {
+                "slots": [date(2026, 1, 1), (time(9), time(10, 30)), {"by": "u1", "at": None}],
+                "note": SimpleNamespace(text="Filter", due=date(2026, 2, 1)),
+            }),
+            (Booking, ("m5", "1", None, None, 0.0, None, created, updated), {}),
+        ]
+        for cls, args, kwargs in cases:
+            with self.subTest(cls=cls.__name__, id=args[0]):
+                document = cls(*args, **kwargs)._to_document()
+                expected = legacy_document(cls, *args, **kwargs)
+                self.assertEqual(list(document), list(expected))
+                self.assertEqual(json.dumps(_encode(document)), json.dumps(_encode(expected)))
+
+
+if __name__ == "__main__":
+    unittest.main()
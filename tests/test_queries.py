@@ -0,0 +1,115 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import queries
+from database_inheritance import DatabaseConnector
+from support import DatabaseTestCase
+from tinydb import Query
+
+
+def day(d: int, hour: int = 9) -> str:
+    return datetime(2026, 1, d, hour).isoformat(timespec="minutes")
+
+
+class IterReservationsTest(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        queries.add_user("u1", "User")
+        queries.add_user("u2", "Other")
+        queries.add_device("Scope", "u1")
+        queries.add_device("Laser", "u1")
+        queries.insert_reservations(
+            [{"device_id": "1", "user_id": "u1", "start": day(d), "end": day(d, 10)} for d in range(10, 20)]
+            + [{"device_id": "2", "user_id": "u2", "start": day(d, 11), "end": day(d, 12)} for d in range(10, 20)]
+        )
+
+    def starts(self, rows) -> list:
+        return [r["start"] for r in rows]
+
+    def test_filters_and_pages(self):
+        self.assertEqual(self.starts(queries.iter_reservations(device_id="1", limit=3, offset=2)), [day(12), day(13), day(14)])
+        self.assertEqual(
+            self.starts(queries.iter_reservations(user_id="u2", descending=True, limit=2)), [day(19, 11), day(18, 11)]
+        )
+        self.assertEqual(
+            self.starts(queries.iter_reservations(start=datetime(2026, 1, 12, 9, 30), end=datetime(2026, 1, 13, 10))),
+            [day(12), day(12, 11), day(13)],
+        )
+
+    def test_writes_during_iteration_do_not_disturb_it(self):
+        for descending, days in ((False, range(1, 5)), (True, range(5, 9))):
+            with self.subTest(descending=descending):
+                rows = queries.iter_reservations(device_id="1", descending=descending)
+                first = next(rows)
+                expected = self.starts(queries.iter_reservations(device_id="1", descending=descending))
+                # shifts every position of the device's index list
+                queries.insert_reservations([{"device_id": "1", "user_id": "u2", "start": day(d), "end": day(d, 10)} for d in days])
+                self.assertEqual([first["start"]] + self.starts(rows), expected)
+
+    def test_deletes_during_iteration_do_not_disturb_it(self):
+        rows = queries.iter_reservations()
+        first = next(rows)
+        expected = self.starts(queries.iter_reservations())
+        queries.delete_user("u2", "cascade")
+        self.assertEqual([first["start"]] + self.starts(rows), expected)
+        self.assertEqual(len(list(queries.iter_reservations())), 10)
+
+
+class MemoizedTest(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.calls = []
+
+        @queries.memoized
+        def square(x: int) -> int:
+            self.calls.append(x)
+            return x * x
+
+        self.square = square
+
+    def test_results_are_reused_until_the_data_changes(self):
+        self.assertEqual([self.square(2), self.square(2)], [4, 4])
+        self.assertEqual(self.calls, [2])
+        queries.add_user("u1", "User")
+        self.assertEqual(self.square(2), 4)
+        self.assertEqual(self.calls, [2, 2])
+
+    def test_cache_is_bounded(self):
+        with mock.patch.object(queries, "MEMO_SIZE", 3):
+            for x in range(10):
+                self.square(x)
+            self.assertEqual(len(queries._memo), 3)
+            self.square(7)  # most recently used now, 8 is the oldest
+            self.square(0)
+            self.assertEqual(len(queries._memo), 3)
+            self.square(7)
+            self.assertEqual(self.calls, list(range(10)) + [0])
+
+    def test_results_of_older_versions_are_dropped(self):
+        for x in range(5):
+            self.square(x)
+        queries.add_user("u1", "User")
+        self.square(0)
+        self.assertEqual(len(queries._memo), 1)
+
+
+class WriteTablesTest(DatabaseTestCase):
+    def test_unchanged_tables_are_not_written(self):
+        queries.write_tables({"maintenances": {"1": {"device_id": "1"}}})
+        version = queries.db_version()
+        journal = queries._journal_path().read_bytes()
+        queries.write_tables({"maintenances": {"1": {"device_id": "1"}}})
+        # TinyDB writes the table back after an update / remove that matches no document
+        table = DatabaseConnector().get_table("maintenances")
+        table.remove(Query().device_id == "9")
+        table.update({"device_id": "2"}, Query().device_id == "9")
+        self.assertEqual(queries.db_version(), version)
+        self.assertEqual(queries._journal_path().read_bytes(), journal)
+
+        queries.write_tables({"maintenances": {"1": {"device_id": "2"}}})
+        self.assertEqual(queries.db_version(), version + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from datetime import date, datetime
+from unittest import mock
+
+import queries
+import sqlite_backend
+from support import DatabaseTestCase
+
+# Mondays 5., 12., 19. and 26. January 2026, 09:00-10:00
+WEEKLY = {"device_id": "1", "user_id": "u1", "start": "2026-01-05T09:00", "end": "2026-01-05T10:00", "freq": "weekly", "count": 4}
+
+
+def single(d: int, start: str = "09:30", end: str = "10:30", device_id: str = "1") -> dict:
+    return {"device_id": device_id, "user_id": "u2", "start": f"2026-01-{d:02d}T{start}", "end": f"2026-01-{d:02d}T{end}"}
+
+
+class RecurringConflictTest(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        queries.add_user("u1", "User")
+        queries.add_user("u2", "Other")
+        queries.add_device("Scope", "u1")
+        queries.add_device("Laser", "u1")
+
+    def test_single_against_recurring(self):
+        queries.add_recurring_reservation(WEEKLY, check_conflicts=True)
+        with self.assertRaisesRegex(ValueError, queries.CONFLICT_MESSAGE):
+            queries.insert_reservation(single(19), check_conflicts=True)
+        self.assertFalse(queries.is_device_free("1", datetime(2026, 1, 19, 9, 30), datetime(2026, 1, 19, 10, 30)))
+        self.assertEqual(
+            [(r["start"], r["recurring_id"]) for r in queries.find_conflicts("1", datetime(2026, 1, 19), datetime(2026, 1, 20))],
+            [("2026-01-19T09:00", "1")],
+        )
+        # next to an occurrence, after the last one, on another device
+        queries.insert_reservation(single(19, "10:00", "11:00"), check_conflicts=True)
+        queries.insert_reservation({**single(19), "start": "2026-02-02T09:00", "end": "2026-02-02T10:00"}, check_conflicts=True)
+        queries.insert_reservation(single(19, device_id="2"), check_conflicts=True)
+        self.assertEqual(len(queries.list_reservations()), 3)
+
+    def test_skipped_occurrence_is_free(self):
+        queries.add_recurring_reservation(WEEKLY)
+        queries.skip_recurring_occurrence("1", date(2026, 1, 12))
+        queries.insert_reservation(single(12), check_conflicts=True)
+        self.assertEqual(
+            [r["start"] for r in queries.iter_reservations(device_id="1")],
+            ["2026-01-05T09:00", "2026-01-12T09:30", "2026-01-19T09:00", "2026-01-26T09:00"],
+        )
+
+    def test_recurring_against_single(self):
+        queries.insert_reservation(single(26))
+        with self.assertRaisesRegex(ValueError, queries.CONFLICT_MESSAGE):
+            queries.add_recurring_reservation(WEEKLY, check_conflicts=True)
+        # the booking lies beyond count
+        queries.add_recurring_reservation({**WEEKLY, "count": 3}, check_conflicts=True)
+        self.assertEqual([r["id"] for r in queries.get_recurring_reservations()], ["1"])
+
+    def test_recurring_against_recurring(self):
+        queries.add_recurring_reservation(WEEKLY)
+        # every second day from 7 January meets the Monday 19 January
+        with self.assertRaisesRegex(ValueError, queries.CONFLICT_MESSAGE):
+            queries.add_recurring_reservation(
+                {**WEEKLY, "start": "2026-01-07T09:30", "end": "2026-01-07T10:30", "freq": "daily", "interval": 2, "count": 10},
+                check_conflicts=True,
+            )
+        # same weekdays, other hours
+        queries.add_recurring_reservation({**WEEKLY, "start": "2026-01-05T10:00", "end": "2026-01-05T11:00"}, check_conflicts=True)
+
+    def test_import_into_sqlite_expands_the_rules(self):
+        queries.add_recurring_reservation({**WEEKLY, "exceptions": ["2026-01-12"]})
+        queries.insert_reservation(single(6))
+        with mock.patch.object(sqlite_backend, "DB_PATH", self.db_path.with_name("database.sqlite3")):
+            self.assertEqual(sqlite_backend.import_json(self.db_path)["reservations"], 4)
+            self.assertEqual(
+                sorted(r["start"] for r in sqlite_backend.list_reservations()),
+                ["2026-01-05T09:00", "2026-01-06T09:30", "2026-01-19T09:00", "2026-01-26T09:00"],
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
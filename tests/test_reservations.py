@@ -0,0 +1,71 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import queries
+import reservations
+from support import DatabaseTestCase
+
+
+def item(device_id: str, start: datetime, end: datetime) -> dict:
+    return {"device_id": device_id, "user_email": "u1", "start_date": start, "end_date": end}
+
+
+class ReservationsBatchTest(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        queries.add_user("u1", "User")
+        queries.add_device("Scope", "u1")
+        queries.add_device("Laser", "u1")
+        queries.insert_reservation({"device_id": "1", "user_id": "u1", "start": "2026-01-07T09:00", "end": "2026-01-07T10:00"})
+
+    def test_sweep(self):
+        results = reservations.create_reservations_batch([
+            item("1", datetime(2026, 1, 7, 9, 30), datetime(2026, 1, 7, 11)),  # existing booking
+            item("2", datetime(2026, 1, 7, 9), datetime(2026, 1, 7, 11)),
+            item("2", datetime(2026, 1, 7, 10), datetime(2026, 1, 7, 12)),  # overlaps the previous item
+            item("1", datetime(2026, 1, 7, 12), datetime(2026, 1, 7, 11)),
+        ])
+        self.assertEqual([r["accepted"] for r in results], [False, True, False, False])
+        self.assertEqual(results[0]["reason"], queries.CONFLICT_MESSAGE)
+        self.assertEqual(len(queries.list_reservations()), 2)
+
+    def _race(self, start: str, end: str):
+        """insert_reservations that lets another session book device 2 first."""
+        insert = queries.insert_reservations
+        raced = []
+
+        def racing_insert(rows, check_conflicts=False):
+            if not raced:
+                raced.append(True)
+                insert([{"device_id": "2", "user_id": "u2", "start": start, "end": end}])
+            return insert(rows, check_conflicts=check_conflicts)
+
+        return mock.patch.object(queries, "insert_reservations", racing_insert)
+
+    def test_booked_meanwhile_is_rejected(self):
+        with self._race("2026-01-08T09:00", "2026-01-08T10:00"):
+            results = reservations.create_reservations_batch([
+                item("2", datetime(2026, 1, 8, 9), datetime(2026, 1, 8, 10)),
+                item("2", datetime(2026, 1, 9, 9), datetime(2026, 1, 9, 10)),
+            ])
+        self.assertEqual([r["accepted"] for r in results], [False, True])
+        self.assertEqual(results[0]["reason"], queries.CONFLICT_MESSAGE)
+        self.assertIsNone(results[0]["reservation"])
+        self.assertEqual(
+            [(r["user_id"], r["start"]) for r in queries.iter_reservations(device_id="2")],
+            [("u2", "2026-01-08T09:00"), ("u1", "2026-01-09T09:00")],
+        )
+
+    def test_booked_meanwhile_all_or_nothing(self):
+        with self._race("2026-01-08T09:00", "2026-01-08T10:00"):
+            results = reservations.create_reservations_batch([
+                item("2", datetime(2026, 1, 8, 9), datetime(2026, 1, 8, 10)),
+                item("2", datetime(2026, 1, 9, 9), datetime(2026, 1, 9, 10)),
+            ], all_or_nothing=True)
+        self.assertEqual([r["accepted"] for r in results], [False, False])
+        self.assertEqual([r["user_id"] for r in queries.iter_reservations(device_id="2")], ["u2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import marshal
+import unittest
+from unittest import mock
+
+import queries
+from epoch_minutes import parse_minutes
+from support import DatabaseTestCase, reset_cache
+
+
+def reservation(device_id: str, d: int, hour: int = 9) -> dict:
+    return {"device_id": device_id, "user_id": "u1", "start": f"2026-01-{d:02d}T{hour:02d}:00", "end": f"2026-01-{d:02d}T{hour + 1:02d}:30"}
+
+
+class BinarySnapshotTest(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        patcher = mock.patch.object(queries, "BINARY_SNAPSHOT", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        queries.add_user("u1", "User")
+        queries.add_device("Scope", "u1")
+        queries.add_device("Laser", "u1")
+        queries.insert_reservations([reservation(str(d % 2 + 1), d) for d in range(5, 15)])
+        queries.compact()
+        # a snapshot whose contents differ from database.json: loading it shows the other name
+        self.foreign = {**self.read_file(), "users": {"u1": {"name": "Foreign"}}}
+
+    def header(self, **changes) -> tuple:
+        fields = ("magic", "format", "major", "minor", "marshal", "inode", "mtime", "size")
+        header = dict(zip(fields, queries._snapshot_header(queries._stat_key(self.db_path))))
+        header.update(changes)
+        return tuple(header.values())
+
+    def write_snapshot(self, header: tuple, db: dict) -> bytes:
+        data = queries._SNAPSHOT_HEADER.pack(*header) + marshal.dumps((db, b"", b""))
+        queries._snapshot_path().write_bytes(data)
+        return data
+
+    def user_name(self) -> str:
+        reset_cache()
+        return queries.get_users()[0]["name"]
+
+    def test_matching_snapshot_is_used(self):
+        self.assertTrue(queries._snapshot_path().exists())
+        self.write_snapshot(self.header(), self.foreign)
+        self.assertEqual(self.user_name(), "Foreign")
+
+    def test_snapshot_of_another_database_json_is_ignored(self):
+        self.write_snapshot(self.header(), self.foreign)
+        # database.json rewritten (other inode, mtime and size) after the snapshot was made
+        self.write_file({**self.read_file(), "users": {"u1": {"name": "Renamed"}}})
+        self.assertEqual(self.user_name(), "Renamed")
+        # the stale snapshot was replaced by one of the new file
+        self.assertEqual(self.user_name(), "Renamed")
+
+    def test_mismatching_header_is_ignored(self):
+        for changes in (
+            {"magic": b"XXXXXXXX"},
+            {"format": queries._SNAPSHOT_FORMAT + 1},
+            {"minor": self.header()[3] + 1},
+            {"marshal": marshal.version + 1},
+            {"inode": self.header()[5] + 1},
+            {"mtime": self.header()[6] - 1},
+            {"size": self.header()[7] + 1},
+        ):
+            with self.subTest(changes=changes):
+                self.write_snapshot(self.header(**changes), self.foreign)
+                self.assertEqual(self.user_name(), "User")
+
+    def test_truncated_or_garbled_snapshot_is_ignored(self):
+        data = self.write_snapshot(self.header(), self.foreign)
+        size = queries._SNAPSHOT_HEADER.size
+        for cut in (0, 5, size - 1, size, size + 1, len(data) // 2, len(data) - 1):
+            with self.subTest(cut=cut):
+                queries._snapshot_path().write_bytes(data[:cut])
+                self.assertEqual(self.user_name(), "User")
+        with self.subTest("not a current database"):
+            self.write_snapshot(self.header(), {**self.foreign, "schema_version": 1})
+            self.assertEqual(self.user_name(), "User")
+
+    def assert_minutes_match_rows(self) -> None:
+        starts, ends = queries._cache["minutes"]
+        self.assertEqual(len(starts), 10)
+        rows = queries._cache["db"]["reservations"]
+        self.assertEqual(
+            list(zip(starts, ends)), [(parse_minutes(r["start"]), parse_minutes(r["end"])) for r in rows[: len(starts)]]
+        )
+
+    def intervals(self) -> dict:
+        return {
+            dev_id: [(start, end, r["start"], r["end"]) for start, end, r in device_index]
+            for dev_id, device_index in queries._reservation_index().items()
+        }
+
+    def assert_index_matches_parsed_rows(self) -> None:
+        from_columns = self.intervals()
+        queries._cache.update(index=None, minutes=None)
+        self.assertEqual(from_columns, self.intervals())
+
+    def test_columns_match_the_rows_after_a_replay(self):
+        # journaled after the snapshot was written, appended by the replay
+        queries.insert_reservations([reservation("1", d, 14) for d in range(5, 10)])
+        queries.sync()
+        reset_cache()
+        queries._load_db()
+        self.assertEqual(len(queries._cache["db"]["reservations"]), 15)
+        self.assert_minutes_match_rows()
+        self.assert_index_matches_parsed_rows()
+
+    def test_columns_are_dropped_when_the_replay_removes_rows(self):
+        queries.delete_device("1", "cascade")
+        queries.insert_reservation(reservation("2", 20))
+        queries.sync()
+        reset_cache()
+        queries._load_db()
+        self.assertIsNone(queries._cache["minutes"])
+        self.assertEqual(len(queries._cache["db"]["reservations"]), 6)
+        self.assert_index_matches_parsed_rows()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import random
+import unittest
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import queries
+from epoch_minutes import from_minutes, to_minutes
+from support import DatabaseTestCase
+from utilization import ReservationColumns, _booked_before, peak_occupancy, utilization_report
+
+BASE = to_minutes(datetime(2026, 1, 5))
+
+
+def columns(busy: dict) -> ReservationColumns:
+    """Columns as reservation_columns() builds them: sorted by (device, start)."""
+    device_ids = sorted(busy)
+    rows = sorted((i, start, end) for i, dev_id in enumerate(device_ids) for start, end in busy[dev_id])
+    return ReservationColumns(
+        device_ids,
+        np.ones(len(device_ids), dtype=bool),
+        np.array([i for i, _, _ in rows], dtype=np.int64),
+        np.array([start for _, start, _ in rows], dtype=np.int64),
+        np.array([end for _, _, end in rows], dtype=np.int64),
+    )
+
+
+def random_busy(rng: random.Random, devices: int, per_device: int) -> dict:
+    busy = {}
+    for no in range(devices):
+        intervals = []
+        for _ in range(rng.randint(0, per_device)):
+            start = BASE + rng.randrange(0, 3 * 1440, 5)
+            # overlapping ones too: the ends of a device are not sorted then
+            intervals.append((start, start + rng.randrange(5, 2000, 5)))
+        busy[str(no + 1)] = intervals
+    return busy
+
+
+def booked_before(intervals: list, t: int) -> int:
+    return sum(min(end, t) - start for start, end in intervals if start < t)
+
+
+def peak(busy: dict, lo: int, hi: int):
+    """Minute by minute: most reservations running at once in [lo, hi) and the first minute of it."""
+    best, at = 0, None
+    for t in range(lo, hi):
+        level = sum(start <= t < end for intervals in busy.values() for start, end in intervals)
+        if level > best:
+            best, at = level, t
+    return best, at
+
+
+class PrefixSumTest(unittest.TestCase):
+    def test_booked_before_matches_brute_force(self):
+        rng = random.Random(18)
+        for case in range(50):
+            busy = random_busy(rng, rng.randint(1, 4), 8)
+            cols = columns(busy)
+            # edges at midnight, on reservation boundaries and before / after everything
+            edges = [BASE + day * 1440 for day in range(-1, 6)]
+            edges += [start for intervals in busy.values() for start, _ in intervals[:2]]
+            edges += [end for intervals in busy.values() for _, end in intervals[:2]]
+            edges = np.array(sorted(set(edges)), dtype=np.int64)
+            expected = [[booked_before(busy[dev_id], int(t)) for t in edges] for dev_id in cols.device_ids]
+            with self.subTest(case=case):
+                self.assertEqual(_booked_before(cols, edges).tolist(), expected)
+
+    def test_peak_matches_brute_force(self):
+        rng = random.Random(19)
+        for case in range(40):
+            busy = random_busy(rng, rng.randint(1, 3), 6)
+            # back to back reservations: at the shared minute one ends before the other begins
+            first = next((intervals[0] for intervals in busy.values() if intervals), None)
+            if first is not None and case % 3 == 0:
+                busy.setdefault("9", []).append((first[1], first[1] + 60))
+            cols = columns(busy)
+            lo = BASE + rng.randrange(-600, 2 * 1440, 5)
+            hi = lo + rng.randrange(5, 1440, 5)
+            with self.subTest(case=case):
+                self.assertEqual(peak_occupancy(cols, lo, hi), peak(busy, lo, hi))
+
+    def test_empty(self):
+        empty = columns({"1": [], "2": []})
+        edges = np.array([BASE, BASE + 1440], dtype=np.int64)
+        self.assertEqual(_booked_before(empty, edges).tolist(), [[0, 0], [0, 0]])
+        self.assertEqual(peak_occupancy(empty, BASE, BASE + 1440), (0, None))
+        # reservations only outside the range, one ending right at lo and one starting right at hi
+        cols = columns({"1": [(BASE - 60, BASE), (BASE + 1440, BASE + 1500)]})
+        self.assertEqual(peak_occupancy(cols, BASE, BASE + 1440), (0, None))
+        self.assertEqual(np.diff(_booked_before(cols, edges), axis=1).tolist(), [[0]])
+
+
+class UtilizationReportTest(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        queries.add_user("u1", "User")
+        for name in ("Scope", "Laser", "Lamp"):
+            queries.add_device(name, "u1")
+        rng = random.Random(20)
+        self.busy = {"1": [], "2": [], "3": []}
+        rows = []
+        for _ in range(30):
+            dev_id = rng.choice(("1", "2"))
+            start = to_minutes(datetime(2026, 1, 1)) + rng.randrange(0, 20 * 1440, 30)
+            end = start + rng.randrange(30, 3000, 30)
+            self.busy[dev_id].append((start, end))
+            rows.append({"device_id": dev_id, "user_id": "u1", "start": from_minutes(start).isoformat(timespec="minutes"),
+                         "end": from_minutes(end).isoformat(timespec="minutes")})
+        queries.insert_reservations(rows)
+
+    def test_matches_brute_force(self):
+        for first, last, freq in ((date(2026, 1, 5), date(2026, 1, 18), "D"), (date(2026, 1, 7), date(2026, 1, 20), "W"),
+                                  (date(2026, 1, 9), date(2026, 1, 9), "D"), (date(2026, 3, 1), date(2026, 3, 10), "W")):
+            with self.subTest(first=first, last=last, freq=freq):
+                report = utilization_report(first, last, freq)
+                bounds = [max(b, first) for b in report["bins"]] + [last + timedelta(days=1)]
+                edges = [to_minutes(datetime.combine(b, datetime.min.time())) for b in bounds]
+                expected = [
+                    [(booked_before(self.busy[dev_id], hi) - booked_before(self.busy[dev_id], lo)) / 60 for lo, hi in zip(edges, edges[1:])]
+                    for dev_id in report["device_ids"]
+                ]
+                self.assertEqual(report["hours"].tolist(), expected)
+                self.assertEqual(report["bin_hours"].tolist(), [(hi - lo) / 60 for lo, hi in zip(edges, edges[1:])])
+                total = [sum(row) for row in expected]
+                self.assertEqual(report["idle_device_ids"], [dev_id for dev_id, hours in zip(report["device_ids"], total) if hours == 0])
+                peak_level, peak_at = peak(self.busy, edges[0], edges[-1])
+                self.assertEqual((report["peak"], report["peak_at"]), (peak_level, None if peak_at is None else from_minutes(peak_at)))
+
+
+if __name__ == "__main__":
+    unittest.main()
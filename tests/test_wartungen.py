@@ -0,0 +1,115 @@
+import contextlib
+import io
+import random
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import wartungen
+from support import DatabaseTestCase
+from wartungen import MaintenanceManager
+
+
+class FixedNow(datetime):
+    """datetime whose now() is the time a test sets."""
+    value = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.value
+
+
+def at(now: datetime):
+    FixedNow.value = now
+    return mock.patch.object(wartungen, "datetime", FixedNow)
+
+
+# the loops the closed forms replaced
+def old_next_date(m: MaintenanceManager, today: datetime):
+    if not m.first_maintenance or not m.maintenance_interval_days:
+        return None
+    next_date = m.first_maintenance
+    while next_date < today:
+        next_date += timedelta(days=m.maintenance_interval_days)
+    if m.end_of_life and next_date > m.end_of_life:
+        return None
+    return next_date
+
+
+def old_count(m: MaintenanceManager, start: datetime, end: datetime) -> int:
+    """The old quarter loop; dates after end_of_life are no longer charged (see count_maintenances_between)."""
+    if not m.first_maintenance or not m.maintenance_interval_days:
+        return 0
+    count = 0
+    d = m.first_maintenance
+    while d <= end:
+        if start <= d <= end and not (m.end_of_life and d > m.end_of_life):
+            count += 1
+        d += timedelta(days=m.maintenance_interval_days)
+    return count
+
+
+def random_maintenance(rng: random.Random, no: int) -> MaintenanceManager:
+    first = datetime(2025, 1, 1) + timedelta(days=rng.randrange(0, 600), hours=rng.choice((0, 9, 23)))
+    interval = rng.choice((None, 1, 7, 30, 45, 90, 91, 365))
+    end_of_life = rng.choice((None, first + timedelta(days=rng.randrange(-10, 500))))
+    return MaintenanceManager(str(no), str(no), first, interval, 10.0 + no, end_of_life)
+
+
+class ClosedFormTest(unittest.TestCase):
+    def test_next_date_matches_the_loop(self):
+        rng = random.Random(3)
+        for no in range(300):
+            m = random_maintenance(rng, no)
+            if m.maintenance_interval_days and rng.random() < 0.3:
+                # exactly on a maintenance date
+                today = m.first_maintenance + rng.randrange(0, 20) * timedelta(days=m.maintenance_interval_days)
+            else:
+                today = datetime(2025, 1, 1) + timedelta(minutes=rng.randrange(0, 900 * 1440))
+            with self.subTest(no=no), at(today):
+                self.assertEqual(MaintenanceManager.get_next_maintenance_date(m), old_next_date(m, today))
+
+    def test_count_matches_the_loop(self):
+        rng = random.Random(5)
+        for no in range(300):
+            m = random_maintenance(rng, no)
+            start = datetime(2025, 1, 1) + timedelta(minutes=rng.randrange(0, 900 * 1440))
+            if m.maintenance_interval_days and rng.random() < 0.3:
+                start = m.first_maintenance + rng.randrange(0, 10) * timedelta(days=m.maintenance_interval_days)
+            end = start + timedelta(days=rng.randrange(0, 200), seconds=rng.choice((0, -1, 59)))
+            if m.end_of_life and rng.random() < 0.2:
+                end = m.end_of_life
+            with self.subTest(no=no):
+                self.assertEqual(MaintenanceManager.count_maintenances_between(m, start, end), old_count(m, start, end))
+
+    def test_end_of_life_clamps(self):
+        m = MaintenanceManager("1", "1", datetime(2026, 1, 1), 10, 5.0, datetime(2026, 1, 21))
+        self.assertEqual(MaintenanceManager.count_maintenances_between(m, datetime(2026, 1, 1), datetime(2026, 3, 1)), 3)
+        with at(datetime(2026, 1, 21)):
+            self.assertEqual(MaintenanceManager.get_next_maintenance_date(m), datetime(2026, 1, 21))
+        with at(datetime(2026, 1, 21, 0, 0, 1)):
+            self.assertIsNone(MaintenanceManager.get_next_maintenance_date(m))
+
+
+class QuarterCostTest(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        rng = random.Random(11)
+        self.maintenances = [random_maintenance(rng, no) for no in range(40)]
+        # one on the first and one on the last second of a quarter
+        self.maintenances.append(MaintenanceManager("q1", "q1", datetime(2025, 10, 1), 91, 100.0))
+        self.maintenances.append(MaintenanceManager("q2", "q2", datetime(2025, 12, 31, 23, 59, 59), 90, 1000.0))
+        with contextlib.redirect_stdout(io.StringIO()):
+            for m in self.maintenances:
+                m.store_data()
+
+    def test_matches_the_loop_at_quarter_boundaries(self):
+        for now in (datetime(2025, 12, 31, 23, 59, 59), datetime(2026, 1, 1), datetime(2026, 3, 31, 12), datetime(2026, 4, 1)):
+            with self.subTest(now=now), at(now), contextlib.redirect_stdout(io.StringIO()):
+                q_start, q_end = MaintenanceManager.get_quarter_bounds(now)
+                expected = sum(old_count(m, q_start, q_end) * m.maintenance_cost for m in self.maintenances)
+                self.assertAlmostEqual(MaintenanceManager.calculate_cost_for_quarter(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,26 +1,26 @@
 from operator import add
 import streamlit as st
-from queries import find_devices, update_device, add_device, delete_device, get_users
+import diagnostics
+from queries import find_devices, update_device, add_device, delete_device, get_users, memoized
 
+# the first entry is preselected: nothing is deleted along unless chosen
+POLICY_BY_LABEL = {
+    "Nur löschen, wenn keine Reservierungen oder Wartungen bestehen": "restrict",
+    "Reservierungen und Wartungen mitlöschen": "cascade",
+    "Reservierungen und Wartungen auf anderes Gerät übertragen": "reassign",
+}
 
-def render():
-    # session state init for simple status buttons (optional UI state)
-    if "device_status" not in st.session_state:
-        st.session_state.device_status = {}
-    users = get_users()
-    user_options = {u["name"] + f' ({u["id"]})': u["id"] for u in users}
 
-    st.write("# Gerätemanagement")
-    st.write("## Geräteauswahl")
+@memoized
+def _user_options():
+    return {u["name"] + f' ({u["id"]})': u["id"] for u in get_users()}
 
-    devices = find_devices()  # List[dict]
-    if not devices:
-        st.error("Keine Geräte in der Datenbank vorhanden.")
-        st.stop()
 
+@memoized
+def _device_labels():
     # Build label -> id mapping (always store ID as string)
     id_by_label = {}
-    for d in devices:
+    for d in find_devices():
         if not isinstance(d, dict):
             continue
         did = d.get("id")
@@ -30,6 +30,25 @@ def render():
         dn = d.get("device_name") or f"(ohne Name)"
         label = f"{dn} (ID {did})"
         id_by_label[label] = did
+    return id_by_label
+
+
+@diagnostics.timed("ui_device.render")
+def render():
+    # session state init for simple status buttons (optional UI state)
+    if "device_status" not in st.session_state:
+        st.session_state.device_status = {}
+    user_options = _user_options()
+
+    st.write("# Gerätemanagement")
+    st.write("## Geräteauswahl")
+
+    devices = find_devices()  # List[dict]
+    if not devices:
+        st.error("Keine Geräte in der Datenbank vorhanden.")
+        st.stop()
+
+    id_by_label = _device_labels()
 
     labels = list(id_by_label.keys())
     if not labels:
@@ -76,16 +95,27 @@ def render():
         if submitted:
             update_device(
                 device_id=device_id,
-                managed_by_user_id=managed_val.strip(),
+                managed_by_user_id=managed_user_id,
                 is_active=active_val
             )
             st.success("Gespeichert.")
             st.rerun()
 
     st.write("## Gerät löschen")
-    
+
+    policy = POLICY_BY_LABEL[st.radio("Beim Löschen", list(POLICY_BY_LABEL.keys()), key="device_delete_policy")]
+    reassign_to = None
+    if policy == "reassign":
+        other_labels = [label for label, did in id_by_label.items() if did != device_id]
+        reassign_label = st.selectbox("Übertragen auf", other_labels, key="device_reassign_to")
+        reassign_to = id_by_label.get(reassign_label)
+
     if st.button("❌ Gerät endgültig löschen"):
-        delete_device(device_id)
+        try:
+            delete_device(device_id, policy, reassign_to)
+        except ValueError as e:
+            st.error(f"Gerät wurde nicht gelöscht: {e}.")
+            st.stop()
         st.warning("Gerät gelöscht.")
         st.rerun()
 
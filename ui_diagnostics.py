@@ -0,0 +1,60 @@
+import streamlit as st
+from datetime import datetime
+import diagnostics
+
+
+def _op_rows(ops: dict) -> list:
+    rows = []
+    for name, op in sorted(ops.items(), key=lambda item: item[1]["total_ms"], reverse=True):
+        rows.append(
+            {
+                "Funktion": name,
+                "Aufrufe": op["calls"],
+                "Gesamt (ms)": round(op["total_ms"], 2),
+                "Max (ms)": round(op["max_ms"], 2),
+                "Bytes gelesen": op["bytes_read"],
+                "Bytes geschrieben": op["bytes_written"],
+            }
+        )
+    return rows
+
+
+def _rerun_label(rerun: dict) -> str:
+    started = datetime.fromtimestamp(rerun["started"]).strftime("%H:%M:%S")
+    return f'#{rerun["rerun"]} {rerun["page"]} ({started})'
+
+
+@diagnostics.timed("ui_diagnostics.render")
+def render():
+    st.write("# Diagnostics")
+
+    diagnostics.ENABLED = st.checkbox(
+        "Messung aktiv", value=diagnostics.ENABLED,
+        help="Zeiten, Aufrufe und gelesene/geschriebene Bytes der Datenbank- und Seitenfunktionen je Rerun erfassen.",
+    )
+
+    reruns = diagnostics.history()
+    if not reruns:
+        st.info("Noch keine Messungen vorhanden. Messung aktivieren und andere Seiten aufrufen.")
+        return
+
+    st.write("## Einzelner Rerun")
+    # newest first; the rerun of this page is still running and not part of the history yet
+    labels = {_rerun_label(r): r for r in reversed(reruns)}
+    label = st.selectbox("Rerun auswählen", list(labels.keys()), key="diag_rerun")
+    st.table(_op_rows(labels[label]["ops"]))
+
+    st.write("## Summe aller Reruns")
+    st.caption(f"{len(reruns)} Reruns (maximal {diagnostics.HISTORY_SIZE} werden aufbewahrt).")
+    st.table(_op_rows(diagnostics.summary(reruns)))
+
+    col1, col2 = st.columns(2)
+    col1.download_button(
+        "Als JSON Lines exportieren",
+        data=diagnostics.export_jsonl(),
+        file_name="diagnostics.jsonl",
+        mime="application/jsonl",
+    )
+    if col2.button("Messwerte löschen"):
+        diagnostics.reset()
+        st.rerun()
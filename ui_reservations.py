@@ -1,23 +1,282 @@
 import streamlit as st
-from datetime import datetime, date, time
+import numpy as np
+import pandas as pd
+import diagnostics
+from datetime import datetime, date, time, timedelta
+from typing import List
 
-from queries import get_devices, get_users, insert_reservation, list_reservations
+from free_slots import WORK_DAY_END, WORK_DAY_START
+from queries import (
+    DB_BACKEND,
+    add_recurring_reservation,
+    delete_recurring_reservation,
+    find_conflicts,
+    find_free_slot,
+    get_devices,
+    get_recurring_reservations,
+    get_users,
+    insert_reservation,
+    iter_reservations,
+    memoized,
+    skip_recurring_occurrence,
+)
+from utilization import utilization_report
+
+# devices shown in the utilization heatmap (the busiest ones)
+HEATMAP_DEVICES = 30
 
 
 def _combine(d: date, t: time) -> datetime:
     return datetime(d.year, d.month, d.day, t.hour, t.minute, t.second)
 
 
-def _overlaps(a_start: datetime, a_end: datetime, b_start: datetime, b_end: datetime) -> bool:
-    return a_start < b_end and b_start < a_end
+@memoized
+def _label_maps():
+    # rebuilt only after the data changed, not on every rerun
+    devices = get_devices()
+    users = get_users()
+
+    device_name_by_id = {str(d["id"]): d.get("device_name", str(d["id"])) for d in devices if isinstance(d, dict) and d.get("id")}
+    user_name_by_id = {str(u["id"]): u.get("name", str(u["id"])) for u in users if isinstance(u, dict) and u.get("id")}
+
+    device_options = {f'{device_name_by_id[str(d["id"])]} (ID {d["id"]})': str(d["id"]) for d in devices if d.get("id")}
+    user_options = {f'{user_name_by_id[str(u["id"])]} ({u["id"]})': str(u["id"]) for u in users if u.get("id")}
+    return device_name_by_id, user_name_by_id, device_options, user_options
+
+
+def _reservation_rows(device_id, page: int, page_size: int):
+    """Table rows of one page (newest first) plus whether another page follows."""
+    device_name_by_id, user_name_by_id, _, _ = _label_maps()
+    page_res = list(iter_reservations(device_id=device_id, descending=True, limit=page_size + 1, offset=(page - 1) * page_size))
+    rows = []
+    for r in page_res[:page_size]:
+        did = str(r.get("device_id", ""))
+        uid = str(r.get("user_id", ""))
+        rows.append(
+            {
+                "Gerät": device_name_by_id.get(did, did),
+                "Benutzer": user_name_by_id.get(uid, uid),
+                "Von": r.get("start", ""),
+                "Bis": r.get("end", ""),
+                "Serie": r.get("recurring_id", ""),
+            }
+        )
+    return rows, len(page_res) > page_size
+
+
+def _take_slot(device_label: str, slot: dict) -> None:
+    # button callback: runs before the next rerun, so the form widgets can still be changed
+    st.session_state["res_device"] = device_label
+    st.session_state["res_date_from"] = slot["start"].date()
+    st.session_state["res_time_from"] = slot["start"].time()
+    st.session_state["res_date_to"] = slot["end"].date()
+    st.session_state["res_time_to"] = slot["end"].time()
+
+
+def _free_slot_search(device_options: dict, device_name_by_id: dict) -> None:
+    st.write("## Freien Termin suchen")
+
+    with st.form("free_slot_form"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            any_label = "Beliebiges aktives Gerät"
+            device_label = st.selectbox("Gerät", [any_label] + list(device_options.keys()), key="slot_device")
+            hours = st.number_input("Dauer (Stunden)", min_value=0.25, max_value=24.0, value=1.0, step=0.25, key="slot_hours")
+        with col2:
+            after_date = st.date_input("Frühestens am", value=date.today(), key="slot_date")
+            after_time = st.time_input("ab", value=time(8, 0), key="slot_time")
+        with col3:
+            work_start = st.time_input("Arbeitsbeginn", value=WORK_DAY_START, key="slot_work_start")
+            work_end = st.time_input("Arbeitsende", value=WORK_DAY_END, key="slot_work_end")
+        search = st.form_submit_button("Suchen")
+
+    if search:
+        if work_end <= work_start:
+            st.error("Fehler: Arbeitsende muss nach dem Arbeitsbeginn liegen.")
+            return
+        st.session_state["slot_result"] = find_free_slot(
+            timedelta(hours=hours),
+            max(_combine(after_date, after_time), datetime.now().replace(second=0, microsecond=0)),
+            device_id=device_options.get(device_label),
+            work_start=work_start,
+            work_end=work_end,
+        ) or {}
+
+    slot = st.session_state.get("slot_result")
+    if slot is None:
+        return
+    if not slot:
+        st.warning("Kein freier Termin gefunden: die Dauer passt nicht in die Arbeitszeit.")
+        return
+
+    dn = device_name_by_id.get(slot["device_id"], slot["device_id"])
+    label = next((l for l, did in device_options.items() if did == slot["device_id"]), None)
+    st.success(f"Frühester freier Termin: {dn}, {slot['start']:%d.%m.%Y %H:%M} – {slot['end']:%H:%M}")
+    if label is not None:
+        st.button("In Reservierung übernehmen", on_click=_take_slot, args=(label, slot), key="slot_take")
+
+
+def _parse_days(text: str) -> List[date]:
+    """Comma separated days (TT.MM.JJJJ); ValueError if one can't be read."""
+    return [datetime.strptime(part.strip(), "%d.%m.%Y").date() for part in text.split(",") if part.strip()]
+
+
+def _skip_occurrence() -> None:
+    # button callbacks: the change is saved before the page is drawn again
+    skip_recurring_occurrence(st.session_state["rec_manage_id"], st.session_state["rec_manage_day"])
+
+
+def _delete_series() -> None:
+    delete_recurring_reservation(st.session_state["rec_manage_id"])
+
+
+def _recurring_section(device_options: dict, user_options: dict, device_name_by_id: dict, user_name_by_id: dict) -> None:
+    st.write("## Serienreservierung")
+
+    with st.form("recurring_form"):
+        col1, col2 = st.columns(2)
+        with col1:
+            device_label = st.selectbox("Gerät auswählen", list(device_options.keys()), key="rec_device")
+            first_day = st.date_input("Erster Termin am", value=date.today(), key="rec_date")
+            freq_label = st.radio("Wiederholung", ["Wöchentlich", "Täglich"], horizontal=True, key="rec_freq")
+            until = st.date_input("Bis einschließlich", value=date.today() + timedelta(weeks=12), key="rec_until")
+        with col2:
+            user_label = st.selectbox("Benutzer auswählen", list(user_options.keys()), key="rec_user")
+            time_from = st.time_input("Uhrzeit von", value=time(9, 0), key="rec_time_from")
+            time_to = st.time_input("Uhrzeit bis", value=time(10, 0), key="rec_time_to")
+            interval = st.number_input("Alle ... Wochen / Tage", min_value=1, max_value=52, value=1, step=1, key="rec_interval")
+        exceptions = st.text_input("Ausnahmen (TT.MM.JJJJ, durch Komma getrennt)", key="rec_exceptions")
+        submit = st.form_submit_button("Serie reservieren")
+
+    if submit:
+        if time_to <= time_from:
+            st.error("Fehler: Endzeit muss nach der Startzeit liegen.")
+            return
+        try:
+            skipped = _parse_days(exceptions)
+        except ValueError:
+            st.error("Fehler: Ausnahmen bitte als TT.MM.JJJJ angeben.")
+            return
+        try:
+            add_recurring_reservation(
+                {
+                    "device_id": device_options[device_label],
+                    "user_id": user_options[user_label],
+                    "start": _combine(first_day, time_from).isoformat(timespec="minutes"),
+                    "end": _combine(first_day, time_to).isoformat(timespec="minutes"),
+                    "freq": "weekly" if freq_label == "Wöchentlich" else "daily",
+                    "interval": int(interval),
+                    "until": until,
+                    "exceptions": skipped,
+                },
+                check_conflicts=True,
+            )
+        except ValueError as e:
+            st.error(f"Fehler: {e}.")
+            return
+        st.session_state.pop("slot_result", None)
+        st.success("Serie erfolgreich gespeichert.")
+        st.rerun()
+
+    rules = get_recurring_reservations()
+    if not rules:
+        return
+    with st.expander(f"Bestehende Serien ({len(rules)})"):
+        st.table(
+            [
+                {
+                    "Serie": r["id"],
+                    "Gerät": device_name_by_id.get(r["device_id"], r["device_id"]),
+                    "Benutzer": user_name_by_id.get(r["user_id"], r["user_id"]),
+                    "Erster Termin": r["start"].replace("T", " "),
+                    "Bis": r["end"][11:],
+                    "Wiederholung": f'alle {r.get("interval", 1)} ' + ("Wochen" if r["freq"] == "weekly" else "Tage" if r["freq"] == "daily" else "Minuten"),
+                    "Ende": r.get("until") or f'{r.get("count")} Termine',
+                    "Ausnahmen": ", ".join(r.get("exceptions") or ()),
+                }
+                for r in rules
+            ]
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            st.selectbox("Serie", [r["id"] for r in rules], key="rec_manage_id")
+        with col2:
+            st.date_input("Termin am", value=date.today(), key="rec_manage_day")
+        col1, col2 = st.columns(2)
+        col1.button("Termin absagen", on_click=_skip_occurrence, key="rec_skip")
+        col2.button("Serie löschen", on_click=_delete_series, key="rec_delete")
+
+
+def _utilization_section(device_name_by_id: dict) -> None:
+    st.write("## Auslastung")
 
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        first = st.date_input("Von", value=date.today() - timedelta(days=27), key="util_from")
+    with col2:
+        last = st.date_input("Bis", value=date.today(), key="util_to")
+    with col3:
+        freq_label = st.radio("Auflösung", ["Tag", "Woche"], horizontal=True, key="util_freq")
 
+    if last < first:
+        st.error("Fehler: Enddatum muss nach dem Startdatum liegen.")
+        return
+
+    report = utilization_report(first, last, "D" if freq_label == "Tag" else "W")
+    total_hours = report["total_hours"]
+    if not len(total_hours):
+        st.info("Keine Geräte vorhanden.")
+        return
+
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Gebuchte Stunden", f"{total_hours.sum():,.0f}".replace(",", "."))
+    m2.metric("Ø Auslastung", f"{report['utilization'].mean():.1%}")
+    m3.metric(
+        "Spitzenbelegung",
+        f"{report['peak']} / {len(total_hours)} Geräte",
+        help=None if report["peak_at"] is None else f"Erstmals erreicht am {report['peak_at']:%d.%m.%Y %H:%M}",
+    )
+    m4.metric("Ungenutzte Geräte", len(report["idle_device_ids"]))
+
+    # imported here: altair alone takes longer to import than the rest of the page
+    import altair as alt
+
+    # the busiest devices, long format for altair
+    top = np.argsort(-total_hours, kind="stable")[:HEATMAP_DEVICES]
+    labels = [f'{device_name_by_id.get(report["device_ids"][i], report["device_ids"][i])} (ID {report["device_ids"][i]})' for i in top]
+    bins = [b.isoformat() for b in report["bins"]]
+    data = pd.DataFrame(
+        {
+            "Gerät": np.repeat(labels, len(bins)),
+            "Zeitraum": np.tile(bins, len(labels)),
+            "Stunden": report["hours"][top].ravel().round(1),
+        }
+    )
+    chart = (
+        alt.Chart(data)
+        .mark_rect()
+        .encode(
+            x=alt.X("Zeitraum:O", title="Tag" if freq_label == "Tag" else "Woche ab"),
+            y=alt.Y("Gerät:N", sort=labels),
+            color=alt.Color("Stunden:Q", title="Gebuchte Stunden"),
+            tooltip=["Gerät", "Zeitraum", "Stunden"],
+        )
+    )
+    st.altair_chart(chart, use_container_width=True)
+    if len(total_hours) > HEATMAP_DEVICES:
+        st.caption(f"Die {HEATMAP_DEVICES} am stärksten gebuchten von {len(total_hours)} Geräten.")
+
+    if report["idle_device_ids"]:
+        with st.expander(f'Ungenutzte aktive Geräte ({len(report["idle_device_ids"])})'):
+            st.write(", ".join(device_name_by_id.get(d, d) for d in report["idle_device_ids"]))
+
+
+@diagnostics.timed("ui_reservations.render")
 def render():
     st.write("# Reservierungssystem")
 
     devices = get_devices()
     users = get_users()
-    reservations = list_reservations()
 
     if not devices:
         st.error("Keine Geräte in der Datenbank vorhanden.")
@@ -26,13 +285,9 @@ def render():
         st.error("Keine Benutzer in der Datenbank vorhanden.")
         st.stop()
 
-    
-    device_name_by_id = {str(d["id"]): d.get("device_name", str(d["id"])) for d in devices if isinstance(d, dict) and d.get("id")}
-    user_name_by_id = {str(u["id"]): u.get("name", str(u["id"])) for u in users if isinstance(u, dict) and u.get("id")}
+    device_name_by_id, user_name_by_id, device_options, user_options = _label_maps()
 
-   
-    device_options = {f'{device_name_by_id[str(d["id"])]} (ID {d["id"]})': str(d["id"]) for d in devices if d.get("id")}
-    user_options = {f'{user_name_by_id[str(u["id"])]} ({u["id"]})': str(u["id"]) for u in users if u.get("id")}
+    _free_slot_search(device_options, device_name_by_id)
 
     st.write("## Neue Reservierung")
 
@@ -61,54 +316,58 @@ def render():
             st.error("Fehler: Endzeit muss nach der Startzeit liegen.")
             st.stop()
 
-        
-        for r in reservations:
-            if not isinstance(r, dict):
-                continue
-            if str(r.get("device_id", "")) != str(device_id):
-                continue
-            try:
-                existing_start = datetime.fromisoformat(r.get("start"))
-                existing_end = datetime.fromisoformat(r.get("end"))
-            except Exception:
-                continue
-
-            if _overlaps(start_dt, end_dt, existing_start, existing_end):
-                dn = device_name_by_id.get(str(device_id), str(device_id))
-                st.error(f"Das Gerät '{dn}' ist bereits reserviert ({existing_start} – {existing_end}).")
-                st.stop()
-
-        insert_reservation(
-            {
-                "device_id": str(device_id),
-                "user_id": str(user_id),
-                "start": start_dt.isoformat(timespec="minutes"),
-                "end": end_dt.isoformat(timespec="minutes"),
-            }
-        )
+        conflicts = find_conflicts(device_id, start_dt, end_dt)
+        if conflicts:
+            dn = device_name_by_id.get(str(device_id), str(device_id))
+            existing_start = conflicts[0]["start"].replace("T", " ")
+            existing_end = conflicts[0]["end"].replace("T", " ")
+            st.error(f"Das Gerät '{dn}' ist bereits reserviert ({existing_start} – {existing_end}).")
+            st.stop()
+
+        try:
+            insert_reservation(
+                {
+                    "device_id": str(device_id),
+                    "user_id": str(user_id),
+                    "start": start_dt.isoformat(timespec="minutes"),
+                    "end": end_dt.isoformat(timespec="minutes"),
+                },
+                check_conflicts=True,
+            )
+        except ValueError:
+            # booked by another session between the check above and the write
+            dn = device_name_by_id.get(str(device_id), str(device_id))
+            st.error(f"Das Gerät '{dn}' wurde soeben für diesen Zeitraum reserviert.")
+            st.stop()
+        # a proposed free slot may just have been booked
+        st.session_state.pop("slot_result", None)
         st.success("Reservierung erfolgreich gespeichert.")
         st.rerun()
 
+    if DB_BACKEND == "json":
+        # the SQLite backend has no recurring reservations
+        _recurring_section(device_options, user_options, device_name_by_id, user_name_by_id)
+
+    _utilization_section(device_name_by_id)
+
     st.write("## Bestehende Reservierungen")
 
-    reservations = list_reservations()
-    if not reservations:
-        st.info("Es sind noch keine Reservierungen vorhanden.")
-        return
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        filter_label = st.selectbox("Gerät filtern", ["Alle Geräte"] + list(device_options.keys()), key="res_filter_device")
+    with col2:
+        page_size = st.selectbox("Einträge pro Seite", [10, 25, 50, 100], key="res_page_size")
+    with col3:
+        page = st.number_input("Seite", min_value=1, value=1, step=1, key="res_page")
 
-    rows = []
-    for r in reservations:
-        if not isinstance(r, dict):
-            continue
-        did = str(r.get("device_id", ""))
-        uid = str(r.get("user_id", ""))
-        rows.append(
-            {
-                "Gerät": device_name_by_id.get(did, did),
-                "Benutzer": user_name_by_id.get(uid, uid),
-                "Von": r.get("start", ""),
-                "Bis": r.get("end", ""),
-            }
-        )
+    rows, has_next = _reservation_rows(device_options.get(filter_label), int(page), page_size)
+    if not rows:
+        if page == 1:
+            st.info("Es sind noch keine Reservierungen vorhanden.")
+        else:
+            st.info("Auf dieser Seite gibt es keine Reservierungen mehr.")
+        return
 
     st.table(rows)
+    if has_next:
+        st.caption(f"Seite {page} – weitere Reservierungen auf Seite {page + 1}.")
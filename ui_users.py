@@ -1,7 +1,16 @@
 import streamlit as st
+import diagnostics
 from queries import get_users, add_user, delete_user
 
+# the first entry is preselected: nothing is deleted along unless chosen
+POLICY_BY_LABEL = {
+    "Nur löschen, wenn nichts mehr zugeordnet ist": "restrict",
+    "Reservierungen und verwaltete Geräte mitlöschen": "cascade",
+    "Geräte und Reservierungen an anderen Nutzer übertragen": "reassign",
+}
 
+
+@diagnostics.timed("ui_users.render")
 def render():
     st.write("# Nutzerverwaltung")
 
@@ -24,9 +33,19 @@ def render():
             st.rerun()
 
     st.write("## Bestehende Nutzer")
+    policy = POLICY_BY_LABEL[st.radio("Beim Löschen", list(POLICY_BY_LABEL.keys()), key="user_delete_policy")]
+    user_labels = {f'{u["name"]} ({u["id"]})': u["id"] for u in users}
+    reassign_to = None
+    if policy == "reassign":
+        reassign_to = user_labels.get(st.selectbox("Übertragen an", list(user_labels.keys()), key="user_reassign_to"))
+
     for u in users:
         col1, col2 = st.columns([3, 1])
         col1.write(f'{u["name"]} ({u["id"]})')
         if col2.button("❌ Löschen", key=f'del_{u["id"]}'):
-            delete_user(u["id"])
+            try:
+                delete_user(u["id"], policy, reassign_to)
+            except ValueError as e:
+                st.error(f"{u['name']} wurde nicht gelöscht: {e}.")
+                st.stop()
             st.rerun()
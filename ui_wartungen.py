@@ -1,12 +1,14 @@
 import streamlit as st
+import diagnostics
 from datetime import date, datetime
 from queries import find_devices
 from wartungen import MaintenanceManager
 
-st.title("🛠 Wartungsmanagement")
-
 
+@diagnostics.timed("ui_wartungen.render")
 def render():
+    st.title("🛠 Wartungsmanagement")
+
     devices = find_devices()  # List[dict]
 
     if not devices:
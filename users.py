@@ -1,10 +1,9 @@
-import os
-from tinydb import TinyDB, Query
-from serializer import serializer
+from tinydb import Query
+from database_inheritance import LazyTable
 
 class User:
 
-    db_connector = TinyDB(os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.json"), storage=serializer).table("users")
+    db_connector = LazyTable("users")
 
     def __init__(self, id, name) -> None:
         """Create a new user based on the given name and id"""
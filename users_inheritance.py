@@ -2,11 +2,13 @@ from typing import Self
 from datetime import datetime
 
 from serializable import Serializable
-from database_inheritance import DatabaseConnector
+from database_inheritance import LazyTable
 
 class User(Serializable):
+    __slots__ = ("name",)
 
-    db_connector =  DatabaseConnector().get_table("users")
+    db_connector = LazyTable("users")
+    indexed_attributes = ("id",)
 
     def __init__(self, id : str , name : str, creation_date: datetime = None, last_update: datetime = None) -> None:
         super().__init__(id, creation_date, last_update)
@@ -0,0 +1,143 @@
+"""
+Device utilization reports (booked hours per device and day/week, peak occupancy, idle devices).
+They are computed on a columnar view of the reservations - NumPy arrays of device index, start
+and end in epoch minutes - that is built once per database version. Booked time per bin comes
+from prefix sums and binary search over those arrays, there are no loops over reservations.
+"""
+from datetime import date, datetime, time, timedelta
+from itertools import chain
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from epoch_minutes import from_minutes, to_minutes
+from queries import get_devices, memoized, reservation_intervals
+
+
+class ReservationColumns:
+    """All reservations of known devices as parallel arrays, sorted by (device, start)."""
+
+    __slots__ = ("device_ids", "active", "device", "start", "end")
+
+    def __init__(self, device_ids: List[str], active: np.ndarray, device: np.ndarray, start: np.ndarray, end: np.ndarray) -> None:
+        self.device_ids = device_ids
+        # per device (same order as device_ids)
+        self.active = active
+        # per reservation
+        self.device = device
+        self.start = start
+        self.end = end
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+
+@memoized
+def reservation_columns() -> ReservationColumns:
+    devices = get_devices()
+    device_ids = [d["id"] for d in devices]
+    position = {dev_id: i for i, dev_id in enumerate(device_ids)}
+
+    # reservations of devices that no longer exist are left out
+    parts = sorted(
+        (position[dev_id], starts, ends) for dev_id, (starts, ends) in reservation_intervals().items() if dev_id in position
+    )
+    counts = np.array([len(starts) for _, starts, _ in parts], dtype=np.int64)
+    total = int(counts.sum())
+    return ReservationColumns(
+        device_ids,
+        np.array([d["is_active"] for d in devices], dtype=bool),
+        np.repeat(np.array([i for i, _, _ in parts], dtype=np.int64), counts),
+        np.fromiter(chain.from_iterable(starts for _, starts, _ in parts), dtype=np.int64, count=total),
+        np.fromiter(chain.from_iterable(ends for _, _, ends in parts), dtype=np.int64, count=total),
+    )
+
+
+def _booked_before(cols: ReservationColumns, edges: np.ndarray) -> np.ndarray:
+    """
+    F[d, j] = minutes of device d booked before edges[j]. With prefix sums over the sorted starts
+    and ends of each device: F(t) = sum over starts < t of (t - start) - sum over ends < t of (t - end).
+    """
+    n_devices = len(cols.device_ids)
+    if not len(cols):
+        return np.zeros((n_devices, len(edges)), dtype=np.int64)
+
+    # one sorted key space for all devices: device * span + (time - origin)
+    origin = min(int(cols.start.min()), int(edges.min()))
+    span = max(int(cols.end.max()), int(edges.max())) - origin + 1
+    base = np.arange(n_devices, dtype=np.int64) * span
+    probes = base[:, None] + (edges - origin)[None, :]
+
+    def side(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # keys sorted; the time part of a key is key % span
+        cumsum = np.concatenate(([0], np.cumsum(keys % span)))
+        first = np.searchsorted(keys, base)[:, None]
+        below = np.searchsorted(keys, probes)
+        return below - first, cumsum[below] - cumsum[first]
+
+    device_base = cols.device * span
+    # starts are sorted per device already, ends only if no reservations of a device overlap
+    n_starts, sum_starts = side(device_base + (cols.start - origin))
+    n_ends, sum_ends = side(np.sort(device_base + (cols.end - origin)))
+
+    t = (edges - origin)[None, :]
+    return (t * n_starts - sum_starts) - (t * n_ends - sum_ends)
+
+
+def peak_occupancy(cols: ReservationColumns, lo: int, hi: int) -> Tuple[int, Optional[int]]:
+    """Largest number of reservations running at the same time within [lo, hi) and when it was first reached."""
+    mask = (cols.start < hi) & (cols.end > lo)
+    if not mask.any():
+        return 0, None
+    starts = np.maximum(cols.start[mask], lo)
+    ends = np.minimum(cols.end[mask], hi)
+    # events as 2 * time + kind, kind 0 = end and 1 = start: at the same minute
+    # reservations end before others begin (half-open intervals)
+    events = np.sort(np.concatenate((2 * ends, 2 * starts + 1)))
+    level = np.cumsum(2 * (events & 1) - 1)
+    i = int(np.argmax(level))
+    return int(level[i]), int(events[i] // 2)
+
+
+def _bin_starts(first: date, last: date, freq: str) -> List[date]:
+    if freq == "D":
+        return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    if freq == "W":
+        monday = first - timedelta(days=first.weekday())
+        return [monday + timedelta(weeks=i) for i in range((last - monday).days // 7 + 1)]
+    raise ValueError(f"Unbekannte Auflösung {freq!r} (erwartet 'D' oder 'W')")
+
+
+@memoized
+def utilization_report(first: date, last: date, freq: str = "D") -> dict:
+    """
+    Utilization of every device between the days first and last (both included),
+    binned per day ("D") or per week starting on Monday ("W"; the outer weeks are cut to the range).
+    The result is shared between callers and must not be modified.
+    """
+    if last < first:
+        raise ValueError("Enddatum muss nach dem Startdatum liegen")
+    cols = reservation_columns()
+
+    bins = _bin_starts(first, last, freq)
+    lo = to_minutes(datetime.combine(first, time()))
+    hi = to_minutes(datetime.combine(last + timedelta(days=1), time()))
+    edges = np.array([lo] + [to_minutes(datetime.combine(b, time())) for b in bins[1:]] + [hi], dtype=np.int64)
+
+    booked = np.diff(_booked_before(cols, edges), axis=1) / 60
+    total_hours = booked.sum(axis=1)
+    range_hours = (hi - lo) / 60
+    peak, peak_at = peak_occupancy(cols, lo, hi)
+
+    return {
+        "device_ids": cols.device_ids,
+        "bins": bins,
+        # booked hours, devices x bins
+        "hours": booked,
+        "bin_hours": np.diff(edges) / 60,
+        "total_hours": total_hours,
+        "utilization": total_hours / range_hours,
+        "peak": peak,
+        "peak_at": None if peak_at is None else from_minutes(peak_at),
+        "idle_device_ids": [cols.device_ids[i] for i in np.flatnonzero(cols.active & (total_hours == 0))],
+    }
@@ -2,7 +2,7 @@ from datetime import datetime, timedelta
 from typing import Self
 
 from serializable import Serializable
-from database_inheritance import DatabaseConnector
+from database_inheritance import LazyTable
 from devices import Device
 
 
@@ -10,8 +10,10 @@ class MaintenanceManager(Serializable):
     """
     Represents maintenance data for ONE device
     """
+    __slots__ = ("device_id", "first_maintenance", "maintenance_interval_days", "maintenance_cost", "end_of_life")
 
-    db_connector = DatabaseConnector().get_table("maintenances")
+    db_connector = LazyTable("maintenances")
+    indexed_attributes = ("id", "device_id")
 
     def __init__(
         self,
@@ -57,14 +59,36 @@ class MaintenanceManager(Serializable):
 
         today = datetime.now()
         next_date = maintenance.first_maintenance
+        step = timedelta(days=maintenance.maintenance_interval_days)
 
-        while next_date < today:
-            next_date += timedelta(days=maintenance.maintenance_interval_days)
+        if next_date < today:
+            # jump straight to the first occurrence >= today (ceil division of timedeltas)
+            next_date += -((next_date - today) // step) * step
 
         if maintenance.end_of_life and next_date > maintenance.end_of_life:
             return None
 
         return next_date
+
+    @staticmethod
+    def count_maintenances_between(maintenance: "MaintenanceManager", start: datetime, end: datetime) -> int:
+        """Number of maintenance dates of `maintenance` within [start, end], clamped to end_of_life"""
+        if not maintenance.first_maintenance or not maintenance.maintenance_interval_days:
+            return 0
+
+        first = maintenance.first_maintenance
+        step = timedelta(days=maintenance.maintenance_interval_days)
+        if maintenance.end_of_life and maintenance.end_of_life < end:
+            end = maintenance.end_of_life
+        if first > start:
+            start = first
+        if end < start:
+            return 0
+
+        # occurrences are first + k * step, k from ceil((start - first) / step) to floor((end - first) / step)
+        k_min = -((first - start) // step)
+        k_max = (end - first) // step
+        return max(0, k_max - k_min + 1)
  
     @staticmethod
     def get_quarter_bounds(date: datetime):
@@ -85,13 +109,6 @@ class MaintenanceManager(Serializable):
 
         total = 0.0
         for m in MaintenanceManager.find_all():
-            if not m.first_maintenance or not m.maintenance_interval_days:
-                continue
-
-            d = m.first_maintenance
-            while d <= q_end:
-                if q_start <= d <= q_end:
-                    total += m.maintenance_cost
-                d += timedelta(days=m.maintenance_interval_days)
+            total += MaintenanceManager.count_maintenances_between(m, q_start, q_end) * m.maintenance_cost
 
         return total